@@ -0,0 +1,132 @@
+import streamlit as st
+import pandas as pd
+from utils.metrics import recent_observations, prometheus_text, RECENT_SECONDS, METRICS_FILE
+from utils.storage import transfer_summary
+from utils.profiling import arm, armed_pages, profiles
+from utils.mongo_monitor import recent_commands, recent_reruns, repeated_queries, unindexed_queries, N_PLUS_ONE_MIN
+
+###################################
+#Admin: Performance
+#Which parts of the page reruns are slow on this server process: the stage timings
+#collected by utils/metrics.py (MongoDB calls, parsing, plots, PDF builds, S3 transfers)
+#over the last hour, slowest first, plus the Prometheus text of all histograms.
+#MongoDB round trips per rerun, N+1 patterns and unindexed scans (utils/mongo_monitor.py).
+#Also arms / lists rerun profiles (utils/profiling.py).
+###################################
+
+st.title("⏱️ Performance")
+st.caption(f"Stage timings of this server process over the last {RECENT_SECONDS // 60} minutes, all sessions.")
+
+recent = pd.DataFrame(recent_observations(), columns=["time", "page", "stage", "seconds"])
+
+if recent.empty:
+    st.info("Nothing timed yet. Open a report or upload a test and come back.")
+else:
+    pages = ["All pages"] + sorted(recent["page"].unique())
+    page = st.selectbox("Page", pages)
+    if page != "All pages":
+        recent = recent[recent["page"] == page]
+
+    # ===============================
+    # Slowest stages
+    # ===============================
+    stats = recent.groupby(["page", "stage"])["seconds"].agg(
+        runs="count",
+        p50_ms=lambda s: s.quantile(0.5) * 1000,
+        p95_ms=lambda s: s.quantile(0.95) * 1000,
+        max_ms=lambda s: s.max() * 1000,
+        total_s="sum",
+    ).reset_index().sort_values("p95_ms", ascending=False)
+
+    st.subheader("🐢 Slowest Stages")
+    st.dataframe(stats.round(1), use_container_width=True, hide_index=True)
+
+    st.subheader("Where the Time Goes")
+    st.bar_chart(stats.groupby("stage")["total_s"].sum().sort_values(ascending=False), horizontal=True)
+
+# ===============================
+# S3 transfers
+# ===============================
+transfers = transfer_summary()
+if transfers:
+    st.subheader("☁️ S3 Transfers")
+    st.dataframe(pd.DataFrame(transfers).T.round(2), use_container_width=True)
+
+# ===============================
+# MongoDB commands
+# ===============================
+commands = pd.DataFrame(recent_commands(RECENT_SECONDS))
+if not commands.empty:
+    st.subheader("🍃 MongoDB Commands")
+    reruns = pd.DataFrame(recent_reruns(RECENT_SECONDS))
+    if not reruns.empty:
+        st.caption("Round trips per page rerun")
+        st.dataframe(reruns.groupby("page").agg(
+            reruns=("rerun", "count"),
+            avg_commands=("commands", "mean"),
+            max_commands=("commands", "max"),
+            avg_db_ms=("seconds", lambda s: s.mean() * 1000),
+            avg_kb=("bytes", lambda s: s.mean() / 1024),
+        ).reset_index().sort_values("avg_commands", ascending=False).round(1),
+            use_container_width=True, hide_index=True)
+
+    st.caption("By command and query shape")
+    st.dataframe(commands.groupby(["page", "command", "collection", "shape"]).agg(
+        calls=("seconds", "count"),
+        p95_ms=("seconds", lambda s: s.quantile(0.95) * 1000),
+        avg_docs=("docs", "mean"),
+        total_kb=("bytes", lambda s: s.sum() / 1024),
+    ).reset_index().sort_values("calls", ascending=False).round(1),
+        use_container_width=True, hide_index=True)
+
+repeats = repeated_queries()
+if repeats:
+    st.warning(f"🔁 Same query repeated {N_PLUS_ONE_MIN}+ times in one rerun (N+1): fetch these with one `$in` query.")
+    st.dataframe(pd.DataFrame(repeats).groupby(["page", "command", "collection", "shape"]).agg(
+        reruns=("rerun", "count"), max_calls=("calls", "max"),
+    ).reset_index(), use_container_width=True, hide_index=True)
+
+collscans = unindexed_queries()
+if collscans:
+    st.warning("🐌 Queries scanning a whole collection (COLLSCAN in their explain): consider an index.")
+    st.dataframe(pd.DataFrame(collscans)[["page", "command", "collection", "shape"]],
+                 use_container_width=True, hide_index=True)
+
+# ===============================
+# Rerun profiles
+# ===============================
+st.subheader("🔬 Rerun Profiles")
+st.caption("Profiles the next full rerun of a page (any session), or add `?profile=1` to a page's URL.")
+
+col1, col2 = st.columns([3, 1])
+with col1:
+    profile_page = st.selectbox("Page to profile", ["Create Report", "View Report", "Batch Reports", "Data Uploader"])
+with col2:
+    st.write("")
+    if st.button("🎯 Profile next rerun"):
+        arm(profile_page)
+armed = armed_pages()
+if armed:
+    st.info("Waiting for: " + ", ".join(f"{page} ({runs})" for page, runs in armed.items()))
+
+for profile in profiles():
+    label = (f"#{profile['id']} {profile['page']} – {profile['seconds']:.2f} s – "
+             f"{pd.to_datetime(profile['time'], unit='s'):%m/%d %H:%M:%S} UTC")
+    if profile["test_id"]:
+        label += f" – test {profile['test_id']} ({profile['rows']} rows)"
+    with st.expander(label):
+        st.code(profile["summary"], language=None)
+        col1, col2 = st.columns(2)
+        col1.download_button("📥 cProfile (.prof)", profile["prof"], file_name=f"rerun_{profile['id']}.prof",
+                             key=f"prof_{profile['id']}")
+        col2.download_button("📥 Collapsed stacks", profile["collapsed"], file_name=f"rerun_{profile['id']}.folded",
+                             key=f"folded_{profile['id']}")
+
+# ===============================
+# Export
+# ===============================
+st.markdown("---")
+st.download_button("📥 Download Prometheus Metrics", prometheus_text(), file_name="hpl_metrics.prom",
+                   mime="text/plain")
+if METRICS_FILE:
+    st.caption(f"Also written to `{METRICS_FILE}` every few seconds.")
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+###################################
+#Plot Downsampling
+#Breath-by-breath exports can have thousands of rows, far more than a 6 inch plot can show.
+#At ingest each plotted channel is reduced to at most PLOT_POINTS (x, y) points with
+#Largest-Triangle-Three-Buckets (LTTB): one point per bucket, the one spanning the largest
+#triangle with its neighbours, so peaks, dips and the overall shape survive.
+#The reduced series are stored next to "Tabular Data" as "Plot Data":
+#    {"Points": 300, "Series": {"VO2 STPD": {"Time": [...], "VO2 STPD": [...]}, ...}}
+#in the export's units (like the tabular data). Plots draw from them; fits, averages and
+#the other analyses keep using the full-resolution table.
+###################################
+
+# Points kept per plotted channel (~1 marker per 1.5 pt across a report plot)
+PLOT_POINTS = 300
+
+# Plotted channels per test type: y column -> x column
+PLOT_SERIES = {
+    "VO2 Max": {
+        "VCO2 STPD": "VO2 STPD",  # V-Slope
+        "VO2 STPD": "Time",
+        "HR": "Time",
+        "FATmin": "Time",
+        "CHOmin": "Time",
+        "VE/VO2": "Time",
+        "VE/VCO2": "Time",
+        "PetCO2": "Time",
+        "PetO2": "Time",
+        "RER": "Time",
+    },
+    "RMR": {
+        "REE": "Time",
+    },
+}
+
+
+def lttb(x, y, points):
+    """Indices of the `points` samples LTTB keeps from (x, y), x sorted ascending."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (points - 2)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Average of the next bucket (the last point for the last bucket)
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        # Point of this bucket spanning the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample_series(x, y, points=PLOT_POINTS):
+    """(x, y) without NaNs, sorted by x and reduced to at most `points` points."""
+    x = pd.to_numeric(pd.Series(x), errors="coerce").to_numpy(dtype=np.float64)
+    y = pd.to_numeric(pd.Series(y), errors="coerce").to_numpy(dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+
+    order = np.argsort(x, kind="stable")
+    x, y = x[order], y[order]
+    keep = lttb(x, y, points)
+    return x[keep], y[keep]
+
+
+def plot_data(table, test_type, points=PLOT_POINTS):
+    """"Plot Data" section for a test table (export or frame): every plotted channel it has, downsampled."""
+    series = {}
+    for y_col, x_col in PLOT_SERIES.get(test_type, {}).items():
+        if x_col not in table.columns or y_col not in table.columns:
+            continue
+        x, y = downsample_series(table[x_col], table[y_col], points)
+        series[y_col] = {x_col: x.tolist(), y_col: y.tolist()}
+    return {"Points": points, "Series": series}
@@ -0,0 +1,132 @@
+import numpy as np
+import streamlit as st
+
+from utils.metrics import timed
+from utils.test_frames import load_test_frame, document_version, MAX_CACHED_FRAMES
+
+###################################
+#Plot Fits
+#The trendlines and thresholds the report plots draw, computed once per test (id/version)
+#and shared by the builder (matplotlib and browser charts) and the PDF:
+#- "trend": cubic trend over Time of every TREND_COLUMNS column, all solved in one
+#  least-squares solve over a shared Vandermonde matrix of Time
+#- "vslope": V-Slope lines below/above the VO2 midpoint and their intersection (threshold)
+#- "ree_trend": linear REE (kcal/day) trend after the first 10 rows (RMR)
+#Fits always use the full-resolution frame, never the downsampled plot series.
+#Results are read-only numpy arrays, like the frames they come from.
+###################################
+
+TREND_DEGREE = 3
+TREND_POINTS = 100
+
+# Columns with a trendline over Time, per test type
+TREND_COLUMNS = {
+    "VO2 Max": ["VO2 STPD", "FATmin", "PetCO2", "PetO2"],
+    "RMR": [],
+}
+
+# V-Slope line ranges: the pre-threshold line stops this far below the top VO2,
+# the post-threshold line starts this far above the lowest (mL/min)
+VSLOPE_PRE_MARGIN = 700
+VSLOPE_POST_MARGIN = 1100
+VSLOPE_POINTS = 50
+
+# RMR: rows skipped before the REE (kcal/day) trend
+REE_TREND_SKIP = 10
+
+
+def _frozen(values):
+    values = np.asarray(values, dtype=np.float64)
+    values.flags.writeable = False
+    return values
+
+
+def polyfit_columns(x, columns, degree):
+    """np.polyfit of every {name: y} over the same x, batched: one lstsq per NaN pattern (usually one)."""
+    x = np.asarray(x, dtype=np.float64)
+    ys = {name: np.asarray(y, dtype=np.float64) for name, y in columns.items()}
+
+    # Columns with the same finite rows share a Vandermonde matrix and a solve
+    groups = {}
+    for name, y in ys.items():
+        mask = np.isfinite(x) & np.isfinite(y)
+        groups.setdefault(mask.tobytes(), (mask, []))[1].append(name)
+
+    coefficients = {}
+    for mask, names in groups.values():
+        if mask.sum() <= degree:
+            coefficients.update({name: np.full(degree + 1, np.nan) for name in names})
+            continue
+        vander = np.vander(x[mask], degree + 1)
+        # Column scaling as in np.polyfit, for a well-conditioned solve
+        scale = np.sqrt((vander * vander).sum(axis=0))
+        rhs = np.column_stack([ys[name][mask] for name in names])
+        solution = np.linalg.lstsq(vander / scale, rhs, rcond=mask.sum() * np.finfo(np.float64).eps)[0]
+        solution = (solution.T / scale).T
+        coefficients.update({name: solution[:, i] for i, name in enumerate(names)})
+    return coefficients
+
+
+def _trends(df, columns):
+    """{column: (x, y)} cubic trends over Time, TREND_POINTS points each."""
+    columns = [col for col in columns if col in df.columns]
+    if not columns:
+        return {}
+    time = df["Time"].to_numpy(dtype=np.float64)
+    x_trend = _frozen(np.linspace(np.nanmin(time), np.nanmax(time), TREND_POINTS))
+    coefficients = polyfit_columns(time, {col: df[col].to_numpy() for col in columns}, TREND_DEGREE)
+    return {col: (x_trend, _frozen(np.polyval(coefficients[col], x_trend))) for col in columns}
+
+
+def vslope_fit(df):
+    """((x, y) pre-threshold, (x, y) post-threshold, threshold VO2) of the V-Slope plot."""
+    vo2 = df["VO2 STPD"].to_numpy(dtype=np.float64)
+    vco2 = df["VCO2 STPD"].to_numpy(dtype=np.float64)
+    order = np.argsort(vo2, kind="stable")
+    vo2, vco2 = vo2[order], vco2[order]
+    mid_point = len(vo2) // 2
+
+    # Fit trendlines before and after midpoint
+    a, b = polyfit_columns(vo2[:mid_point], {"pre": vco2[:mid_point]}, 1)["pre"]
+    c, d = polyfit_columns(vo2[mid_point:], {"post": vco2[mid_point:]}, 1)["post"]
+
+    # Intersection (threshold)
+    intersection_x = (d - b) / (a - c)
+
+    low, high = np.nanmin(vo2), np.nanmax(vo2)
+    x_range1 = np.linspace(low, high - VSLOPE_PRE_MARGIN, VSLOPE_POINTS)
+    x_range2 = np.linspace(low + VSLOPE_POST_MARGIN, high, VSLOPE_POINTS)
+    return ((_frozen(x_range1), _frozen(a * x_range1 + b)),
+            (_frozen(x_range2), _frozen(c * x_range2 + d)),
+            float(intersection_x))
+
+
+def ree_trend(df):
+    """(x, y) ends of the linear REE trend after the first REE_TREND_SKIP rows (None for short tests)."""
+    if len(df) <= REE_TREND_SKIP:
+        return None
+    x = df["Time"].to_numpy(dtype=np.float64)[REE_TREND_SKIP:]
+    slope, intercept = polyfit_columns(x, {"REE": df["REE"].to_numpy()[REE_TREND_SKIP:]}, 1)["REE"]
+    x_ends = np.array([np.nanmin(x), np.nanmax(x)])
+    return _frozen(x_ends), _frozen(slope * x_ends + intercept)
+
+
+@timed("fit_test")
+def compute_fits(df, test_type):
+    """All plot fits of a test frame (uncached)."""
+    fits = {"trend": _trends(df, TREND_COLUMNS.get(test_type, []))}
+    if test_type == "VO2 Max":
+        fits["vslope"] = vslope_fit(df)
+    if test_type == "RMR" and "REE" in df.columns:
+        fits["ree_trend"] = ree_trend(df)
+    return fits
+
+
+@st.cache_resource(max_entries=MAX_CACHED_FRAMES, show_spinner=False)
+def _cached_fits(test_id, version, _document):
+    return compute_fits(load_test_frame(_document), _document.get("test_type", ""))
+
+
+def load_test_fits(document):
+    """Shared plot fits of a test document, computed once per id/version alongside its frame."""
+    return _cached_fits(str(document.get("_id")), document_version(document), document)
@@ -0,0 +1,182 @@
+import argparse
+import re
+from datetime import datetime
+import numpy as np
+from pymongo import UpdateOne
+
+###################################
+#VO2max Normative Percentiles
+#Percentile of a relative VO2max (mL/kg/min) for the client's age and sex, from a
+#reference table instead of the percentile text the cart software printed on the sheet.
+#The table holds the 10th/25th/50th/75th/90th percentile values per sex and age decade
+#(FRIEND registry treadmill norms, as used in ACSM's Guidelines; swap in the lab's
+#preferred edition here). It is loaded once into one flat sorted array, so percentiles
+#for a single test or the whole tests collection come from one np.searchsorted call,
+#interpolating linearly between the table's percentiles.
+#Both Results["VO2max Percentile"] and Results["Sheet Percentile"] (the cart's value) are ints.
+#Backfill (rewrites Results["VO2max Percentile"] of every VO2 Max test, keeping the value
+#it replaces as "Sheet Percentile"):
+#    python -m analysis.norms --backfill [--dry-run]
+###################################
+
+NORM_PERCENTILES = (10, 25, 50, 75, 90)
+
+# First age of each decade; clients under 20 use 20-29, 80+ use 70-79
+NORM_AGE_STARTS = (20, 30, 40, 50, 60, 70)
+
+# sex -> one row of NORM_PERCENTILES values (mL/kg/min) per age decade
+VO2MAX_NORMS = {
+    "M": [
+        (29.0, 40.1, 48.0, 55.2, 61.8),
+        (27.2, 35.9, 42.4, 49.2, 56.5),
+        (24.2, 31.9, 37.8, 45.0, 52.1),
+        (20.9, 27.1, 32.6, 39.7, 45.6),
+        (17.4, 23.7, 28.2, 34.5, 40.3),
+        (16.3, 20.4, 24.4, 30.4, 36.6),
+    ],
+    "F": [
+        (21.7, 30.5, 37.6, 44.7, 51.3),
+        (19.0, 25.3, 30.2, 36.1, 41.4),
+        (17.0, 22.1, 26.7, 32.4, 38.4),
+        (16.0, 19.9, 23.4, 27.6, 32.0),
+        (13.4, 17.2, 20.0, 23.8, 27.0),
+        (13.1, 15.6, 18.3, 20.8, 23.1),
+    ],
+}
+
+# Reported percentiles are kept inside this range (the table ends at the 10th/90th)
+PERCENTILE_RANGE = (1, 99)
+
+SEXES = tuple(VO2MAX_NORMS)
+
+# Flat table: row r = SEXES index * len(NORM_AGE_STARTS) + age decade, shifted by
+# r * _ROW_OFFSET so the concatenated rows stay sorted for one searchsorted call
+_ROW_OFFSET = 1000.0
+_TABLE = np.array([VO2MAX_NORMS[sex] for sex in SEXES], dtype=np.float64).reshape(-1, len(NORM_PERCENTILES))
+_FLAT = (_TABLE + np.arange(len(_TABLE))[:, None] * _ROW_OFFSET).ravel()
+_PERCENTILES = np.array(NORM_PERCENTILES, dtype=np.float64)
+
+
+def _sex_index(sex):
+    """Index into SEXES for 'M'/'F'/'male'/'female' (any case), else -1."""
+    code = str(sex or "").strip()[:1].upper()
+    return SEXES.index(code) if code in SEXES else -1
+
+
+def vo2max_percentiles(vo2max, ages, sexes):
+    """Percentiles (float array, NaN where a value/age/sex is missing) for arrays of tests."""
+    vo2max = np.asarray(vo2max, dtype=np.float64)
+    ages = np.asarray(ages, dtype=np.float64)
+    sex_idx = np.array([_sex_index(sex) for sex in np.atleast_1d(sexes)])
+
+    valid = np.isfinite(vo2max) & np.isfinite(ages) & (sex_idx >= 0)
+    age_idx = np.clip(np.searchsorted(NORM_AGE_STARTS, np.nan_to_num(ages), side="right") - 1,
+                      0, len(NORM_AGE_STARTS) - 1)
+    rows = np.where(valid, sex_idx, 0) * len(NORM_AGE_STARTS) + age_idx
+
+    # Position of each value within its own row, all rows in one call
+    knots = len(NORM_PERCENTILES)
+    shifted = np.clip(np.nan_to_num(vo2max), 0, _ROW_OFFSET - 1) + rows * _ROW_OFFSET
+    position = np.searchsorted(_FLAT, shifted, side="right") - rows * knots
+
+    # Interpolate on the surrounding segment (the first/last one extrapolates)
+    lo = np.clip(position - 1, 0, knots - 2)
+    x0, x1 = _TABLE[rows, lo], _TABLE[rows, lo + 1]
+    p0, p1 = _PERCENTILES[lo], _PERCENTILES[lo + 1]
+    percentile = p0 + (np.nan_to_num(vo2max) - x0) * (p1 - p0) / (x1 - x0)
+
+    return np.where(valid, np.clip(percentile, *PERCENTILE_RANGE), np.nan)
+
+
+def parse_percentile(value):
+    """Whole-number percentile from what the cart printed ("95", "95th", 95.0), or None."""
+    if isinstance(value, (int, float, np.number)):
+        return int(round(value)) if np.isfinite(value) else None
+    match = re.match(r"\s*(\d+(?:\.\d*)?)", str(value or ""))
+    return int(round(float(match.group(1)))) if match else None
+
+
+def vo2max_percentile(vo2max, age, sex):
+    """Whole-number percentile of one test, or None when it can't be looked up."""
+    try:
+        percentile = vo2max_percentiles([float(vo2max)], [float(age)], [sex])[0]
+    except (TypeError, ValueError):
+        return None
+    return int(round(percentile)) if np.isfinite(percentile) else None
+
+
+# ===============================
+# Backfill
+# ===============================
+
+def backfill_percentiles(tests_col, dry_run=False):
+    """Recompute Results["VO2max Percentile"] for every VO2 Max test in one pass.
+
+    The value it replaces is kept as Results["Sheet Percentile"] when that is missing.
+    Changed tests get a new `version` so cached frames and report PDFs are rebuilt.
+    Returns (tests checked, tests changed).
+    """
+    info = "VO2 Max Report Info"
+    tests = list(tests_col.find(
+        {"test_type": "VO2 Max"},
+        {f"{info}.Client Info.Age": 1, f"{info}.Client Info.Sex": 1, f"{info}.Test Protocol.Results": 1}
+    ))
+    if not tests:
+        return 0, 0
+
+    def field(test, *path):
+        value = test.get(info, {})
+        for key in path:
+            value = (value or {}).get(key)
+        return value
+
+    def number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    percentiles = vo2max_percentiles(
+        [number(field(t, "Test Protocol", "Results", "Max VO2")) for t in tests],
+        [number(field(t, "Client Info", "Age")) for t in tests],
+        [field(t, "Client Info", "Sex") for t in tests],
+    )
+
+    now = datetime.utcnow()
+    updates = []
+    for test, percentile in zip(tests, percentiles):
+        if not np.isfinite(percentile):
+            continue
+        percentile = int(round(percentile))
+        results = field(test, "Test Protocol", "Results") or {}
+        current = results.get("VO2max Percentile")
+        if current == percentile:
+            continue
+        fields = {f"{info}.Test Protocol.Results.VO2max Percentile": percentile, "version": now}
+        # Tests parsed before the norms held the sheet's value here; keep it
+        if "Sheet Percentile" not in results and parse_percentile(current) is not None:
+            fields[f"{info}.Test Protocol.Results.Sheet Percentile"] = parse_percentile(current)
+        updates.append(UpdateOne({"_id": test["_id"]}, {"$set": fields}))
+
+    if updates and not dry_run:
+        tests_col.bulk_write(updates, ordered=False)
+    return len(tests), len(updates)
+
+
+def main():
+    from utils.data_cache import get_database
+
+    parser = argparse.ArgumentParser(description="VO2max normative percentiles.")
+    parser.add_argument("--backfill", action="store_true", help="Recompute the percentile of every VO2 Max test")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the tests that would change")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.error("nothing to do (use --backfill)")
+
+    checked, changed = backfill_percentiles(get_database()["tests"], dry_run=args.dry_run)
+    print(f"{checked} VO2 Max test(s) checked, {changed} {'would change' if args.dry_run else 'updated'}")
+
+
+if __name__ == "__main__":
+    main()
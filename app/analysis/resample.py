@@ -0,0 +1,118 @@
+import re
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.test_frames import load_test_frame, document_version
+
+###################################
+#Time-Series Resampling
+#The metabolic cart exports a row per breath (or per averaging period it was set to),
+#so `Time` (minutes) is irregular and differs between tests. This turns a test frame into
+#- fixed-interval bins ("5s", "15s", "30s"): one row per bin starting at t = 0, so tests
+#  line up row for row; empty bins are NaN and `Samples` says how many rows went in
+#- rolling breath averages ("7br", "15br"): centred rolling window over the rows
+#Aggregation is "mean" by default, any pandas aggregation name ("median", "max", ...)
+#or a {column: aggregation} dict (unlisted columns use the mean).
+#Results are float32, read-only (like the test frames) and cached per test id/version.
+###################################
+
+# Averaging choices offered in the UI (spec -> label)
+AVERAGING_OPTIONS = {
+    "raw": "Breath-by-breath (raw)",
+    "5s": "5 s bins",
+    "15s": "15 s bins",
+    "30s": "30 s bins",
+    "7br": "7-breath rolling average",
+    "15br": "15-breath rolling average",
+}
+
+# Upper bound on how many resampled frames stay resident per process
+MAX_CACHED_RESAMPLES = 64
+
+_SPEC_PATTERN = re.compile(r"^(\d+)(s|br)$")
+
+
+def parse_spec(spec):
+    """("time", seconds) or ("breaths", count) for a spec like "15s" / "7br"; ("raw", None) for "raw"."""
+    if spec == "raw":
+        return "raw", None
+    match = _SPEC_PATTERN.match(spec)
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Unknown resampling spec: {spec!r} (use e.g. '15s', '7br' or 'raw')")
+    size = int(match.group(1))
+    return ("time", size) if match.group(2) == "s" else ("breaths", size)
+
+
+def _aggregations(columns, how):
+    """Per-column aggregation dict for `how` (a name or a partial dict)."""
+    if isinstance(how, str):
+        return {col: how for col in columns}
+    return {col: how.get(col, "mean") for col in columns}
+
+
+def _frozen(frame):
+    """float32, read-only copy of a frame (same layout as utils.test_frames)."""
+    columns = {}
+    for col in frame.columns:
+        values = frame[col].to_numpy(dtype=np.float32)
+        values.flags.writeable = False
+        columns[col] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def bin_frame(df, seconds, how="mean"):
+    """Aggregate a test frame into fixed `seconds` bins from t = 0 (Time = bin midpoint, minutes)."""
+    time = df["Time"].to_numpy(dtype=np.float64)
+    valid = np.isfinite(time) & (time >= 0)
+    if not valid.any():
+        return _frozen(pd.DataFrame(columns=list(df.columns) + ["Samples"]))
+
+    bins = np.floor(time[valid] * 60 / seconds).astype(np.int64)
+    n_bins = int(bins.max()) + 1
+
+    values = df.loc[valid].drop(columns="Time")
+    grouped = values.groupby(bins).agg(_aggregations(values.columns, how))
+
+    # Full grid so every test has the same rows for the same time span
+    out = grouped.reindex(np.arange(n_bins))
+    out.insert(0, "Time", (np.arange(n_bins) + 0.5) * seconds / 60)
+    out["Samples"] = np.bincount(bins, minlength=n_bins)
+    return _frozen(out.reset_index(drop=True))
+
+
+def rolling_breaths(df, breaths, how="mean"):
+    """Centred rolling average over `breaths` rows (partial windows at the ends); Time is kept as is."""
+    values = df.drop(columns="Time")
+    rolling = values.rolling(breaths, min_periods=1, center=True)
+    aggregations = _aggregations(values.columns, how)
+    if len(set(aggregations.values())) == 1:
+        out = rolling.agg(next(iter(aggregations.values()))) if aggregations else values
+    else:
+        out = pd.DataFrame({col: rolling[col].agg(agg) for col, agg in aggregations.items()})
+    out.insert(0, "Time", df["Time"].to_numpy())
+    return _frozen(out)
+
+
+def resample_frame(df, spec, how="mean"):
+    """Resample a test frame according to `spec` (see AVERAGING_OPTIONS)."""
+    kind, size = parse_spec(spec)
+    if kind == "raw":
+        return df
+    if kind == "time":
+        return bin_frame(df, size, how)
+    return rolling_breaths(df, size, how)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_RESAMPLES, show_spinner=False)
+def _cached_resample(test_id, version, spec, how, _document):
+    how = dict(how) if isinstance(how, tuple) else how
+    return resample_frame(load_test_frame(_document), spec, how)
+
+
+def load_resampled_frame(document, spec, how="mean"):
+    """Shared resampled frame of a test document, computed once per id/version/spec/aggregation."""
+    if spec == "raw":
+        return load_test_frame(document)
+    how_key = how if isinstance(how, str) else tuple(sorted(how.items()))
+    return _cached_resample(str(document.get("_id")), document_version(document), spec, how_key, document)
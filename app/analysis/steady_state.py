@@ -0,0 +1,122 @@
+import numpy as np
+
+###################################
+#RMR Steady-State Detection
+#Instead of averaging everything after a fixed 10 minutes, RMR/RQ are taken from the
+#steadiest stretch of the test: every window of STEADY_STATE_MINUTES (after the first
+#SKIP_MINUTES of acclimatisation) is scored by the coefficient of variation (CV) of
+#VO2 and VCO2, and the window with the lowest mean CV where both CVs stay under
+#MAX_CV wins. Window sums come from cumulative sums, so all windows are scored in
+#one O(n) pass.
+#RMR is computed from the window's mean VO2/VCO2 with the abbreviated Weir equation,
+#so it does not depend on the export's REE/RMR column layout.
+###################################
+
+STEADY_STATE_MINUTES = 5
+MAX_CV = 0.10
+SKIP_MINUTES = 5
+
+# Old rule, used when no window is steady enough
+FALLBACK_START_MINUTES = 10
+
+
+def weir_kcal_per_day(vo2_ml_min, vco2_ml_min):
+    """Energy expenditure (kcal/day) from VO2/VCO2 in mL/min (abbreviated Weir equation)."""
+    return (3.941 * vo2_ml_min + 1.106 * vco2_ml_min) / 1000 * 1440
+
+
+def _window_stats(cumsum, cumsum_sq, starts, ends):
+    """Mean and CV of every [start, end) row window from prefix sums."""
+    counts = ends - starts
+    total = cumsum[ends] - cumsum[starts]
+    mean = total / counts
+    var = (cumsum_sq[ends] - cumsum_sq[starts] - counts * mean ** 2) / np.maximum(counts - 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.sqrt(np.clip(var, 0, None)) / mean
+    return mean, cv
+
+
+def find_steady_state(time, vo2, vco2, window_minutes=STEADY_STATE_MINUTES, max_cv=MAX_CV,
+                      skip_minutes=SKIP_MINUTES):
+    """Steadiest VO2/VCO2 window of a test, or None when no full window meets `max_cv`.
+
+    time in minutes, vo2/vco2 in mL/min. Returns {start, end, rows, vo2, vco2, cv_vo2, cv_vco2}.
+    """
+    time = np.asarray(time, dtype=np.float64)
+    vo2 = np.asarray(vo2, dtype=np.float64)
+    vco2 = np.asarray(vco2, dtype=np.float64)
+
+    keep = np.isfinite(time) & np.isfinite(vo2) & np.isfinite(vco2) & (time >= skip_minutes)
+    time, vo2, vco2 = time[keep], vo2[keep], vco2[keep]
+    if len(time) < 2:
+        return None
+    order = np.argsort(time, kind="stable")
+    time, vo2, vco2 = time[order], vo2[order], vco2[order]
+
+    # Each row starts a window of the rows within window_minutes of it; half a sampling
+    # interval of slack absorbs the jitter in exported times (4.99992 vs 5.0)
+    step = float(np.median(np.diff(time)))
+    starts = np.arange(len(time))
+    ends = np.searchsorted(time, time + window_minutes - step / 2, side="left")
+
+    # Only windows that really span window_minutes (not cut off by the end of the test)
+    complete = (ends - starts >= 2) & (time[ends - 1] >= time + window_minutes - 1.5 * step)
+
+    zero = np.zeros(1)
+    vo2_mean, vo2_cv = _window_stats(np.concatenate([zero, np.cumsum(vo2)]),
+                                     np.concatenate([zero, np.cumsum(vo2 ** 2)]), starts, ends)
+    vco2_mean, vco2_cv = _window_stats(np.concatenate([zero, np.cumsum(vco2)]),
+                                       np.concatenate([zero, np.cumsum(vco2 ** 2)]), starts, ends)
+
+    steady = complete & (vo2_cv < max_cv) & (vco2_cv < max_cv)
+    if not steady.any():
+        return None
+    best = int(np.argmin(np.where(steady, (vo2_cv + vco2_cv) / 2, np.inf)))
+
+    return {
+        "start": float(time[best]),
+        "end": float(time[ends[best] - 1]),
+        "rows": int(ends[best] - best),
+        "vo2": float(vo2_mean[best]),
+        "vco2": float(vco2_mean[best]),
+        "cv_vo2": float(vo2_cv[best]),
+        "cv_vco2": float(vco2_cv[best]),
+    }
+
+
+def rmr_results(time, vo2, vco2):
+    """Avg RMR (kcal/day), RQ and the steady-state window they were taken from.
+
+    Falls back to every row from FALLBACK_START_MINUTES on when no window is steady.
+    """
+    window = find_steady_state(time, vo2, vco2)
+    if window is not None:
+        vo2_mean, vco2_mean = window["vo2"], window["vco2"]
+        steady_state = {
+            "Method": f"{STEADY_STATE_MINUTES} min CV < {MAX_CV:.0%}",
+            "Start": round(window["start"], 2),
+            "End": round(window["end"], 2),
+            "CV VO2": round(window["cv_vo2"] * 100, 1),
+            "CV VCO2": round(window["cv_vco2"] * 100, 1),
+        }
+    else:
+        time = np.asarray(time, dtype=np.float64)
+        after = np.isfinite(time) & (time >= FALLBACK_START_MINUTES)
+        if not after.any():
+            return {"Avg RMR": 0.0, "RQ": 0.0, "Steady State": None}
+        vo2_mean = float(np.nanmean(np.asarray(vo2, dtype=np.float64)[after]))
+        vco2_mean = float(np.nanmean(np.asarray(vco2, dtype=np.float64)[after]))
+        steady_state = {
+            "Method": f"After {FALLBACK_START_MINUTES} min (no steady state)",
+            "Start": float(FALLBACK_START_MINUTES),
+            "End": round(float(time[after].max()), 2),
+            "CV VO2": None,
+            "CV VCO2": None,
+        }
+
+    rq = vco2_mean / vo2_mean if vo2_mean > 0 else 0.0
+    return {
+        "Avg RMR": round(weir_kcal_per_day(vo2_mean, vco2_mean)),
+        "RQ": round(rq, 2),
+        "Steady State": steady_state,
+    }
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from analysis.resample import bin_frame
+
+###################################
+#Substrate Analysis (VO2 Max tests)
+#FATmax and the CHO/fat crossover from the FATmin / CHOmin columns:
+#1. the test is averaged into 30 s bins (analysis/resample.py)
+#2. bins are grouped by intensity, % of peak VO2 (or % of peak HR) in INTENSITY_STEP
+#   steps, and fat / CHO oxidation are averaged per intensity
+#3. one weighted least-squares solve fits a cubic through both curves at once
+#4. FATmax = highest fitted fat oxidation; crossover = lowest intensity from which CHO
+#   supplies more energy than fat (9.75 vs 4.07 kcal/g)
+#The result is stored in the test's Results at ingest ("Substrate"), so reports read it
+#instead of refitting on every draw.
+###################################
+
+AVERAGING_SECONDS = 30
+INTENSITY_STEP = 5        # % of peak per intensity bin
+FIT_DEGREE = 3
+GRID_STEP = 0.5           # % resolution of FATmax / crossover
+
+KCAL_PER_G_FAT = 9.75
+KCAL_PER_G_CHO = 4.07
+
+# Intensity axes: name -> (column, label)
+INTENSITY_AXES = {
+    "vo2": ("VO2 STPD", "%VO2max"),
+    "hr": ("HR", "%HRmax"),
+}
+
+
+def _crossing(grid, diff):
+    """First intensity where `diff` goes from negative to >= 0 (linear interpolation), or None."""
+    up = np.flatnonzero((diff[:-1] < 0) & (diff[1:] >= 0))
+    if not len(up):
+        return None
+    i = up[0]
+    return float(grid[i] - diff[i] * (grid[i + 1] - grid[i]) / (diff[i + 1] - diff[i]))
+
+
+def substrate_analysis(df, intensity="vo2"):
+    """FATmax / crossover summary of a VO2 Max test frame, or None when the data can't support a fit."""
+    column, label = INTENSITY_AXES[intensity]
+    needed = ["Time", "VO2 STPD", "HR", "FATmin", "CHOmin"]
+    if any(col not in df.columns for col in needed):
+        return None
+
+    averaged = bin_frame(df[needed], AVERAGING_SECONDS)
+    averaged = averaged.dropna(subset=["VO2 STPD", "FATmin", "CHOmin"])
+
+    # HR of 0 is a dropped chest strap, not a reading
+    hr_values = averaged["HR"].to_numpy(dtype=np.float64)
+    hr_values = np.where(hr_values > 0, hr_values, np.nan)
+    if intensity == "hr":
+        averaged, hr_values = averaged[np.isfinite(hr_values)], hr_values[np.isfinite(hr_values)]
+
+    reference = averaged[column].to_numpy(dtype=np.float64)
+    if not len(reference) or reference.max() <= 0:
+        return None
+
+    # Average everything per intensity bin (bin center = intensity)
+    percent = reference / reference.max() * 100
+    bins = np.floor(percent / INTENSITY_STEP).astype(np.int64)
+    counts = np.bincount(bins)
+    filled = counts > 0
+    if filled.sum() < FIT_DEGREE + 1:
+        return None
+
+    def per_bin(values):
+        valid = np.isfinite(values)
+        totals = np.bincount(bins[valid], weights=values[valid], minlength=len(counts))
+        with np.errstate(invalid="ignore"):
+            return (totals / np.bincount(bins[valid], minlength=len(counts)))[filled]
+
+    centers = (np.flatnonzero(filled) + 0.5) * INTENSITY_STEP
+    oxidation = np.column_stack([per_bin(averaged["FATmin"].to_numpy(np.float64)),
+                                 per_bin(averaged["CHOmin"].to_numpy(np.float64))])
+    hr = per_bin(hr_values)
+
+    # Both curves in one weighted solve (bins with more samples count more)
+    weights = np.sqrt(counts[filled])[:, None]
+    coefs, *_ = np.linalg.lstsq(np.vander(centers, FIT_DEGREE + 1) * weights, oxidation * weights, rcond=None)
+
+    grid = np.arange(centers.min(), centers.max() + GRID_STEP / 2, GRID_STEP)
+    fitted = np.vander(grid, FIT_DEGREE + 1) @ coefs
+    fat, cho = np.clip(fitted[:, 0], 0, None), np.clip(fitted[:, 1], 0, None)
+
+    peak = int(np.argmax(fat))
+    crossover = _crossing(grid, cho * KCAL_PER_G_CHO - fat * KCAL_PER_G_FAT)
+    has_hr = np.isfinite(hr)
+
+    def hr_at(value):
+        if value is None or not has_hr.any():
+            return None
+        return int(round(np.interp(value, centers[has_hr], hr[has_hr])))
+
+    return {
+        "Intensity": label,
+        "FATmax": round(float(fat[peak]), 3),
+        "FATmax Intensity": round(float(grid[peak]), 1),
+        "FATmax HR": hr_at(grid[peak]),
+        "Crossover Intensity": round(crossover, 1) if crossover is not None else None,
+        "Crossover HR": hr_at(crossover),
+    }
+
+
+def table_substrate_analysis(table, intensity="vo2"):
+    """substrate_analysis for the parser's raw tabular data (object columns)."""
+    return substrate_analysis(table.apply(pd.to_numeric, errors="coerce"), intensity)
@@ -0,0 +1,78 @@
+import streamlit as st
+import pandas as pd
+from datetime import date
+
+from utils.data_cache import get_database, get_s3_client
+from utils.batch_reports import find_tests, run_batch, result_rows, REPORT_TEST_TYPES, DEFAULT_WORKERS
+
+###################################
+#Batch Report Generator
+#Generates the PDF reports for a whole cohort/team in one go, using the comments saved
+#in the report builder. Tests are picked by id or by test date range and type.
+###################################
+
+db = get_database()
+s3 = get_s3_client()
+
+st.title("🗂️ Batch Report Generator")
+st.write("Generate and upload PDF reports for many tests at once (e.g. a team testing day). "
+         "Saved comments and plot selections from the Report Builder are used for each report.")
+
+# ===============================
+# Test Selection
+# ===============================
+with st.expander("🔍 Select Tests", expanded=True):
+    mode = st.radio("Select tests by", ["Test date range", "Test IDs"], horizontal=True)
+
+    if mode == "Test IDs":
+        raw_ids = st.text_area("Test IDs (one per line or comma separated)")
+        test_ids = [t.strip() for t in raw_ids.replace(",", "\n").splitlines() if t.strip()]
+        selection = {"test_ids": test_ids}
+    else:
+        col1, col2 = st.columns(2)
+        with col1:
+            test_type = st.selectbox("Test Type", list(REPORT_TEST_TYPES))
+        with col2:
+            date_range = st.date_input("Test Date Range", value=(date.today(), date.today()))
+        start, end = (date_range if len(date_range) == 2 else (date_range[0], date_range[0]))
+        selection = {"test_type": test_type, "start": start, "end": end}
+
+    workers = st.slider("Rendering processes", 1, max(DEFAULT_WORKERS, 8), DEFAULT_WORKERS)
+    upload = st.checkbox("Upload reports to S3", value=True)
+    force = st.checkbox("Regenerate unchanged reports", value=False,
+                        help="By default reports whose PDF in S3 is already up to date are skipped.")
+
+# ===============================
+# Generate
+# ===============================
+if st.button("📄 Generate Reports"):
+    try:
+        documents = find_tests(db, **selection)
+    except Exception as e:
+        st.error(f"Could not look up tests: {e}")
+        documents = []
+
+    if not documents:
+        st.warning("No tests matched the selection.")
+    else:
+        st.info(f"Generating {len(documents)} report(s)...")
+        progress_bar = st.progress(0, "Rendering reports...")
+
+        def show_progress(done, total, result):
+            progress_bar.progress(done / total, f"{done}/{total} reports finished")
+
+        results, total_seconds = run_batch(
+            db, s3, documents, workers=workers, upload=upload, progress=show_progress, force=force
+        )
+
+        failed = [r for r in results if r["error"]]
+        skipped = [r for r in results if r["skipped"]]
+        if failed:
+            st.error(f"❌ {len(failed)} report(s) failed.")
+        if skipped:
+            st.info(f"⏭️ {len(skipped)} report(s) unchanged since they were last generated, skipped.")
+        st.success(f"✅ {len(results) - len(failed) - len(skipped)} report(s) generated in {total_seconds:.1f}s (wall-clock).")
+
+        # Per-report timing
+        timing = pd.DataFrame(result_rows(results))
+        st.dataframe(timing, use_container_width=True)
@@ -4,6 +4,7 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from utils.mongo_monitor import command_monitor
 
 # find and load the .env file
 dotenv_path = os.path.abspath(os.path.join("human-peformance-lab-capstone/.env"))
@@ -12,7 +13,7 @@ load_dotenv(dotenv_path)
 database_credentials = os.getenv("database_credentials")
 
 # connecting to mongodb 
-client = MongoClient(database_credentials)
+client = MongoClient(database_credentials, event_listeners=[command_monitor])
 db = client['performance-lab']
 
 # Users and Tests collections
@@ -22,6 +23,8 @@ tests_collection = db['tests']
 # import parser classes
 from ingest.vo2max_ingest import VO2MaxParser 
 from ingest.rmr_ingest import RMRParser
+from ingest.validation import validate_test
+from utils.metrics import timed
 
 rmr_params = ["Rest"]
 vo2max_params = ["Maximal"]
@@ -73,9 +76,20 @@ with tab1:
             else:
                 st.error("Unsupported data type. Please upload a valid RMR or VO2 Max data file.")
 
-            parsed = parser.parse()
+            with timed("ingest:parse"):
+                parsed = parser.parse()
             #st.write(parsed) 
 
+            # Reject broken exports now instead of failing later in the reports
+            with timed("ingest:validate"):
+                quality_report = validate_test(parsed, report_type)
+            if quality_report["status"] == "rejected":
+                st.error("❌ Upload rejected, the file did not pass the data checks:\n\n"
+                         + "\n".join(f"- {error}" for error in quality_report["errors"]))
+                st.stop()
+            for warning in quality_report["warnings"]:
+                st.warning(f"⚠️ {warning}")
+
             # Extracting parsed data
             report_info   = parsed["Report Info"]
             client_info   = parsed["Client Info"]
@@ -120,10 +134,13 @@ with tab1:
                     "Report Info":   report_info,
                     "Client Info":   client_info,
                     "Test Protocol": test_protocol,
-                    "Tabular Data":  tabular_data
-                }
+                    "Tabular Data":  tabular_data,
+                    "Plot Data":     parsed["Plot Data"]
+                },
+                "Quality Report": quality_report
             }
-            test_result = tests_collection.insert_one(test_document)
+            with timed("mongo:insert_test"):
+                test_result = tests_collection.insert_one(test_document)
 
             # Link it back to the user
             users_collection.update_one(
@@ -151,6 +168,9 @@ with tab1:
             st.subheader("Test Protocol")
             st.write(test_protocol)
 
+            st.subheader("Quality Report")
+            st.write(quality_report)
+
             st.subheader("Tabular Data")
             st.write(tabular_data)
 
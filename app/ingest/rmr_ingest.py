@@ -1,6 +1,9 @@
 import pandas as pd
 import streamlit as st
 
+from analysis.steady_state import rmr_results
+from analysis.downsample import plot_data
+
 class RMRParser:
     def __init__(self, df: pd.DataFrame):
         self.df = df
@@ -74,23 +77,21 @@ class RMRParser:
             max_cols = 11
             cols = list(range(max_cols))
             table = df.iloc[start_row:end_row, cols]
-            table.columns = ["Time", "VO2 STPD", "VO2/kg STPD", "Mets", "VCO2 STPD", "VE uncor.", "RQ", "FEO2", "FECO2", "HR", "REE"]
+            # REE in kcal/day, RMR in kcal/kg/hr (as in the export's header)
+            table.columns = ["Time", "VO2 STPD", "VO2/kg STPD", "Mets", "VCO2 STPD", "VE uncor.", "RQ", "FEO2", "FECO2", "REE", "RMR"]
 
             tabular_data = table.to_dict(orient="records")
 
-        # Calculate average RMR from 10 minutes to the end of the test
-        records_after_10 = [row for row in tabular_data if row["Time"] >= 10]
-
-        if records_after_10:
-            # sum up the RMR column, then divide by how many rows we have
-            total_rmr = sum(row["REE"] for row in records_after_10)
-            total_vco2 = sum(row["VCO2 STPD"] for row in records_after_10)
-            total_vo2 = sum(row["VO2 STPD"] for row in records_after_10)
-            avg_rmr = total_rmr / len(records_after_10)
+        # Average RMR and RQ over the steadiest 5 minute window (see analysis/steady_state.py)
+        if tabular_data:
+            columns = table[["Time", "VO2 STPD", "VCO2 STPD"]].apply(pd.to_numeric, errors="coerce")
+            steady = rmr_results(columns["Time"].to_numpy(float), columns["VO2 STPD"].to_numpy(float),
+                                 columns["VCO2 STPD"].to_numpy(float))
         else:
-            avg_rmr = 0.0 
+            steady = {"Avg RMR": 0.0, "RQ": 0.0, "Steady State": None}
 
-        test_protocol["Results"]["Avg RMR"] = round(avg_rmr) if avg_rmr is not None else None
+        test_protocol["Results"]["Avg RMR"] = steady["Avg RMR"]
+        test_protocol["Results"]["Steady State"] = steady["Steady State"]
 
         # Calculate the Mifflin-St Jeor equation for RMR
         sex = client_info["Sex"]
@@ -101,23 +102,27 @@ class RMRParser:
         height_cm = height_in * 2.54
         age_years = client_info["Age"]
 
-        if sex.lower() == 'm':
+        sex_code = str(sex).strip().lower()[:1]
+        if sex_code == 'm':
             predicted_rmr = 66 + (13.7 * weight_kg) + (5 * height_cm) - (6 * age_years) 
-        elif sex.lower() == 'f':
+        elif sex_code == 'f':
             predicted_rmr = 655 + (9.6 * weight_kg) + (1.7 * height_cm) - (4.7 * age_years) 
         else:
-            raise ValueError("Gender must be 'male' or 'female'.")
+            predicted_rmr = None  # reported by the upload validation (ingest/validation.py)
         
         test_protocol["Results"]["Predicted RMR"] = round(predicted_rmr) if predicted_rmr is not None else None
 
-        # Calculate the RQ 
-        rq = total_vco2 / total_vo2 if total_vo2 > 0 else 0.0
-        test_protocol["Results"]["RQ"] = round(rq, 2) if rq is not None else None
+        # RQ from the same window
+        test_protocol["Results"]["RQ"] = steady["RQ"]
+
+        # Reduced copy of the plotted channel (see analysis/downsample.py)
+        plot_series = plot_data(table, "RMR") if tabular_data else None
 
         parsed = {
             "Report Info": report_info,
             "Client Info": client_info,
             "Test Protocol": test_protocol,
-            "Tabular Data": tabular_data
+            "Tabular Data": tabular_data,
+            "Plot Data": plot_series
         }
         return parsed
\ No newline at end of file
@@ -0,0 +1,145 @@
+import time
+import numpy as np
+import pandas as pd
+
+###################################
+#Upload Validation
+#Checks a parsed export before it is stored, column by column with NumPy:
+#- the client fields the analyses need (sex, age)
+#- Time: numeric and strictly increasing
+#- missing / non-numeric cells per column
+#- physiological ranges (in the export's own units)
+#- duplicated rows
+#The result is a quality report:
+#    {status: ok | warning | rejected, rows, errors, warnings, columns, duplicate_rows,
+#     time_reversals, seconds, version}
+#Uploads with errors are rejected; otherwise the report is stored with the test
+#("Quality Report") so problems stay visible later.
+###################################
+
+# Bump when the checks change
+QUALITY_CHECK_VERSION = 1
+
+# Columns every export of a test type must have
+REQUIRED_COLUMNS = {
+    "VO2 Max": ["Time", "VO2 STPD", "VCO2 STPD", "RER"],
+    "RMR": ["Time", "VO2 STPD", "VCO2 STPD", "RQ"],
+}
+
+# Plausible values as exported (VO2 Max: L/min, RMR: mL/min)
+PHYSIOLOGICAL_RANGES = {
+    "VO2 Max": {
+        "VO2 STPD": (0.05, 7.0),
+        "VCO2 STPD": (0.05, 8.0),
+        "VO2/kg STPD": (1.0, 95.0),
+        "RER": (0.5, 1.6),
+        "HR": (30, 230),
+    },
+    "RMR": {
+        "VO2 STPD": (50, 1500),
+        "VCO2 STPD": (40, 1500),
+        "RQ": (0.6, 1.2),
+    },
+}
+
+# HR of 0 means no chest strap reading, not a heart rate
+NO_READING = {"HR": 0}
+
+# A column with more than this share missing / out of range is treated as a broken export
+MAX_MISSING_SHARE = 0.5
+MAX_OUT_OF_RANGE_SHARE = 0.25
+
+
+def _numeric_table(records):
+    """Parsed records -> (column names, float64 matrix with NaN for missing/non-numeric, missing mask of the raw cells)."""
+    raw = pd.DataFrame.from_records(records)
+    blank = raw.isna().to_numpy()
+    values = raw.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+    return list(raw.columns), values, blank
+
+
+def _check_client(client_info, errors):
+    sex = str(client_info.get("Sex") or "").strip()[:1].upper()
+    if sex not in ("M", "F"):
+        errors.append(f"Sex must be M or F (got {client_info.get('Sex')!r})")
+    age = pd.to_numeric(client_info.get("Age"), errors="coerce")
+    if not np.isfinite(age) or not 5 <= age <= 110:
+        errors.append(f"Age is missing or implausible (got {client_info.get('Age')!r})")
+
+
+def validate_test(parsed, test_type):
+    """Quality report for a parser's output (see module comment)."""
+    started = time.perf_counter()
+    errors, warnings = [], []
+    report = {"rows": 0, "columns": {}, "duplicate_rows": 0, "time_reversals": 0}
+
+    _check_client(parsed.get("Client Info", {}), errors)
+
+    records = parsed.get("Tabular Data") or []
+    if not records:
+        errors.append("No tabular data found")
+    else:
+        columns, values, blank = _numeric_table(records)
+        rows = len(values)
+        report["rows"] = rows
+        index = {col: i for i, col in enumerate(columns)}
+
+        missing_columns = [col for col in REQUIRED_COLUMNS[test_type] if col not in index]
+        if missing_columns:
+            errors.append(f"Missing columns: {', '.join(missing_columns)}")
+
+        # Missing / non-numeric cells, all columns at once
+        missing = np.isnan(values)
+        for col, value in NO_READING.items():
+            if col in index:
+                missing[:, index[col]] |= values[:, index[col]] == value
+        missing_counts = missing.sum(axis=0)
+        non_numeric_counts = (np.isnan(values) & ~blank).sum(axis=0)  # text where a number belongs
+
+        # Out of range, per ranged column (missing cells don't count)
+        ranges = PHYSIOLOGICAL_RANGES[test_type]
+        for col, i in index.items():
+            stats = {"missing": int(missing_counts[i]), "non_numeric": int(non_numeric_counts[i])}
+            if col in ranges:
+                low, high = ranges[col]
+                column = values[~missing[:, i], i]
+                stats["out_of_range"] = int(((column < low) | (column > high)).sum())
+            report["columns"][col] = stats
+
+        for col, stats in report["columns"].items():
+            share_missing = stats["missing"] / rows
+            required = col in REQUIRED_COLUMNS[test_type]
+            if stats["missing"] == rows and col in NO_READING:
+                warnings.append(f"{col}: no readings")
+            elif stats["missing"]:
+                message = f"{col}: {stats['missing']} of {rows} values missing"
+                if stats["non_numeric"]:
+                    message += f" ({stats['non_numeric']} non-numeric)"
+                (errors if required and (share_missing > MAX_MISSING_SHARE or col == "Time") else warnings).append(message)
+            if stats.get("out_of_range"):
+                low, high = ranges[col]
+                message = f"{col}: {stats['out_of_range']} of {rows} values outside {low}-{high}"
+                (errors if stats["out_of_range"] / rows > MAX_OUT_OF_RANGE_SHARE else warnings).append(message)
+
+        # Time must keep increasing
+        if "Time" in index:
+            time_values = values[:, index["Time"]]
+            steps = np.diff(time_values[np.isfinite(time_values)])
+            report["time_reversals"] = int((steps <= 0).sum())
+            if report["time_reversals"]:
+                errors.append(f"Time is not increasing ({report['time_reversals']} step(s) back or repeated)")
+
+        # Identical rows (NaNs compare equal here)
+        filled = np.where(np.isnan(values), np.inf, values)
+        report["duplicate_rows"] = int(rows - len(np.unique(filled, axis=0)))
+        if report["duplicate_rows"]:
+            warnings.append(f"{report['duplicate_rows']} duplicated row(s)")
+
+    report.update({
+        "status": "rejected" if errors else ("warning" if warnings else "ok"),
+        "errors": errors,
+        "warnings": warnings,
+        "seconds": round(time.perf_counter() - started, 4),
+        "version": QUALITY_CHECK_VERSION,
+    })
+    return report
@@ -1,5 +1,9 @@
 import pandas as pd
 
+from analysis.substrate import table_substrate_analysis
+from analysis.norms import vo2max_percentile, parse_percentile
+from analysis.downsample import plot_data
+
 class VO2MaxParser:
     def __init__(self, df: pd.DataFrame):
         self.df = df
@@ -62,6 +66,7 @@ class VO2MaxParser:
         # Extract tabular records
         if end_row <= start_row:
             tabular_records = []
+            table = None
         else:
             max_cols = 21 if df.shape[1] > 19 else 19
             cols = list(range(max_cols))
@@ -86,27 +91,43 @@ class VO2MaxParser:
             if pd.notna(raw_max):
                 max_vo2 = round(float(raw_max), 2)
 
-        vo2_percentile = None
+        # What the cart software printed; only kept for reference
+        sheet_percentile = None
         if results_row + 2 < len(df):
-            raw_pct = df.iloc[results_row + 2, 1]
-            if isinstance(raw_pct, str):
-                vo2_percentile = raw_pct.split()[0]
-            elif pd.notna(raw_pct):
-                vo2_percentile = raw_pct
+            sheet_percentile = parse_percentile(df.iloc[results_row + 2, 1])
+
+        # Percentile from the normative tables (see analysis/norms.py), the sheet's if that fails
+        vo2_percentile = None
+        if max_vo2 is not None:
+            vo2_percentile = vo2max_percentile(max_vo2, client_info["Age"], client_info["Sex"])
+        if vo2_percentile is None:
+            vo2_percentile = sheet_percentile
 
         results = {}
         if max_vo2 is not None:
             results["Max VO2"] = max_vo2
         if vo2_percentile is not None:
             results["VO2max Percentile"] = vo2_percentile
+        if sheet_percentile is not None:
+            results["Sheet Percentile"] = sheet_percentile
+
+        # FATmax / crossover, computed once here so reports don't refit them (see analysis/substrate.py)
+        if table is not None:
+            substrate = table_substrate_analysis(table)
+            if substrate is not None:
+                results["Substrate"] = substrate
 
         test_protocol["Results"] = results
 
+        # Reduced copies of the plotted channels, so reports don't scatter every breath (see analysis/downsample.py)
+        plot_series = plot_data(table, "VO2 Max") if table is not None else None
+
         # Final payload
         parsed = {
             "Report Info": report_info,
             "Client Info": client_info,
             "Test Protocol": test_protocol,
-            "Tabular Data": tabular_records
+            "Tabular Data": tabular_records,
+            "Plot Data": plot_series
         }
         return parsed
\ No newline at end of file
@@ -1,14 +1,13 @@
-from pymongo import MongoClient
 import streamlit as st
-import os
-from dotenv import load_dotenv
 import pandas as pd
-import boto3
 from streamlit_pdf_viewer import pdf_viewer
 
 # loading test imports
 from tests.vo2max_test import VO2MaxTest
 from tests.rmr_test import RMRTest
+from utils.data_cache import get_database, get_s3_client, load_client, load_test
+from utils.report_drafts import flush_session_draft
+from utils.metrics import timed
 
 TEST_CLASS_MAP = {
     "VO2 MAX": VO2MaxTest,
@@ -26,34 +25,25 @@ TEST_CLASS_MAP = {
 # Setup: Environment & Database
 # ===============================
 
-# Load environment variables (MongoDB URI, etc.)
-load_dotenv()
-database_credentials = os.getenv("database_credentials")
-aws_access_key = os.getenv("aws_access_key_id")
-aws_secret_key = os.getenv("aws_secret_access_key")
-bucket_name = "champ-hpl-bucket"
-
-# Connect to MongoDB
-client = MongoClient(database_credentials)
-db = client['performance-lab']
+# Shared (process-wide) MongoDB and S3 handles
+db = get_database()
 users_col = db['users']
 reports_col = db['reports']
 tests_collection = db['tests']  
+bucket_name = "champ-hpl-bucket"
 
 # S3 setup
-s3 = boto3.client("s3",
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
-)
+s3 = get_s3_client()
 
 # ===============================
 # Session State Initialization
 # ===============================
 
-# These keys help maintain state across page interactions
-for key in ['test_section', 'report_builder', 'reviewing', 'selected_test', 'selected_client']:
+# These keys help maintain state across page interactions.
+# Only ObjectIds are kept for the client/test; the documents are resolved through the shared cache.
+for key in ['test_section', 'report_builder', 'reviewing', 'selected_test_id', 'selected_client_id']:
     if key not in st.session_state:
-        st.session_state[key] = False if key in ['test_section', 'report_builder', 'reviewing'] else {}
+        st.session_state[key] = False if key in ['test_section', 'report_builder', 'reviewing'] else None
 
 # ===============================
 # client Selection Page
@@ -67,13 +57,14 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
         if name_query:
             # Search MongoDB for clients matching the query
             query = {"Name": {"$regex": name_query, "$options": "i"}}
-            clients = list(users_col.find(query))
+            with timed("mongo:search_clients"):
+                clients = list(users_col.find(query))
 
             if clients:
                 selected_client = st.selectbox("Select Client", clients, format_func=lambda x: x['Name'])
 
                 if selected_client:
-                    st.session_state.selected_client = selected_client
+                    st.session_state.selected_client_id = selected_client["_id"]
 
                     # ===============================
                     # Display Selected Client Info
@@ -90,7 +81,13 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
                     # ===============================
                     # Step 2: Test Selection
                     # ===============================
-                    tests = list(tests_collection.find({"user_id": selected_client["_id"]}))
+                    # Leave the (large) tabular and plot data out; the builder loads it by id when needed
+                    with timed("mongo:list_tests"):
+                        tests = list(tests_collection.find(
+                            {"user_id": selected_client["_id"]},
+                            {"VO2 Max Report Info.Tabular Data": 0, "RMR Report Info.Tabular Data": 0,
+                             "VO2 Max Report Info.Plot Data": 0, "RMR Report Info.Plot Data": 0}
+                        ))
 
                     def format_test_entry(t):
                         test_name = t.get("test_type", "").replace("_", " ")
@@ -126,10 +123,11 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
                         selected_test = st.selectbox("Select Test", tests, format_func=format_test_entry)
 
                         # Check if a report already exists for this test
-                        report_exists = reports_col.find_one({
-                            "user_id": selected_client["_id"],
-                            "test_id": selected_test["_id"]
-                        })
+                        with timed("mongo:find_report"):
+                            report_exists = reports_col.find_one({
+                                "user_id": selected_client["_id"],
+                                "test_id": selected_test["_id"]
+                            })
 
                         # ===============================
                         # Step 3: Action Buttons
@@ -147,20 +145,22 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
                                     edit_button_label = "✏️ Edit Existing Report"
 
                                 if st.button(edit_button_label):
-                                    st.session_state.selected_test = selected_test
+                                    st.session_state.selected_test_id = selected_test["_id"]
                                     st.session_state.report_builder = True
                                     st.session_state.test_section = False
                                     st.session_state.reviewing = False
                                     st.session_state.report_loaded = False
+                                    st.session_state.pop("report_draft", None)
                                     st.rerun()
 
                             else:
                                 if st.button("📄 Generate Report"):
-                                    st.session_state.selected_test = selected_test
+                                    st.session_state.selected_test_id = selected_test["_id"]
                                     st.session_state.report_builder = True
                                     st.session_state.test_section = False
                                     st.session_state.reviewing = False
                                     st.session_state.report_loaded = False
+                                    st.session_state.pop("report_draft", None)
                                     st.rerun()
 
                         # Right column: Overwrite existing report
@@ -171,11 +171,12 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
                                         "user_id": selected_client["_id"],
                                         "test_id": selected_test["_id"]
                                     })
-                                    st.session_state.selected_test = selected_test
+                                    st.session_state.selected_test_id = selected_test["_id"]
                                     st.session_state.report_builder = True
                                     st.session_state.test_section = False
                                     st.session_state.reviewing = False
                                     st.session_state.report_loaded = False
+                                    st.session_state.pop("report_draft", None)
                                     st.success("🗑️ Previous report deleted. Starting fresh.")
                                     st.rerun()
                             else:
@@ -227,10 +228,11 @@ if not st.session_state['report_builder'] and not st.session_state['reviewing']:
 # ===============================
 if st.session_state['report_builder']:
     st.subheader("📝 Report Builder")
-    st.write("Building report for:", st.session_state.selected_client['Name'])
+    selected_client = load_client(st.session_state.selected_client_id) or {}
+    st.write("Building report for:", selected_client.get('Name', 'Unknown'))
 
     # Retrieve the selected test and initialize the appropriate test class
-    test_data = st.session_state.selected_test
+    test_data = load_test(st.session_state.selected_test_id) or {}
     raw_type = test_data.get("test_type", "").upper()
     #print(f"Selected test type: {raw_type}")
     TestClass = TEST_CLASS_MAP.get(raw_type) 
@@ -241,7 +243,7 @@ if st.session_state['report_builder']:
         client_info, test_protocol, results, df = selection  # Unpack parsed test data
 
         # Load saved report (from MongoDB) only once per session unless rerun
-        if 'report_loaded' not in st.session_state:
+        if not st.session_state.get('report_loaded'):
             loaded = test.load_saved_report()
             if loaded:
                 st.success("✅ Loaded existing saved report for editing.")
@@ -341,7 +343,12 @@ if st.session_state['report_builder']:
         # Navigation Button
         # ===============================
         if st.button("Back to Client Select"):
-            # Reset builder state and return to the client/test selection page
-            for key in ['report_builder', 'report_loaded', 'selected_test', 'selected_client']:
-                st.session_state[key] = None if key.startswith('selected') else False
-            st.rerun()
\ No newline at end of file
+            # Write any pending autosave edits before leaving the builder
+            if flush_session_draft(reports_col):
+                # Reset builder state and return to the client/test selection page
+                for key in ['report_builder', 'report_loaded', 'selected_test_id', 'selected_client_id']:
+                    st.session_state[key] = None if key.startswith('selected') else False
+                st.session_state.pop("report_draft", None)
+                st.rerun()
+            else:
+                st.warning("⚠️ Your unsaved edits conflict with a newer saved version. Resolve the notice above the plots before leaving.")
\ No newline at end of file
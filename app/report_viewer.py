@@ -1,38 +1,71 @@
 import streamlit as st
-from pymongo import MongoClient
-import os
-from dotenv import load_dotenv
-import boto3
+import io
+import zipfile
 import pandas as pd
 from streamlit_pdf_viewer import pdf_viewer
+from utils.data_cache import get_database, get_s3_client
+from utils.storage import download_many, BUCKET_NAME
+from utils.metrics import timed
 
 ###################################
 #This page allows lab techs to search clients and view/download test reports
 #without editing access. Reports are fetched from AWS S3 and metadata from MongoDB.
+#Reports are listed as first-page thumbnails (small PNGs stored next to the PDFs);
+#the full PDF is only fetched when asked for.
 ###################################
 
 # ===============================
 # Setup: Environment & Database
 # ===============================
 
-# Load environment variables (MongoDB URI, etc.)
-load_dotenv()
-database_credentials = os.getenv("database_credentials")
-aws_access_key = os.getenv("aws_access_key_id")
-aws_secret_key = os.getenv("aws_secret_access_key")
-bucket_name = "champ-hpl-bucket"
-
-# Connect to MongoDB
-client = MongoClient(database_credentials)
-db = client['performance-lab']
+# Shared MongoDB / S3 handles (see utils/data_cache.py)
+db = get_database()
 users_col = db['users']
 reports_col = db['reports']
-
-# S3 setup
-s3 = boto3.client("s3",
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
-)
+s3 = get_s3_client()
+bucket_name = BUCKET_NAME
+
+
+def report_pdf_key(report, client):
+    """S3 key of a report's PDF: the recorded one, else reports/<TYPE>_report_<Name>_<YYYY-MM-DD>.pdf."""
+    recorded = (report.get("pdf") or {}).get("s3_key")
+    if recorded:
+        return recorded
+
+    date_obj = report.get("test_date", {})
+    if isinstance(date_obj, dict):
+        year = str(date_obj.get("Year", ""))
+        month = str(date_obj.get("Month", "")).zfill(2)
+        day = str(date_obj.get("Day", "")).zfill(2)
+        month_map = {
+            "January": "01", "February": "02", "March": "03", "April": "04",
+            "May": "05", "June": "06", "July": "07", "August": "08",
+            "September": "09", "October": "10", "November": "11", "December": "12"
+        }
+        month = month_map.get(month, month)
+        test_date_str = f"{year}-{month}-{day}"
+    else:
+        test_date_str = "unknown-date"
+
+    test_type = report.get("test_type").upper()
+    clean_name = client['Name'].replace(',', '').replace(' ', '_')
+    return f"reports/{test_type}_report_{clean_name}_{test_date_str}.pdf"
+
+
+def report_thumbnail_ref(report):
+    """(thumbnail key, PDF ETag) of a report, or None when no preview was stored."""
+    pdf = report.get("pdf") or {}
+    if not pdf.get("thumbnail_key"):
+        return None
+    return pdf["thumbnail_key"], pdf.get("etag") or ""
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def fetch_thumbnails(refs):
+    """Thumbnail PNGs by key, downloaded together. `refs` are (key, etag) pairs; a new ETag
+    (regenerated PDF) means a new cache entry."""
+    downloads = download_many(s3, [key for key, _ in refs])
+    return {d["key"]: d["value"] for d in downloads if d["value"] is not None}
 
 # ===============================
 # Report Viewer (Read-Only Access)
@@ -45,7 +78,8 @@ with st.expander("🔍 Search Clients", expanded=True):
 
     if name_query:
         query = {"Name": {"$regex": name_query, "$options": "i"}}
-        clients = list(users_col.find(query))
+        with timed("mongo:search_clients"):
+            clients = list(users_col.find(query))
 
         if clients:
             selected_client = st.selectbox("Select Client", clients, format_func=lambda x: x['Name'])
@@ -61,7 +95,8 @@ with st.expander("🔍 Search Clients", expanded=True):
                     st.markdown(f"**Weight:** {selected_client.get('Weight', 'N/A')} lb")
 
                 # --- Test Reports Section ---
-                test_reports = list(reports_col.find({"user_id": selected_client["_id"]}))
+                with timed("mongo:list_reports"):
+                    test_reports = list(reports_col.find({"user_id": selected_client["_id"]}))
 
                 def format_report_entry(r):
                     test_type = r.get("test_type").upper()
@@ -83,7 +118,8 @@ with st.expander("🔍 Search Clients", expanded=True):
                         test_date_str = "Unknown Date"
 
                     # Format last updated timestamp
-                    last_updated = r.get("last_updated")
+                    # Reports created by a batch run only have their PDF's generation time
+                    last_updated = r.get("last_updated") or (r.get("pdf") or {}).get("generated_at")
                     if last_updated:
                         last_updated_str = pd.to_datetime(last_updated).strftime("%m/%d/%Y")
                     else:
@@ -92,6 +128,19 @@ with st.expander("🔍 Search Clients", expanded=True):
                     return f"{test_type} – Test Date: {test_date_str} – Updated: {last_updated_str}"
 
                 if test_reports:
+                    # --- Thumbnail overview of every report ---
+                    refs = tuple(dict.fromkeys(ref for ref in map(report_thumbnail_ref, test_reports) if ref))
+                    thumbnails = fetch_thumbnails(refs) if refs else {}
+                    if thumbnails:
+                        columns = st.columns(4)
+                        for i, report in enumerate(test_reports):
+                            ref = report_thumbnail_ref(report)
+                            with columns[i % 4]:
+                                if ref and ref[0] in thumbnails:
+                                    st.image(thumbnails[ref[0]], caption=format_report_entry(report), use_container_width=True)
+                                else:
+                                    st.caption(f"{format_report_entry(report)} (no preview)")
+
                     selected_report = st.selectbox(
                         "📄 Select Report",
                         test_reports,
@@ -101,52 +150,59 @@ with st.expander("🔍 Search Clients", expanded=True):
                     if selected_report:
                         st.markdown("---")
                         
-                        # Generate PDF file name for S3 retrieval
-                        date_obj = selected_report.get("test_date", {})
-                        if isinstance(date_obj, dict):
-                            year = str(date_obj.get("Year", ""))
-                            month = str(date_obj.get("Month", "")).zfill(2)
-                            day = str(date_obj.get("Day", "")).zfill(2)
-                            month_map = {
-                                "January": "01", "February": "02", "March": "03", "April": "04",
-                                "May": "05", "June": "06", "July": "07", "August": "08",
-                                "September": "09", "October": "10", "November": "11", "December": "12"
-                            }
-                            month = month_map.get(month, month)
-                            test_date_str = f"{year}-{month}-{day}"
-                        else:
-                            test_date_str = "unknown-date"
-
-                        test_type = selected_report.get("test_type").upper()
-                        clean_name = selected_client['Name'].replace(',', '').replace(' ', '_')
-                        pdf_filename = f"{test_type}_report_{clean_name}_{test_date_str}.pdf"
-                        s3_key = f"reports/{pdf_filename}"
+                        # PDF location in S3
+                        s3_key = report_pdf_key(selected_report, selected_client)
+                        pdf_filename = s3_key.split("/")[-1]
 
                         st.subheader("📋 Report")
 
-                        # Getting the PDF from S3 to view it
-                        url = s3.generate_presigned_url(
-                            "get_object",
-                            Params={"Bucket": bucket_name, "Key": s3_key},
-                            ExpiresIn=600
-                        )
-
-                        st.markdown(f"""
-                        <iframe src="{url}" width="100%" height="800px" type="application/pdf"></iframe>
-                        """, unsafe_allow_html=True)
-                        
-                        #pdf_viewer(url) 
-
-                        try:
-                            with st.spinner("Downloading from S3..."):
-                                s3.download_file(bucket_name, s3_key, pdf_filename)
-
-                            with open(pdf_filename, "rb") as f:
-                                st.download_button("📥 Download PDF", f, file_name=pdf_filename)
-
-                        except Exception as e:
-                            st.error(f"⚠️ Report not found in S3: {s3_key}")
-                            st.exception(e)
+                        # First-page preview; the PDF itself is only loaded on request
+                        ref = report_thumbnail_ref(selected_report)
+                        if ref and ref[0] in thumbnails:
+                            st.image(thumbnails[ref[0]], width=480)
+
+                        if st.toggle("📖 Load full PDF", value=ref is None or ref[0] not in thumbnails,
+                                     key=f"load_pdf_{selected_report['_id']}"):
+                            # Getting the PDF from S3 to view it
+                            url = s3.generate_presigned_url(
+                                "get_object",
+                                Params={"Bucket": bucket_name, "Key": s3_key},
+                                ExpiresIn=600
+                            )
+
+                            st.markdown(f"""
+                            <iframe src="{url}" width="100%" height="800px" type="application/pdf"></iframe>
+                            """, unsafe_allow_html=True)
+
+                            #pdf_viewer(url) 
+
+                            # The browser downloads straight from S3; the PDF never passes through this server
+                            download_url = s3.generate_presigned_url(
+                                "get_object",
+                                Params={"Bucket": bucket_name, "Key": s3_key,
+                                        "ResponseContentDisposition": f'attachment; filename="{pdf_filename}"'},
+                                ExpiresIn=600
+                            )
+                            st.link_button("📥 Download PDF", download_url)
+
+                    # --- Archive export: every report of this client in one ZIP ---
+                    st.markdown("---")
+                    if st.button("🗜️ Prepare ZIP of all reports"):
+                        keys = list(dict.fromkeys(report_pdf_key(r, selected_client) for r in test_reports))
+                        with st.spinner(f"Downloading {len(keys)} report(s) from S3..."):
+                            downloads = download_many(s3, keys)
+
+                        archive = io.BytesIO()
+                        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                            for download in downloads:
+                                if download["value"] is not None:
+                                    zf.writestr(download["key"].split("/")[-1], download["value"])
+
+                        missing = [d["key"] for d in downloads if d["error"]]
+                        if missing:
+                            st.warning(f"⚠️ {len(missing)} report(s) not found in S3: {', '.join(missing)}")
+                        clean_name = selected_client['Name'].replace(',', '').replace(' ', '_')
+                        st.download_button("📥 Download ZIP", archive.getvalue(), file_name=f"{clean_name}_reports.zip")
 
                 else:
                     st.info("No reports found for this client.")
@@ -3,18 +3,22 @@ import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
 import bcrypt
+from utils.profiling import profiled_run
+from utils.mongo_monitor import command_monitor, monitored_rerun
 
 # the menu pages
 data_uploader = st.Page("data_uploader.py", title="Data Uploader")
 home = st.Page("home.py", title="Home")
 report_creator_page = st.Page("report_creator.py", title="Create Report")
+batch_report_page = st.Page("batch_report_creator.py", title="Batch Reports")
 data_viewer = st.Page("report_viewer.py", title="View Report")
+metrics_page = st.Page("admin_metrics.py", title="Performance")
 
 # Setup MongoDB connection
 load_dotenv()
 database_credentials = os.getenv("database_credentials")
 
-client = MongoClient(database_credentials)
+client = MongoClient(database_credentials, event_listeners=[command_monitor])
 db = client['performance-lab']
 auth_users_col = db['authUsers']
 
@@ -85,7 +89,11 @@ else:
         {
             "🏠 HOMEPAGE": [home], 
             "📂 UPLOADER": [data_uploader],
-            "📑 REPORTS": [report_creator_page, data_viewer]
+            "📑 REPORTS": [report_creator_page, batch_report_page, data_viewer],
+            "🛠️ ADMIN": [metrics_page]
         }
     )
-    pg.run()
+    # Profiled when asked for (?profile=1 or armed on the Performance page), see utils/profiling.py
+    # MongoDB round trips are counted per rerun, see utils/mongo_monitor.py
+    with profiled_run(pg.title), monitored_rerun(pg.title):
+        pg.run()
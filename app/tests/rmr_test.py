@@ -1,68 +1,78 @@
-import pandas as pd
-from pymongo import MongoClient
 import streamlit as st
 import matplotlib.pyplot as plt
 import os
-from dotenv import load_dotenv, find_dotenv
-import boto3
-from reportlab.lib.pagesizes import LETTER, landscape
-from reportlab.pdfgen import canvas
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import Table, TableStyle, KeepTogether, KeepInFrame, Paragraph, Spacer
-import io
-import numpy as np
-from datetime import datetime
+from reportlab.platypus import Table, KeepTogether, KeepInFrame, Paragraph, Spacer
+from utils.data_cache import get_database, get_s3_client
+from utils.test_frames import load_test_frame, load_plot_frames
+from analysis.fits import load_test_fits, compute_fits
+from utils.metrics import timed
+from utils.report_drafts import ReportDraft, AUTOSAVE_DEBOUNCE_SECONDS, render_autosave_status
+from utils.report_graphics import render_figure, plot_flowable
+from utils import report_charts as charts
+from utils.report_assets import logo_flowable
+from utils.report_layout import (rmr_document, report_styles, RMR_LOGO_STYLE, RMR_TITLE_STYLE,
+                                 RMR_CLIENT_TABLE_STYLE, RMR_RESULTS_TABLE_STYLE, RMR_LEFT_STACK_STYLE,
+                                 RMR_CHART_CELL_STYLE, RMR_TOP_ROW_STYLE, RMR_PIE_ROW_STYLE)
+from utils.report_fingerprint import report_fingerprint, current_pdf, uploaded_etag, record_pdf
+from utils.storage import upload_path, BUCKET_NAME
+from utils.report_thumbnails import store_thumbnail
 import time
 
+# Parts of the TDEE pie charts
+TDEE_LABELS = ["BMR", "TEF", "EAT", "NEAT"]
+
 class RMRTest:
-    def __init__(self, user_id=None):
-        """Initialize database connection, S3 client, and prepare environment."""
+    def __init__(self, user_id=None, connect=True):
+        """Initialize database connection, S3 client, and prepare environment.
+
+        connect=False skips the MongoDB / S3 handles: enough to parse a document and build its PDF
+        (batch render workers), not for the builder.
+        """
         self.user_id = user_id
 
-        # Load environment variables (.env)
-        load_dotenv()
-
-        # Setup MongoDB connection
-        database_credentials = os.getenv("database_credentials")
-        self.client = MongoClient(database_credentials)
-        self.db = self.client['performance-lab']
-        self.collection = self.db['tests']  
-        self.users_col = self.db['users']
-        self.reports_col = self.db['reports']
-
-        # Setup AWS S3 connection for storing PDFs
-        aws_access_key_id = os.getenv("aws_access_key_id")
-        aws_secret_access_key = os.getenv("aws_secret_access_key")
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name='us-east-1'
-        )
+        # Shared (process-wide) MongoDB and S3 handles
+        self.db = self.client = self.collection = self.users_col = self.reports_col = self.s3_client = None
+        if connect:
+            self.db = get_database()
+            self.client = self.db.client
+            self.collection = self.db['tests']
+            self.users_col = self.db['users']
+            self.reports_col = self.db['reports']
+            self.s3_client = get_s3_client()
+
+        # Filled in by parse_test (per rerun, never stored in session state)
+        self.document = None
+        self.df = None
+        self.plot_frames = {}
+        self.fits = None
+
+        # Activity level for the TDEE plots when rendering outside the builder (batch PDFs)
+        self.activity_level = None
 
     def parse_test(self, document):
-        """Parse the provided document and load it into Streamlit session."""
+        """Parse the provided RMR document into client info, protocol, results and a DataFrame."""
         try:
-            # Save entire document to session
-            st.session_state.selected_document = document
+            # Keep the document on the instance; session state only holds its id
+            self.document = document
 
             # Break apart key data sections
             report_info = document["RMR Report Info"]
             client_info = report_info["Client Info"]
             test_protocol = report_info["Test Protocol"]
             results = test_protocol["Results"]
-            tabular_data = report_info["Tabular Data"]
 
             self.results = results
 
-            # Convert tabular data into dataframe for easy use
-            df = pd.DataFrame(tabular_data)
+            # Shared, read-only frame, memoized per test id/version
+            df = load_test_frame(document)
+
+            self.df = df
 
-            # Store DataFrame in session
-            st.session_state.df = df
+            # Downsampled copy of the plotted REE series (analysis/downsample.py), shared the same way
+            self.plot_frames = load_plot_frames(document)
+
+            # REE trendline, fit once per test (analysis/fits.py)
+            self.fits = load_test_fits(document)
 
             return client_info, test_protocol, results, df
 
@@ -70,14 +80,48 @@ class RMRTest:
             st.error(f"Failed to parse test document: {e}")
             return None
 
+    def plot_points(self, df, channel):
+        """Frame the line of `channel` draws from: its downsampled series, else the full frame."""
+        points = self.plot_frames.get(channel)
+        return points if points is not None else df
+
+    def ree_trend(self, df):
+        """(x, y) ends of the linear REE trend after the first 10 rows (None for short tests)."""
+        fits = self.fits if self.fits is not None else compute_fits(df, "RMR")
+        return fits.get("ree_trend")
+
+    def tdee_breakdown(self, bmr, activity_level=None):
+        """kcal/day per TDEE_LABELS part for a BMR and activity level, and their total."""
+        if activity_level is None:
+            activity_level = self.activity_level or st.session_state.get("activity_level")
+
+        # Simple presets for EAT/NEAT (kcal/day).
+        presets = {
+            "sedentary":   {"eat": 100, "neat": 200},
+            "light":       {"eat": 200, "neat": 300},
+            "moderate":    {"eat": 300, "neat": 400},
+            "active":      {"eat": 450, "neat": 550},
+            "very active": {"eat": 600, "neat": 700},
+        }
+        eat = presets[activity_level]["eat"]
+        neat = presets[activity_level]["neat"]
+
+        # TEF as exact 10% of TDEE
+        tef_pct = 0.10
+        base = bmr + eat + neat
+        tdee_total = base / (1 - tef_pct) if base > 0 else 0.0
+        tef = tef_pct * tdee_total
+
+        return [bmr, tef, eat, neat], tdee_total
+
     def get_plot_functions(self):
         """Return list of plotting functions for different test metrics."""
-        df = st.session_state.get("df")
 
         # Time-Series Plot of RMR (kcal/day)
         def plot_rmr_over_time(ax, df):
             """Plot RMR over time."""
-            ax.plot(df["Time"], df["REE"], label="RMR (kcal/day)", color='blue')
+            points = self.plot_points(df, "REE")
+            ax.plot(points["Time"], points["REE"], label="RMR (kcal/day)", color='blue')
             ax.set_xlabel("Time (minutes)")
             ax.set_ylabel("RMR (kcal/day)")
             ax.set_title("RMR Over Time", fontsize=7, fontweight='bold')
@@ -85,12 +129,15 @@ class RMRTest:
             ax.legend(loc="upper right", bbox_to_anchor=(1.3, 1), fontsize='small')
 
             # Add trend line after 10 minutes to show RMR stability
-            if len(df) > 10:
-                x = df["Time"][10:]
-                y = df["REE"][10:]
-                z = np.polyfit(x, y, 1)
-                p = np.poly1d(z)
-                ax.plot(x, p(x), color='red', linestyle='--', label="Trend Line")
+            trend = self.ree_trend(df)
+            if trend is not None:
+                ax.plot(*trend, color='red', linestyle='--', label="Trend Line")
+                ax.legend(loc="upper right", bbox_to_anchor=(1.3, 1), fontsize='small')
+
+            # Shade the window Avg RMR / RQ were taken from (tests ingested with steady-state detection)
+            steady_state = getattr(self, "results", {}).get("Steady State")
+            if steady_state:
+                ax.axvspan(steady_state["Start"], steady_state["End"], color='green', alpha=0.15, label="Steady State")
                 ax.legend(loc="upper right", bbox_to_anchor=(1.3, 1), fontsize='small')
 
         # Bullet Gauge for Respiratory Quotient (RQ)
@@ -178,28 +225,8 @@ class RMRTest:
             bmr = getattr(self, "results", {}).get("Avg RMR", 0)
             #print(f"Using BMR: {bmr}")
 
-            if activity_level is None:
-                activity_level = st.session_state.get("activity_level")
-
-            # Simple presets for EAT/NEAT (kcal/day).
-            presets = {
-                "sedentary":   {"eat": 100, "neat": 200},
-                "light":       {"eat": 200, "neat": 300},
-                "moderate":    {"eat": 300, "neat": 400},
-                "active":      {"eat": 450, "neat": 550},
-                "very active": {"eat": 600, "neat": 700},
-            }
-            eat = presets[activity_level]["eat"]
-            neat = presets[activity_level]["neat"]
-
-            # TEF as exact 10% of TDEE
-            tef_pct = 0.10
-            base = bmr + eat + neat
-            tdee_total = base / (1 - tef_pct) if base > 0 else 0.0
-            tef = tef_pct * tdee_total
-
-            labels = ["BMR", "TEF", "EAT", "NEAT"]
-            sizes  = [bmr, tef, eat, neat]
+            labels = TDEE_LABELS
+            sizes, tdee_total = self.tdee_breakdown(bmr, activity_level)
             colors = ["#0080ff", '#ff9999', '#99ff99', '#ffcc99']
 
             def fmt(pct):
@@ -223,28 +250,8 @@ class RMRTest:
             bmr = getattr(self, "results", {}).get("Predicted RMR", 0)
             #print(f"Using BMR: {bmr}")
 
-            if activity_level is None:
-                activity_level = st.session_state.get("activity_level")
-
-            # Simple presets for EAT/NEAT (kcal/day).
-            presets = {
-                "sedentary":   {"eat": 100, "neat": 200},
-                "light":       {"eat": 200, "neat": 300},
-                "moderate":    {"eat": 300, "neat": 400},
-                "active":      {"eat": 450, "neat": 550},
-                "very active": {"eat": 600, "neat": 700},
-            }
-            eat = presets[activity_level]["eat"]
-            neat = presets[activity_level]["neat"]
-
-            # TEF as exact 10% of TDEE
-            tef_pct = 0.10
-            base = bmr + eat + neat
-            tdee_total = base / (1 - tef_pct) if base > 0 else 0.0
-            tef = tef_pct * tdee_total
-
-            labels = ["BMR", "TEF", "EAT", "NEAT"]
-            sizes  = [bmr, tef, eat, neat]
+            labels = TDEE_LABELS
+            sizes, tdee_total = self.tdee_breakdown(bmr, activity_level)
             colors = ["#0080ff", "#ff9100", "#fbff00", "#777777"]
 
             def fmt(pct):
@@ -268,22 +275,38 @@ class RMRTest:
             ("TDEE Breakdown", plot_tdee_pie),
         ]
 
-        return plot_functions       
-
-    def generate_report_data(self):
-        """Prepare client and test information to be displayed in the final PDF report."""
+        return plot_functions
+
+    def get_chart_functions(self):
+        """Browser-rendered (Vega-Lite) versions of get_plot_functions(), same titles and order."""
+
+        def chart_rmr_over_time(df):
+            points = self.plot_points(df, "REE")
+            layers = [charts.line(points["Time"], points["REE"], "RMR (kcal/day)", "blue")]
+            trend = self.ree_trend(df)
+            if trend is not None:
+                layers.append(charts.line(*trend, "Trend Line", "red", dashed=True))
+            steady_state = getattr(self, "results", {}).get("Steady State")
+            if steady_state:
+                layers.append(charts.band(steady_state["Start"], steady_state["End"], "Steady State"))
+            return charts.chart(layers, "Time (minutes)", "RMR (kcal/day)")
+
+        def chart_tdee(df):
+            sizes, tdee_total = self.tdee_breakdown(getattr(self, "results", {}).get("Avg RMR", 0))
+            text = [f"{size / tdee_total * 100 if tdee_total else 0:.1f}%\n({size:.0f} kcal)" for size in sizes]
+            return charts.pie(TDEE_LABELS, sizes, ["#0080ff", '#ff9999', '#99ff99', '#ffcc99'], text)
+
+        return [
+            ("RMR Over Time", chart_rmr_over_time),
+            ("TDEE Breakdown", chart_tdee),
+        ]
 
-        # Fetch selected document from session
-        document = st.session_state.get("selected_document")
-
-        # Error handling if no document loaded
-        if document is None:
-            st.error("No client data found.")
-            return None, None
+    def report_data(self):
+        """Client and test result tables for the PDF report, taken from the parsed document."""
 
         # Extract main sections
-        client_info = document["RMR Report Info"]["Client Info"]
-        test_protocol = document["RMR Report Info"]["Test Protocol"]
+        client_info = self.document["RMR Report Info"]["Client Info"]
+        test_protocol = self.document["RMR Report Info"]["Test Protocol"]
         results = test_protocol["Results"]
 
         # ==============================
@@ -308,6 +331,18 @@ class RMRTest:
             "RQ": results.get("RQ", 0.0),
         }
 
+        return client_info_for_pdf, test_results_for_pdf
+
+    def generate_report_data(self):
+        """Prepare client and test information to be displayed in the final PDF report."""
+
+        # Error handling if no document loaded
+        if self.document is None:
+            st.error("No client data found.")
+            return None, None
+
+        client_info_for_pdf, test_results_for_pdf = self.report_data()
+
         # ==============================
         # Store into Streamlit session for later use
         # (used during PDF generation)
@@ -322,8 +357,8 @@ class RMRTest:
         """Load an existing saved report from MongoDB into Streamlit session state."""
 
         report_col = self.db["reports"]
-        user_id = st.session_state.selected_client["_id"]
-        test_id = st.session_state.selected_test["_id"]
+        user_id = st.session_state.selected_client_id
+        test_id = st.session_state.selected_test_id
 
         # Search MongoDB for an existing report for this client and test
         report = report_col.find_one({"user_id": user_id, "test_id": test_id})
@@ -332,6 +367,10 @@ class RMRTest:
             # Restore Summary Text
             st.session_state.initial_report_text = report.get("summary", "")
 
+            # Restore the activity level used for the TDEE plots
+            st.session_state.activity_level = report.get("activity_level", "moderate")
+            st.session_state.activity_level_control = st.session_state.activity_level
+
             # ==============================
             # Restore Per-Plot Comments and Selection Flags
             # ==============================
@@ -365,9 +404,8 @@ class RMRTest:
         """Main function for building a report interactively inside Streamlit."""
 
         # Setup
-        df = st.session_state.get("df")
+        df = self.df
         plot_functions = self.get_plot_functions()
-        reports_col = self.db["reports"]
 
         # Initialize session state for plots if not already present
         if 'plot_comments' not in st.session_state:
@@ -375,7 +413,27 @@ class RMRTest:
         if 'include_plot_flags' not in st.session_state:
             st.session_state.include_plot_flags = {title: True for title, _ in plot_functions}
 
+        # Draft that batches comment/summary edits into one autosave write
+        self.draft = ReportDraft(
+            self.reports_col,
+            st.session_state.selected_client_id,
+            st.session_state.selected_test_id,
+            "RMR",
+            self.document.get("RMR Report Info", {}).get("Report Info", {}).get("Date", {}),
+            [title for title, _ in plot_functions]
+        )
+
+        # The activity level (picked above the plots) is saved with the report
+        activity_level = st.session_state.get("activity_level")
+        if activity_level and activity_level != self.draft.state.get("activity_level"):
+            self.draft.mark_activity_level(activity_level)
+
         st.subheader("📊 Plots & Comments")
+        self.autosave_section()
+
+        # Browser-drawn charts (no server-side rendering) unless the PDF look is asked for
+        backend = charts.chart_backend_selector()
+        chart_functions = dict(self.get_chart_functions()) if backend == "vega" else {}
 
         # ==============================
         # Plot Each Graph and Capture Comments
@@ -385,67 +443,66 @@ class RMRTest:
             st.markdown(f"---")
             st.markdown(f"### {title}")
 
-            # Plot the figure
-            height = 4
-            fig, ax = plt.subplots(figsize = (6,height))
-            func(ax, df)
-            fig.tight_layout()
-            st.pyplot(fig, use_container_width=False)
-
-            # Setup keys for session state
-            include_key = f"include_{i}"
-            comment_key = f"comment_{i}"
-            plot_flag_dict = st.session_state.include_plot_flags
-            comment_dict = st.session_state.plot_comments
-
-            # Text box for comment
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                with st.expander("Add Comments", expanded=False):
-                    st.markdown("<div style='max-width: 400px;'>", unsafe_allow_html=True)
-                    comment = st.text_area(
-                        "🗨️ Comments:",
-                        key=comment_key,
-                        height=100,
-                        value=comment_dict.get(title, "")
-                    )
-                    st.markdown("</div>", unsafe_allow_html=True)
-
-            # Checkbox for including/excluding this plot
-            with col2:
-                include = st.toggle("Include in Report", value=plot_flag_dict.get(title, True), key=include_key)
-
-            # ==============================
-            # Save Button for Each Section
-            # ==============================
-            if st.button(f"💾 Save '{title}' Section", key=f"save_{i}"):
-                # Update session
-                comment_dict[title] = comment
-                plot_flag_dict[title] = include
-
-                # Save the comment/inclusion immediately to MongoDB
-                user_id = st.session_state.selected_client["_id"]
-                test_id = st.session_state.selected_test["_id"]
-
-                self.db["reports"].update_one(
-                    {"user_id": user_id, "test_id": test_id},
-                    {
-                        "$set": {
-                            f"plots.{i}": {
-                                "index": i,
-                                "title": title,
-                                "comment": comment,
-                                "include": include
-                            },
-                            "last_updated": datetime.utcnow()
-                        },
-                        "$setOnInsert": {
-                            "summary": st.session_state.get("initial_report_text", "")
-                        }
-                    },
-                    upsert=True
+            # Plot the figure (only redrawn on full reruns, not when a comment changes)
+            if title in chart_functions:
+                with timed(f"chart:{title}"):
+                    charts.render_chart(chart_functions[title](df))
+            else:
+                height = 4
+                with timed(f"plot:{title}"):
+                    fig, ax = plt.subplots(figsize = (6,height))
+                    func(ax, df)
+                    fig.tight_layout()
+                    st.pyplot(fig, use_container_width=False)
+                    plt.close(fig)
+
+            # Comment box, include toggle and save button rerun on their own
+            self.plot_section(i, title)
+
+        # Summary text, "Save All" and PDF generation rerun on their own
+        self.summary_section(plot_functions)
+
+    @st.fragment(run_every=AUTOSAVE_DEBOUNCE_SECONDS)
+    def autosave_section(self):
+        """Autosave status line; reruns on a timer so settled edits get flushed."""
+        render_autosave_status(self.draft)
+
+    @st.fragment
+    def plot_section(self, i, title):
+        """Comment/include controls for one plot, rerun as an independent fragment."""
+
+        # Setup keys for session state
+        include_key = f"include_{i}"
+        comment_key = f"comment_{i}"
+        plot_flag_dict = st.session_state.include_plot_flags
+        comment_dict = st.session_state.plot_comments
+
+        # Text box for comment
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            with st.expander("Add Comments", expanded=False):
+                st.markdown("<div style='max-width: 400px;'>", unsafe_allow_html=True)
+                comment = st.text_area(
+                    "🗨️ Comments:",
+                    key=comment_key,
+                    height=100,
+                    value=comment_dict.get(title, "")
                 )
-                st.success(f"Saved section for '{title}' ✅")
+                st.markdown("</div>", unsafe_allow_html=True)
+
+        # Checkbox for including/excluding this plot
+        with col2:
+            include = st.toggle("Include in Report", value=plot_flag_dict.get(title, True), key=include_key)
+
+        # Track edits in the draft; autosave writes them together
+        if comment != comment_dict.get(title, "") or include != plot_flag_dict.get(title, True):
+            comment_dict[title] = comment
+            plot_flag_dict[title] = include
+            self.draft.mark_plot(i, title, comment, include)
+
+    @st.fragment
+    def summary_section(self, plot_functions):
+        """Summary text plus the save-all and PDF buttons, rerun as an independent fragment."""
 
         # ==============================
         # Summary Report Section
@@ -458,11 +515,14 @@ class RMRTest:
         if "initial_report_text" not in st.session_state:
             st.session_state.initial_report_text = ""
 
-        st.session_state.initial_report_text = st.text_area(
+        summary = st.text_area(
             "Enter your summary or interpretation:",
             value=st.session_state.initial_report_text,
             height=150
         )
+        if summary != st.session_state.initial_report_text:
+            st.session_state.initial_report_text = summary
+            self.draft.mark_summary(summary)
 
         # ==============================
         # Save All Sections Button
@@ -474,72 +534,39 @@ class RMRTest:
                 time.sleep(0.005)  # brief pause to show animation
                 progress_bar.progress(pct, "Saving all comments and selections...")
 
-            user_id = st.session_state.selected_client["_id"]
-            test_id = st.session_state.selected_test["_id"]
-            summary_text = st.session_state.initial_report_text
-
-            plots_data = []
+            # Mark every section dirty and write them all in one batched $set
             for i, (title, _) in enumerate(plot_functions):
                 comment = st.session_state.get(f"comment_{i}", "")
                 include = st.session_state.get(f"include_{i}", True)
 
                 st.session_state.plot_comments[title] = comment
                 st.session_state.include_plot_flags[title] = include
+                self.draft.mark_plot(i, title, comment, include)
+            self.draft.mark_summary(st.session_state.initial_report_text)
 
-                plots_data.append({
-                    "index": i,
-                    "title": title,
-                    "comment": comment,
-                    "include": include
-                })
-
-            # Also store the original test date in MongoDB
-            report_info = st.session_state.selected_test.get("RMR Report Info", {}).get("Report Info", {})
-            test_date = report_info.get("Date", {})
-
-            reports_col.update_one(
-                {"user_id": user_id, "test_id": test_id},
-                {
-                    "$set": {
-                        "user_id": user_id,
-                        "test_id": test_id,
-                        "test_type": "RMR",
-                        "summary": summary_text,
-                        "plots": plots_data,
-                        "last_updated": datetime.utcnow(),  # Date of report generation
-                        "test_date": test_date # Date of original test
-                    }
-                },
-                upsert=True
-            )
-            st.success("All comments and selections saved to MongoDB.")
-            st.balloons()
+            if self.draft.flush(immediate=True):
+                st.success("All comments and selections saved to MongoDB.")
+                st.balloons()
+            else:
+                st.warning("⚠️ Not saved: this report was changed by someone else. See the notice above the plots.")
 
         # Generate Final PDF Button
         if st.button("📄 Generate PDF Report"):
-            self.generate_report_data()
-            self.generate_pdf(self.s3_client)
-
-
-    def generate_pdf(self, s3_client):
-        """Generate the final PDF report from user inputs and upload it to S3."""
-
-        # Setup
-        df = st.session_state.get("df")
-        plot_functions = self.get_plot_functions()
-        client_data = st.session_state.get("client_data", {})
-        report_data = st.session_state.get("data", {})
-        plot_comments = st.session_state.get("plot_comments", {})
-        initial_report_text = st.session_state.get("initial_report_text", "")
+            # Persist pending edits before the PDF is built from them; never publish unsaved (conflicting) edits
+            if self.draft.flush(immediate=True):
+                self.generate_report_data()
+                self.generate_pdf(self.s3_client)
+            else:
+                st.warning("⚠️ PDF not generated: this report was changed by someone else. See the notice above the plots.")
 
-        # ==============================
-        # Build PDF filename (Name + Test Date)
-        # ==============================
 
-        name = client_data.get("Name", "Unknown")
+    def pdf_filename(self):
+        """File name of this test's PDF report: RMR_report_<Name>_<YYYY-MM-DD>.pdf."""
+        report_info = self.document.get("RMR Report Info", {})
+        name = report_info.get("Client Info", {}).get("Name") or "Unknown"
 
         # Extract test date for filename
-        date_dict = st.session_state.selected_test.get("RMR Report Info", {}).get("Report Info", {}).get("Date", {})
+        date_dict = report_info.get("Report Info", {}).get("Date", {})
         if isinstance(date_dict, dict):
             year = str(date_dict.get("Year", ""))
             month = str(date_dict.get("Month", "")).zfill(2)
@@ -556,8 +583,20 @@ class RMRTest:
         else:
             test_date_str = "unknown-date"
 
-        # Final filename
-        pdf_path = f"RMR_report_{name.replace(',', '').replace(' ', '_')}_{test_date_str}.pdf"
+        return f"RMR_report_{name.replace(',', '').replace(' ', '_')}_{test_date_str}.pdf"
+
+    @timed("build_pdf")
+    def build_pdf(self, output, client_data, rmr_data, plot_comments, include_flags, initial_report_text,
+                  activity_level=None, plot_format=None):
+        """Render the plots and lay out the PDF report into `output` (a path or binary file object).
+
+        Uses only its arguments and the parsed test, so batch jobs can call it outside a Streamlit session.
+        plot_format: "svg" (vector plots, the default when svglib is installed), "png" or "jpeg".
+        """
+        df = self.df
+        if activity_level is not None:
+            self.activity_level = activity_level
+        plot_functions = self.get_plot_functions()
 
         pdf_buffers = []
 
@@ -565,7 +604,6 @@ class RMRTest:
         # Create Plot Images
         # ==============================
 
-        include_flags = st.session_state.get("include_plot_flags", {})
         for plot_name, func in plot_functions:
             if not include_flags.get(plot_name, True):
                 continue  # Skip plots that user chose not to include
@@ -581,42 +619,24 @@ class RMRTest:
                     text.set_fontsize(10)
             plt.tight_layout()
 
-            buf = io.BytesIO()
-            fig.savefig(buf, format="PNG")
-            buf.seek(0)
-            pdf_buffers.append((plot_name, buf, plot_comments.get(plot_name, "")))
+            graphic = render_figure(fig, plot_format)
+            pdf_buffers.append((plot_name, graphic, plot_comments.get(plot_name, "")))
             plt.close(fig)
 
-        DEBUG = False
-
-        doc = SimpleDocTemplate(
-            pdf_path,
-            pagesize=landscape(LETTER),  
-            leftMargin=20,
-            rightMargin=20,
-            topMargin=0,
-            bottomMargin=30
-        )
-
-        styles = getSampleStyleSheet()
+        # Page template, footer and styles are prepared once (utils/report_layout.py)
+        doc = rmr_document(output)
+        styles = report_styles()
         story = []
 
         # === Add Logo ===
 
         story.append(Spacer(1, -20))
-        logo_path = "graphics/CHAMPlogo.png"
-        if logo_path and os.path.exists(logo_path):
-            logo = Image(logo_path, width=100, height=100)
+        logo = logo_flowable(100, 100)  # decoded once per process
+        if logo:
             # put logo inside a 1x1 table so we can draw a border around it
             logo_table = Table([[logo]], colWidths=[100], rowHeights=[100])
-            logo_table.setStyle([
-                ("VALIGN", (0,0), (-1,-1), "TOP"),
-                ("ALIGN",  (0,0), (-1,-1), "CENTER"),
-                *([("BOX", (0,0), (-1,-1), 1, colors.blue)] if DEBUG else []),
-            ])
+            logo_table.setStyle(RMR_LOGO_STYLE)
             story.append(logo_table)
-        else:
-            st.warning("Logo file not found, skipping logo in PDF.")
 
         story.append(Spacer(1, -20))
 
@@ -625,22 +645,15 @@ class RMRTest:
         subtitle_para = Paragraph('<para align="center">Southern Connecticut State University</para>', styles["Heading2"])
 
         title_block = Table([[title_para], [subtitle_para]], colWidths=[doc.width])
-        title_block.setStyle([
-            ("ALIGN", (0,0), (-1,-1), "CENTER"),
-            ("VALIGN",(0,0), (-1,-1), "MIDDLE"),
-            ("TOPPADDING", (0,0), (-1,-1), 4),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 4),
-            *([("BOX", (0,0), (-1,-1), 1, colors.green)] if DEBUG else []),
-        ])
+        title_block.setStyle(RMR_TITLE_STYLE)
         story.append(title_block)
         story.append(Spacer(1, 5))
 
         # Two Tables for Client Info and Test Results
-        client_info = st.session_state.get("client_data", {})
-        test_results = st.session_state.get("rmr_data", {})
+        client_info = client_data
+        test_results = rmr_data
         if not client_info or not test_results:
-            st.error("Client data or test results are missing.")
-            return
+            return None  # reported by the caller (generate_pdf / batch result)
         
         # === Client Info Table ===
         client_info_data = [
@@ -653,14 +666,7 @@ class RMRTest:
         ]
 
         client_info_table = Table(client_info_data, colWidths=[100, 140])
-        client_info_table.setStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E6F2FF")),  
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.HexColor("#0077CC")),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),   
-            ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-            ("GRID", (0, 0), (-1, -1), 1, colors.grey),
-        ])
+        client_info_table.setStyle(RMR_CLIENT_TABLE_STYLE)
         client_info_table.hAlign = "LEFT"
 
         #story.append(client_info_table)
@@ -676,32 +682,11 @@ class RMRTest:
         
         test_results_table = Table(test_results_data, colWidths=[140, 100])
 
-        # --- base style ---
-        style = [
-            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E6F2FF")),  
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.HexColor("#0077CC")),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),   
-            ("ALIGN", (0,0), (-1,-1), "LEFT"),
-            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ]
-
-        # --- styling for texts ---
-        style += [
-            ("TEXTCOLOR", (1,1), (1,1), colors.red),   # Avg RMR value
-            ("FONTNAME",  (0,1), (1,1), "Helvetica-Bold"),  # Avg RMR row bold
-
-            ("TEXTCOLOR", (1,3), (1,3), colors.red),  # RQ value
-            ("FONTNAME",  (0,3), (1,3), "Helvetica-Bold"),  # RQ row bold
-        ]
-
-        test_results_table.setStyle(TableStyle(style))
+        test_results_table.setStyle(RMR_RESULTS_TABLE_STYLE)  # Avg RMR / RQ rows highlighted
 
-        # --- helper to convert a buffer to an Image flowable ---
-        def _img(buf, w, h):
-            im = Image(buf, width=w, height=h)
-            im.hAlign = "CENTER"
-            return im
+        # --- helper to size a captured plot (vector drawing or PNG) ---
+        def _img(graphic, w, h):
+            return plot_flowable(graphic, w, h)
 
         # --- pull RMR chart safely ---
         chart_buf = pdf_buffers[0] if len(pdf_buffers) > 0 else None
@@ -720,36 +705,18 @@ class RMRTest:
             [test_results_table]],
             colWidths=[left_w]
         )
-        left_stack.setStyle([
-            ("LEFTPADDING",  (0,0), (-1,-1), 0),
-            ("RIGHTPADDING", (0,0), (-1,-1), 0),
-            ("TOPPADDING",   (0,0), (-1,-1), 0),
-            ("BOTTOMPADDING",(0,0), (-1,-1), 0),
-        ] + ([("BOX",(0,0),(-1,-1),0.75,colors.red)] if DEBUG else []))
+        left_stack.setStyle(RMR_LEFT_STACK_STYLE)
 
         # --- right: single image or spacer ---
         right_cell = _img(chart_data, right_w, chart_h) if chart_data else Spacer(1, chart_h)
 
         right_column = Table([[right_cell]], colWidths=[right_w])
-        right_column.setStyle([
-            ("LEFTPADDING",  (0,0), (-1,-1), 0),
-            ("RIGHTPADDING", (0,0), (-1,-1), 0),
-            ("TOPPADDING",   (0,0), (-1,-1), 0),
-            ("BOTTOMPADDING",(0,0), (-1,-1), 0),
-            ("ALIGN", (0,0), (-1,-1), "CENTER"),
-            ("VALIGN",(0,0), (-1,-1), "MIDDLE"),
-        ] + ([("BOX",(0,0),(-1,-1),0.75,colors.green)] if DEBUG else []))
+        right_column.setStyle(RMR_CHART_CELL_STYLE)
 
         # --- outer table: [ left_stack | right_column ] ---
         main_top = Table([[left_stack, right_column]], colWidths=[left_w, right_w])
         main_top.hAlign = "CENTER"
-        main_top.setStyle([
-            ("VALIGN",      (0,0), (-1,-1), "TOP"),
-            ("LEFTPADDING", (0,0), (-1,-1), 0),
-            ("RIGHTPADDING",(0,0), (-1,-1), 0),
-            ("TOPPADDING",  (0,0), (-1,-1), 0),
-            ("BOTTOMPADDING",(0,0),(-1,-1), 0),
-        ])
+        main_top.setStyle(RMR_TOP_ROW_STYLE)
 
         story.append(main_top)
         story.append(Spacer(1, 12))
@@ -767,7 +734,7 @@ class RMRTest:
             img_cell.hAlign = "LEFT"
 
         # --- summary block ---
-        summary_text = st.session_state.get("initial_report_text") or "No report provided."
+        summary_text = initial_report_text or "No report provided."
         summary_block = KeepInFrame(
             sum_w, pie_h,
             [
@@ -784,15 +751,7 @@ class RMRTest:
             colWidths=[pie_w, sum_w],
             rowHeights=[pie_h]
         )
-        pie_table.setStyle(TableStyle([
-            ("VALIGN",       (0, 0), (-1, -1), "TOP"),
-            ("ALIGN",        (0, 0), (0, 0),   "LEFT"),   # left column left-aligned
-            ("LEFTPADDING",  (0, 0), (-1, -1), 2),
-            ("RIGHTPADDING", (0, 0), (-1, -1), 2),
-            ("TOPPADDING",   (0, 0), (-1, -1), 2),
-            ("BOTTOMPADDING",(0, 0), (-1, -1), 2),
-            # ("GRID", (0,0), (-1,-1), 0.25, colors.grey),  # debug
-        ]))
+        pie_table.setStyle(RMR_PIE_ROW_STYLE)
 
         story.append(KeepTogether([pie_table, Spacer(1, 6)]))
 
@@ -805,22 +764,44 @@ class RMRTest:
             story.append(Paragraph(comment, styles["Normal"]))
             story.append(Spacer(1, 6))
 
-        # === Footer with Solid Blue Line ===
-        def footer(canvas, doc):
-            canvas.saveState()
-            canvas.setFillColor(colors.HexColor("#0077CC"))  # solid blue
-            canvas.rect(
-                x=doc.leftMargin,
-                y=15,  # 15 points from bottom
-                width=doc.width,
-                height=10,
-                fill=True,
-                stroke=0
+        # Build PDF 
+        doc.build(story)  # the page template draws the blue footer line
+        return output
+
+    def generate_pdf(self, s3_client):
+        """Generate the final PDF report from user inputs and upload it to S3."""
+
+        # Setup
+        client_data = st.session_state.get("client_data", {})
+        rmr_data = st.session_state.get("rmr_data", {})
+        plot_comments = st.session_state.get("plot_comments", {})
+        include_flags = st.session_state.get("include_plot_flags", {})
+        initial_report_text = st.session_state.get("initial_report_text", "")
+        activity_level = self.activity_level or st.session_state.get("activity_level")
+
+        # Reuse the last uploaded PDF when nothing it was built from has changed
+        report_key = {"user_id": st.session_state.selected_client_id, "test_id": st.session_state.selected_test_id}
+        fingerprint = report_fingerprint(
+            self.document, [title for title, _ in self.get_plot_functions()],
+            plot_comments, include_flags, initial_report_text, activity_level
+        )
+        existing_key = current_pdf(s3_client, self.reports_col.find_one(report_key, {"pdf": 1}), fingerprint)
+        if existing_key:
+            url = s3_client.generate_presigned_url(
+                "get_object", Params={"Bucket": BUCKET_NAME, "Key": existing_key}, ExpiresIn=3600
             )
-            canvas.restoreState()
+            st.success("✅ Report unchanged since it was last generated, using the existing PDF.")
+            st.link_button("📥 Download PDF", url)
+            st.session_state.reviewing = False
+            return
 
-        # Build PDF 
-        doc.build(story, onFirstPage=footer, onLaterPages=footer)
+        # Final filename (Name + Test Date)
+        pdf_path = self.pdf_filename()
+
+        if self.build_pdf(pdf_path, client_data, rmr_data, plot_comments, include_flags, initial_report_text,
+                          activity_level=activity_level) is None:
+            st.error("Client data or test results are missing.")
+            return
 
         st.success("✅ PDF generated successfully!")
         #st.write("PDF saved as:", pdf_path)
@@ -830,22 +811,24 @@ class RMRTest:
             st.download_button("📥 Download PDF", f, file_name=pdf_path)
 
         # Upload to AWS S3
-        # bucket_name = "champ-hpl-bucket"
-        # s3_key = f"reports/{os.path.basename(pdf_path)}"
-
-        # try:
-        #     s3_client.upload_file(
-        #         Filename=pdf_path,
-        #         Bucket=bucket_name,
-        #         Key=s3_key,
-        #         ExtraArgs={
-        #             "ContentType": "application/pdf",
-        #             "ContentDisposition": "inline"
-        #         }
-        #     )
-        #     st.success("📤 Report successfully uploaded to S3!")
-        # except Exception as e:
-        #     st.error(f"❌ Upload failed: {e}")
+        s3_key = f"reports/{os.path.basename(pdf_path)}"
+
+        # Multipart-tuned upload with retries (utils/storage.py)
+        upload = upload_path(s3_client, pdf_path, s3_key)
+        if upload["error"]:
+            st.error(f"❌ Upload failed: {upload['error']}")
+        else:
+            st.success(f"📤 Report successfully uploaded to S3! ({upload['seconds']:.1f}s)")
+
+            # First-page preview for the report viewer
+            with open(pdf_path, "rb") as f:
+                preview_key = store_thumbnail(s3_client, f.read(), s3_key)
+            try:
+                record_pdf(self.reports_col, report_key["user_id"], report_key["test_id"],
+                           fingerprint, s3_key, uploaded_etag(s3_client, s3_key), preview_key,
+                           test_type=self.draft.test_type, test_date=self.draft.test_date)
+            except Exception as e:
+                st.warning(f"⚠️ PDF uploaded, but its fingerprint could not be recorded ({e}); it will be rebuilt next time.")
 
         # Reset session state
         st.session_state.reviewing = False
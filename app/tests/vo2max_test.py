@@ -1,70 +1,69 @@
-import pandas as pd
-from pymongo import MongoClient
 import streamlit as st
 import matplotlib.pyplot as plt
 import os
-from dotenv import load_dotenv, find_dotenv
-import boto3
-from reportlab.platypus import (BaseDocTemplate, Frame, PageTemplate, FrameBreak,
-                                Paragraph, Spacer, Table, TableStyle, Image, NextPageTemplate,
-                                PageBreak)
-from reportlab.lib.pagesizes import LETTER
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from reportlab.platypus import Image as RLImage
-import io
-import numpy as np
-from datetime import datetime
+from reportlab.platypus import FrameBreak, Paragraph, Spacer, Table, NextPageTemplate, PageBreak
+from utils.data_cache import get_database, get_s3_client
+from utils.test_frames import load_test_frame, load_plot_frames
+from analysis.resample import AVERAGING_OPTIONS, load_resampled_frame
+from analysis.fits import load_test_fits, compute_fits
+from utils.metrics import timed
+from utils.report_drafts import ReportDraft, AUTOSAVE_DEBOUNCE_SECONDS, render_autosave_status
+from utils.report_graphics import render_figure, plot_flowable
+from utils import report_charts as charts
+from utils.report_assets import logo_flowable
+from utils.report_layout import (vo2max_document, report_styles, VO2_PLOT_WIDTH, VO2_PLOT_HEIGHT,
+                                 VO2_CLIENT_TABLE_STYLE, VO2_RESULTS_TABLE_STYLE)
+from utils.report_fingerprint import report_fingerprint, current_pdf, uploaded_etag, record_pdf
+from utils.storage import upload_path, BUCKET_NAME
+from utils.report_thumbnails import store_thumbnail
 
 class VO2MaxTest:
-    def __init__(self, user_id=None):
-        """Initialize database connection, S3 client, and prepare environment."""
+    def __init__(self, user_id=None, connect=True):
+        """Initialize database connection, S3 client, and prepare environment.
+
+        connect=False skips the MongoDB / S3 handles: enough to parse a document and build its PDF
+        (batch render workers), not for the builder.
+        """
         self.user_id = user_id
 
-        # Load environment variables (.env)
-        load_dotenv()
-
-        # Setup MongoDB connection
-        database_credentials = os.getenv("database_credentials")
-        self.client = MongoClient(database_credentials)
-        self.db = self.client['performance-lab']
-        self.collection = self.db['tests']  
-        self.users_col = self.db['users']
-        self.reports_col = self.db['reports']
-
-        # Setup AWS S3 connection for storing PDFs
-        aws_access_key_id = os.getenv("aws_access_key_id")
-        aws_secret_access_key = os.getenv("aws_secret_access_key")
-
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name='us-east-1'
-        )
+        # Shared (process-wide) MongoDB and S3 handles
+        self.db = self.client = self.collection = self.users_col = self.reports_col = self.s3_client = None
+        if connect:
+            self.db = get_database()
+            self.client = self.db.client
+            self.collection = self.db['tests']
+            self.users_col = self.db['users']
+            self.reports_col = self.db['reports']
+            self.s3_client = get_s3_client()
+
+        # Filled in by parse_test (per rerun, never stored in session state)
+        self.document = None
+        self.df = None
+        self.plot_frames = {}
+        self.fits = None
 
     def parse_test(self, document):
-        """Parse the provided VO2 Max document and load it into Streamlit session."""
+        """Parse the provided VO2 Max document into client info, protocol, results and a DataFrame."""
         try:
-            # Save entire document to session
-            st.session_state.selected_document = document
+            # Keep the document on the instance; session state only holds its id
+            self.document = document
 
             # Break apart key data sections
             report_info = document["VO2 Max Report Info"]
             client_info = report_info["Client Info"]
             test_protocol = report_info["Test Protocol"]
             results = test_protocol["Results"]
-            tabular_data = report_info["Tabular Data"]
 
-            # Convert tabular data into dataframe for easy use
-            df = pd.DataFrame(tabular_data)
+            # Shared, read-only frame (VO2/VCO2 already rescaled to mL), memoized per test id/version
+            df = load_test_frame(document)
+
+            self.df = df
 
-            # Rescale VO2 and VCO2 to mL (stored as L originally)
-            columns_to_convert = ['VO2 STPD', 'VCO2 STPD']
-            df[columns_to_convert] = df[columns_to_convert] * 1000
+            # Downsampled copies of the plotted channels (analysis/downsample.py), shared the same way
+            self.plot_frames = load_plot_frames(document)
 
-            # Store DataFrame in session
-            st.session_state.df = df
+            # Trendlines / V-Slope threshold, fit once per test (analysis/fits.py)
+            self.fits = load_test_fits(document)
 
             return client_info, test_protocol, results, df
 
@@ -72,40 +71,40 @@ class VO2MaxTest:
             st.error(f"Failed to parse test document: {e}")
             return None
         
-    def get_plot_functions(self):
-        """Return list of plotting functions for different VO2 Max test metrics."""
-        df = st.session_state.get("df")
+    def plot_points(self, df, channel):
+        """Frame the scatter of `channel` draws from: its downsampled series, else the full frame."""
+        points = self.plot_frames.get(channel)
+        return points if points is not None else df
 
-        # --- Plot: V-Slope Analysis ---
-        def plot_vslope(ax, df):
-            """Plot V-Slope (VO2 vs VCO2) and determine ventilatory threshold."""
-            ax.scatter(df['VO2 STPD'], df['VCO2 STPD'], label='V-Slope', marker='o', s=10)
+    def plot_fits(self, df):
+        """Fits of the parsed test (shared cache), or computed from `df` when parse_test didn't load them."""
+        return self.fits if self.fits is not None else compute_fits(df, "VO2 Max")
+
+    def trendline(self, df, column):
+        """(x, y) of the cubic trend of `column` over Time, fit on the full frame."""
+        return self.plot_fits(df)["trend"][column]
 
-            # Sort data to fit two linear trends
-            sorted_data = df.sort_values('VO2 STPD')
-            vo2_values = sorted_data['VO2 STPD'].values
-            vco2_values = sorted_data['VCO2 STPD'].values
-            mid_point = len(vo2_values) // 2
+    def vslope_fit(self, df):
+        """V-Slope lines fit below/above the VO2 midpoint: ((x, y) pre, (x, y) post, threshold VO2)."""
+        return self.plot_fits(df)["vslope"]
 
-            # Fit trendlines before and after midpoint
-            z1 = np.polyfit(vo2_values[:mid_point], vco2_values[:mid_point], 1)
-            p1 = np.poly1d(z1)
+    def get_plot_functions(self):
+        """Return list of plotting functions for different VO2 Max test metrics.
 
-            z2 = np.polyfit(vo2_values[mid_point:], vco2_values[mid_point:], 1)
-            p2 = np.poly1d(z2)
+        Scatters draw the downsampled series (plot_points); trendlines and thresholds are fit on the full frame.
+        """
 
-            # Find intersection (threshold)
-            a, b = z1
-            c, d = z2
-            intersection_x = (d - b) / (a - c)
-            intersection_y = p1(intersection_x)
+        # --- Plot: V-Slope Analysis ---
+        def plot_vslope(ax, df):
+            """Plot V-Slope (VO2 vs VCO2) and determine ventilatory threshold."""
+            points = self.plot_points(df, 'VCO2 STPD')
+            ax.scatter(points['VO2 STPD'], points['VCO2 STPD'], label='V-Slope', marker='o', s=10)
 
-            # Create separate line ranges before/after threshold
-            x_range1 = np.linspace(vo2_values.min(), vo2_values.max() - 700, 50)
-            x_range2 = np.linspace(vo2_values.min() + 1100, vo2_values.max(), 50)
+            # Trendlines before/after the threshold (fit on the full frame)
+            (x_range1, y_range1), (x_range2, y_range2), intersection_x = self.vslope_fit(df)
 
-            ax.plot(x_range1, p1(x_range1), '--', color='green', label='Pre-threshold')
-            ax.plot(x_range2, p2(x_range2), '--', color='red', label='Post-threshold')
+            ax.plot(x_range1, y_range1, '--', color='green', label='Pre-threshold')
+            ax.plot(x_range2, y_range2, '--', color='red', label='Post-threshold')
             ax.axvline(x=intersection_x, color='blue', linestyle=':', label='Threshold')
 
             # Formatting
@@ -118,13 +117,12 @@ class VO2MaxTest:
         # --- Plot: VO2 Over Time ---
         def plot_vo2(ax, df):
             """Plot VO2 uptake over time with a smoothed trendline."""
-            ax.scatter(df['Time'], df['VO2 STPD'], label='VO2 ml', marker='o', s=10)
+            points = self.plot_points(df, 'VO2 STPD')
+            ax.scatter(points['Time'], points['VO2 STPD'], label='VO2 ml', marker='o', s=10)
 
             # Trendline (3rd degree polynomial)
-            z = np.polyfit(df['Time'], df['VO2 STPD'], 3)
-            p = np.poly1d(z)
-            x_trend = np.linspace(df['Time'].min(), df['Time'].max(), 100)
-            ax.plot(x_trend, p(x_trend), '--', color='blue', label='VO2 Trend')
+            x_trend, y_trend = self.trendline(df, 'VO2 STPD')
+            ax.plot(x_trend, y_trend, '--', color='blue', label='VO2 Trend')
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("VO2 STPD (mL/min)", fontweight='bold')
@@ -135,7 +133,8 @@ class VO2MaxTest:
         # --- Plot: Heart Rate ---
         def plot_hr(ax, df):
             """Plot Heart Rate over time."""
-            ax.scatter(df['Time'], df['HR'], label='Heart Rate', marker='o', s=10)
+            points = self.plot_points(df, 'HR')
+            ax.scatter(points['Time'], points['HR'], label='Heart Rate', marker='o', s=10)
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("Heart Rate (bpm)", fontweight='bold')
@@ -146,13 +145,12 @@ class VO2MaxTest:
         # --- Plot: Fat and Carbohydrate Oxidation ---
         def plot_fat_cho(ax, df):
             """Plot fat and carbohydrate (CHO) oxidation rates over time."""
-            ax.scatter(df['Time'], df['FATmin'], label='Fat Ox (g/min)', marker='o', color='tab:blue', s=10)
+            fat = self.plot_points(df, 'FATmin')
+            ax.scatter(fat['Time'], fat['FATmin'], label='Fat Ox (g/min)', marker='o', color='tab:blue', s=10)
             
             # Fat Oxidation trendline
-            z = np.polyfit(df['Time'], df['FATmin'], 3)
-            p = np.poly1d(z)
-            x_trend = np.linspace(df['Time'].min(), df['Time'].max(), 100)
-            ax.plot(x_trend, p(x_trend), '--', color='blue', label='Fat Ox Trend')
+            x_trend, y_trend = self.trendline(df, 'FATmin')
+            ax.plot(x_trend, y_trend, '--', color='blue', label='Fat Ox Trend')
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("Fat Oxidation (g/min)", fontweight='bold', color='tab:blue')
@@ -160,7 +158,8 @@ class VO2MaxTest:
 
             # CHO Oxidation on secondary axis
             ax2 = ax.twinx()
-            ax2.scatter(df['Time'], df['CHOmin'], label='CHO Ox (g/min)', marker='o', color='tab:orange', s=10)
+            cho = self.plot_points(df, 'CHOmin')
+            ax2.scatter(cho['Time'], cho['CHOmin'], label='CHO Ox (g/min)', marker='o', color='tab:orange', s=10)
             ax2.set_ylabel("CHO Oxidation (g/min)", fontweight='bold', color='tab:orange')
             ax2.tick_params(axis='y', labelcolor='tab:orange')
 
@@ -170,21 +169,21 @@ class VO2MaxTest:
         # --- Plot: Ventilatory Equivalents + CO2 ---
         def plot_vent_co2(ax, df):
             """Plot ventilatory equivalents (VE/VO2, VE/VCO2) and PetCO2 over time."""
-            ax.scatter(df['Time'], df['VE/VO2'], label='VE/VO2', marker='o', color='tab:blue', s=10)
-            ax.scatter(df['Time'], df['VE/VCO2'], label='VE/VCO2', marker='o', color='tab:green', s=10)
+            ve_vo2, ve_vco2 = self.plot_points(df, 'VE/VO2'), self.plot_points(df, 'VE/VCO2')
+            ax.scatter(ve_vo2['Time'], ve_vo2['VE/VO2'], label='VE/VO2', marker='o', color='tab:blue', s=10)
+            ax.scatter(ve_vco2['Time'], ve_vco2['VE/VCO2'], label='VE/VCO2', marker='o', color='tab:green', s=10)
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("VE/VO2 & VE/VCO2", fontweight='bold', color='tab:blue')
             ax.tick_params(axis='y', labelcolor='tab:blue')
 
             ax2 = ax.twinx()
-            ax2.scatter(df['Time'], df['PetCO2'], label='PetCO2', marker='o', color='tab:orange', s=10)
+            pet = self.plot_points(df, 'PetCO2')
+            ax2.scatter(pet['Time'], pet['PetCO2'], label='PetCO2', marker='o', color='tab:orange', s=10)
 
             # Trendline for PetCO2
-            z = np.polyfit(df['Time'], df['PetCO2'], 3)
-            p = np.poly1d(z)
-            x_trend = np.linspace(df['Time'].min(), df['Time'].max(), 100)
-            ax2.plot(x_trend, p(x_trend), '--', color='orange', label='PetCO2 Trend')
+            x_trend, y_trend = self.trendline(df, 'PetCO2')
+            ax2.plot(x_trend, y_trend, '--', color='orange', label='PetCO2 Trend')
 
             ax2.set_ylabel("PetCO2", fontweight='bold', color='tab:orange')
             ax2.tick_params(axis='y', labelcolor='tab:orange')
@@ -207,21 +206,21 @@ class VO2MaxTest:
         # --- Plot: Ventilatory Equivalents + O2 ---
         def plot_vent_o2(ax, df):
             """Plot ventilatory equivalents (VE/VO2, VE/VCO2) and PetO2 over time."""
-            ax.scatter(df['Time'], df['VE/VO2'], label='VE/VO2', marker='o', color='tab:blue', s=10)
-            ax.scatter(df['Time'], df['VE/VCO2'], label='VE/VCO2', marker='o', color='tab:green', s=10)
+            ve_vo2, ve_vco2 = self.plot_points(df, 'VE/VO2'), self.plot_points(df, 'VE/VCO2')
+            ax.scatter(ve_vo2['Time'], ve_vo2['VE/VO2'], label='VE/VO2', marker='o', color='tab:blue', s=10)
+            ax.scatter(ve_vco2['Time'], ve_vco2['VE/VCO2'], label='VE/VCO2', marker='o', color='tab:green', s=10)
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("VE/VO2 & VE/VCO2", fontweight='bold', color='tab:blue')
             ax.tick_params(axis='y', labelcolor='tab:blue')
 
             ax2 = ax.twinx()
-            ax2.scatter(df['Time'], df['PetO2'], label='PetO2', marker='o', color='tab:orange', s=10)
+            pet = self.plot_points(df, 'PetO2')
+            ax2.scatter(pet['Time'], pet['PetO2'], label='PetO2', marker='o', color='tab:orange', s=10)
 
             # Trendline for PetO2
-            z = np.polyfit(df['Time'], df['PetO2'], 3)
-            p = np.poly1d(z)
-            x_trend = np.linspace(df['Time'].min(), df['Time'].max(), 100)
-            ax2.plot(x_trend, p(x_trend), '--', color='orange', label='PetO2 Trend')
+            x_trend, y_trend = self.trendline(df, 'PetO2')
+            ax2.plot(x_trend, y_trend, '--', color='orange', label='PetO2 Trend')
 
             ax2.set_ylabel("PetO2", fontweight='bold', color='tab:orange')
             ax2.tick_params(axis='y', labelcolor='tab:orange')
@@ -244,7 +243,8 @@ class VO2MaxTest:
         # --- Plot: Respiratory Exchange Ratio (RER) ---
         def plot_rer(ax, df):
             """Plot Respiratory Exchange Ratio (RER) over time."""
-            ax.scatter(df['Time'], df['RER'], label='RER', marker='o', s=10)
+            points = self.plot_points(df, 'RER')
+            ax.scatter(points['Time'], points['RER'], label='RER', marker='o', s=10)
 
             ax.set_xlabel("Time (minutes)", fontweight='bold')
             ax.set_ylabel("RER", fontweight='bold')
@@ -263,22 +263,69 @@ class VO2MaxTest:
             ("Respiratory Exchange Ratio over Time", plot_rer),
         ]
 
-        return plot_functions       
-
-    def generate_report_data(self):
-        """Prepare client and test information to be displayed in the final PDF report."""
+        return plot_functions
+
+    def get_chart_functions(self):
+        """Browser-rendered (Vega-Lite) versions of get_plot_functions(), same titles and order."""
+        time_title = "Time (minutes)"
+
+        def series(df, channel, label, color="tab:blue", axis="left"):
+            points = self.plot_points(df, channel)
+            return charts.scatter(points['Time'], points[channel], label, color, axis)
+
+        def chart_vslope(df):
+            points = self.plot_points(df, 'VCO2 STPD')
+            (x_range1, y_range1), (x_range2, y_range2), intersection_x = self.vslope_fit(df)
+            return charts.chart([
+                charts.scatter(points['VO2 STPD'], points['VCO2 STPD'], 'V-Slope'),
+                charts.line(x_range1, y_range1, 'Pre-threshold', 'green', dashed=True),
+                charts.line(x_range2, y_range2, 'Post-threshold', 'red', dashed=True),
+                charts.rule(intersection_x, 'Threshold', 'blue'),
+            ], "VO2 STPD (mL/min)", "VCO2 STPD (mL/min)")
+
+        def chart_vo2(df):
+            return charts.chart([
+                series(df, 'VO2 STPD', 'VO2 ml'),
+                charts.line(*self.trendline(df, 'VO2 STPD'), 'VO2 Trend', 'blue', dashed=True),
+            ], time_title, "VO2 STPD (mL/min)")
+
+        def chart_hr(df):
+            return charts.chart([series(df, 'HR', 'Heart Rate')], time_title, "Heart Rate (bpm)")
+
+        def chart_fat_cho(df):
+            return charts.chart([
+                series(df, 'FATmin', 'Fat Ox (g/min)'),
+                charts.line(*self.trendline(df, 'FATmin'), 'Fat Ox Trend', 'blue', dashed=True),
+                series(df, 'CHOmin', 'CHO Ox (g/min)', 'tab:orange', axis="right"),
+            ], time_title, "Fat Oxidation (g/min)", "CHO Oxidation (g/min)")
+
+        def chart_vent(df, pet):
+            return charts.chart([
+                series(df, 'VE/VO2', 'VE/VO2'),
+                series(df, 'VE/VCO2', 'VE/VCO2', 'tab:green'),
+                series(df, pet, pet, 'tab:orange', axis="right"),
+                charts.line(*self.trendline(df, pet), f'{pet} Trend', 'orange', dashed=True, axis="right"),
+            ], time_title, "VE/VO2 & VE/VCO2", pet)
+
+        def chart_rer(df):
+            return charts.chart([series(df, 'RER', 'RER')], time_title, "RER")
+
+        return [
+            ("V-Slope", chart_vslope),
+            ("VO2 ml over Time", chart_vo2),
+            ("Heart Rate over Time", chart_hr),
+            ("Fat and CHO Ox over Time", chart_fat_cho),
+            ("Ventilatory Equivalents & End Tidal CO2 Tension", lambda df: chart_vent(df, 'PetCO2')),
+            ("Ventilatory Equivalents & End Tidal O2 Tension", lambda df: chart_vent(df, 'PetO2')),
+            ("Respiratory Exchange Ratio over Time", chart_rer),
+        ]
 
-        # Fetch selected document from session
-        document = st.session_state.get("selected_document")
-
-        # Error handling if no document loaded
-        if document is None:
-            st.error("No client data found.")
-            return None, None
+    def report_data(self):
+        """Client and test result tables for the PDF report, taken from the parsed document."""
 
         # Extract main sections
-        client_info = document["VO2 Max Report Info"]["Client Info"]
-        test_protocol = document["VO2 Max Report Info"]["Test Protocol"]
+        client_info = self.document["VO2 Max Report Info"]["Client Info"]
+        test_protocol = self.document["VO2 Max Report Info"]["Test Protocol"]
         results = test_protocol["Results"]
 
         # ==============================
@@ -312,6 +359,33 @@ class VO2MaxTest:
             "VO2max Percentile": results.get("VO2max Percentile", "N/A")
         }
 
+        # Substrate results (tests ingested with the substrate analysis)
+        substrate = results.get("Substrate")
+        if substrate:
+            intensity = substrate["Intensity"]
+            test_results_for_pdf["FATmax (g/min)"] = substrate["FATmax"]
+            test_results_for_pdf["FATmax Intensity"] = (
+                f"{substrate['FATmax Intensity']:.0f} {intensity}"
+                + (f" (HR {substrate['FATmax HR']})" if substrate.get("FATmax HR") else "")
+            )
+            if substrate.get("Crossover Intensity") is not None:
+                test_results_for_pdf["CHO/Fat Crossover"] = (
+                    f"{substrate['Crossover Intensity']:.0f} {intensity}"
+                    + (f" (HR {substrate['Crossover HR']})" if substrate.get("Crossover HR") else "")
+                )
+
+        return client_info_for_pdf, test_results_for_pdf
+
+    def generate_report_data(self):
+        """Prepare client and test information to be displayed in the final PDF report."""
+
+        # Error handling if no document loaded
+        if self.document is None:
+            st.error("No client data found.")
+            return None, None
+
+        client_info_for_pdf, test_results_for_pdf = self.report_data()
+
         # ==============================
         # Store into Streamlit session for later use
         # (used during PDF generation)
@@ -326,8 +400,8 @@ class VO2MaxTest:
         """Load an existing saved report from MongoDB into Streamlit session state."""
 
         report_col = self.db["reports"]
-        user_id = st.session_state.selected_client["_id"]
-        test_id = st.session_state.selected_test["_id"]
+        user_id = st.session_state.selected_client_id
+        test_id = st.session_state.selected_test_id
 
         # Search MongoDB for an existing report for this client and test
         report = report_col.find_one({"user_id": user_id, "test_id": test_id})
@@ -369,9 +443,8 @@ class VO2MaxTest:
         """Main function for building a VO2 Max report interactively inside Streamlit."""
 
         # Setup
-        df = st.session_state.get("df")
+        df = self.df
         plot_functions = self.get_plot_functions()
-        reports_col = self.db["reports"]
 
         # Initialize session state for plots if not already present
         if 'plot_comments' not in st.session_state:
@@ -379,7 +452,24 @@ class VO2MaxTest:
         if 'include_plot_flags' not in st.session_state:
             st.session_state.include_plot_flags = {title: True for title, _ in plot_functions}
 
+        # Draft that batches comment/summary edits into one autosave write
+        self.draft = ReportDraft(
+            self.reports_col,
+            st.session_state.selected_client_id,
+            st.session_state.selected_test_id,
+            "VO2Max",
+            self.document.get("VO2 Max Report Info", {}).get("Report Info", {}).get("Date", {}),
+            [title for title, _ in plot_functions]
+        )
+
+        self.interval_averages()
+
         st.subheader("📊 Plots & Comments")
+        self.autosave_section()
+
+        # Browser-drawn charts (no server-side rendering) unless the PDF look is asked for
+        backend = charts.chart_backend_selector()
+        chart_functions = dict(self.get_chart_functions()) if backend == "vega" else {}
 
         # ==============================
         # Plot Each Graph and Capture Comments
@@ -389,65 +479,81 @@ class VO2MaxTest:
             st.markdown(f"---")
             st.markdown(f"### {title}")
 
-            # Plot the figure
-            fig, ax = plt.subplots(figsize=(6, 3.5))
-            func(ax, df)
-            fig.tight_layout()
-            st.pyplot(fig, use_container_width=False)
-
-            # Setup keys for session state
-            include_key = f"include_{i}"
-            comment_key = f"comment_{i}"
-            plot_flag_dict = st.session_state.include_plot_flags
-            comment_dict = st.session_state.plot_comments
-
-            # Text box for comment
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.markdown("<div style='max-width: 400px;'>", unsafe_allow_html=True)
-                comment = st.text_area(
-                    "🗨️ Comments:",
-                    key=comment_key,
-                    height=100,
-                    value=comment_dict.get(title, "")
-                )
-                st.markdown("</div>", unsafe_allow_html=True)
+            # Plot the figure (only redrawn on full reruns, not when a comment changes)
+            if title in chart_functions:
+                with timed(f"chart:{title}"):
+                    charts.render_chart(chart_functions[title](df))
+            else:
+                with timed(f"plot:{title}"):
+                    fig, ax = plt.subplots(figsize=(6, 3.5))
+                    func(ax, df)
+                    fig.tight_layout()
+                    st.pyplot(fig, use_container_width=False)
+                    plt.close(fig)
+
+            # Comment box, include checkbox and save button rerun on their own
+            self.plot_section(i, title)
+
+        # Summary text, "Save All" and PDF generation rerun on their own
+        self.summary_section(plot_functions)
+
+    @st.fragment
+    def interval_averages(self):
+        """Peak values and the test table averaged over fixed intervals / rolling breaths."""
+        with st.expander("⏱️ Interval Averages"):
+            options = [spec for spec in AVERAGING_OPTIONS if spec != "raw"]
+            spec = st.selectbox("Averaging", options, index=options.index("30s"),
+                                format_func=AVERAGING_OPTIONS.get, key="interval_averaging")
+
+            # Computed once per test and averaging, shared across reruns and sessions
+            averaged = load_resampled_frame(self.document, spec)
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Peak VO2 (mL/min)", f"{averaged['VO2 STPD'].max():.0f}")
+            col2.metric("Peak VO2/kg (mL/kg/min)", f"{averaged['VO2/kg STPD'].max():.1f}")
+            col3.metric("Peak HR (bpm)", f"{averaged['HR'].max():.0f}")
+            st.dataframe(averaged, use_container_width=True, hide_index=True)
+
+    @st.fragment(run_every=AUTOSAVE_DEBOUNCE_SECONDS)
+    def autosave_section(self):
+        """Autosave status line; reruns on a timer so settled edits get flushed."""
+        render_autosave_status(self.draft)
+
+    @st.fragment
+    def plot_section(self, i, title):
+        """Comment/include controls for one plot, rerun as an independent fragment."""
+
+        # Setup keys for session state
+        include_key = f"include_{i}"
+        comment_key = f"comment_{i}"
+        plot_flag_dict = st.session_state.include_plot_flags
+        comment_dict = st.session_state.plot_comments
+
+        # Text box for comment
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.markdown("<div style='max-width: 400px;'>", unsafe_allow_html=True)
+            comment = st.text_area(
+                "🗨️ Comments:",
+                key=comment_key,
+                height=100,
+                value=comment_dict.get(title, "")
+            )
+            st.markdown("</div>", unsafe_allow_html=True)
 
-            # Checkbox for including/excluding this plot
-            with col2:
-                include = st.checkbox("Include in Report", value=plot_flag_dict.get(title, True), key=include_key)
+        # Checkbox for including/excluding this plot
+        with col2:
+            include = st.checkbox("Include in Report", value=plot_flag_dict.get(title, True), key=include_key)
 
-            # ==============================
-            # Save Button for Each Section
-            # ==============================
-            if st.button(f"💾 Save '{title}' Section", key=f"save_{i}"):
-                # Update session
-                comment_dict[title] = comment
-                plot_flag_dict[title] = include
-
-                # Save the comment/inclusion immediately to MongoDB
-                user_id = st.session_state.selected_client["_id"]
-                test_id = st.session_state.selected_test["_id"]
-
-                self.db["reports"].update_one(
-                    {"user_id": user_id, "test_id": test_id},
-                    {
-                        "$set": {
-                            f"plots.{i}": {
-                                "index": i,
-                                "title": title,
-                                "comment": comment,
-                                "include": include
-                            },
-                            "last_updated": datetime.utcnow()
-                        },
-                        "$setOnInsert": {
-                            "summary": st.session_state.get("initial_report_text", "")
-                        }
-                    },
-                    upsert=True
-                )
-                st.success(f"Saved section for '{title}' ✅")
+        # Track edits in the draft; autosave writes them together
+        if comment != comment_dict.get(title, "") or include != plot_flag_dict.get(title, True):
+            comment_dict[title] = comment
+            plot_flag_dict[title] = include
+            self.draft.mark_plot(i, title, comment, include)
+
+    @st.fragment
+    def summary_section(self, plot_functions):
+        """Summary text plus the save-all and PDF buttons, rerun as an independent fragment."""
 
         # ==============================
         # Summary Report Section
@@ -460,82 +566,52 @@ class VO2MaxTest:
         if "initial_report_text" not in st.session_state:
             st.session_state.initial_report_text = ""
 
-        st.session_state.initial_report_text = st.text_area(
+        summary = st.text_area(
             "Enter your summary or interpretation:",
             value=st.session_state.initial_report_text,
             height=150
         )
+        if summary != st.session_state.initial_report_text:
+            st.session_state.initial_report_text = summary
+            self.draft.mark_summary(summary)
 
         # ==============================
         # Save All Sections Button
         # ==============================
 
         if st.button("💾 Save All Comments and Selections"):
-            user_id = st.session_state.selected_client["_id"]
-            test_id = st.session_state.selected_test["_id"]
-            summary_text = st.session_state.initial_report_text
-
-            plots_data = []
+            # Mark every section dirty and write them all in one batched $set
             for i, (title, _) in enumerate(plot_functions):
                 comment = st.session_state.get(f"comment_{i}", "")
                 include = st.session_state.get(f"include_{i}", True)
 
                 st.session_state.plot_comments[title] = comment
                 st.session_state.include_plot_flags[title] = include
+                self.draft.mark_plot(i, title, comment, include)
+            self.draft.mark_summary(st.session_state.initial_report_text)
 
-                plots_data.append({
-                    "index": i,
-                    "title": title,
-                    "comment": comment,
-                    "include": include
-                })
-
-            # Also store the original test date in MongoDB
-            report_info = st.session_state.selected_test.get("VO2 Max Report Info", {}).get("Report Info", {})
-            test_date = report_info.get("Date", {})
-
-            reports_col.update_one(
-                {"user_id": user_id, "test_id": test_id},
-                {
-                    "$set": {
-                        "user_id": user_id,
-                        "test_id": test_id,
-                        "test_type": "VO2Max",
-                        "summary": summary_text,
-                        "plots": plots_data,
-                        "last_updated": datetime.utcnow(),  # Date of report generation
-                        "test_date": test_date               # Date of original test
-                    }
-                },
-                upsert=True
-            )
-            st.success("✅ All comments and selections saved to MongoDB.")
+            if self.draft.flush(immediate=True):
+                st.success("✅ All comments and selections saved to MongoDB.")
+            else:
+                st.warning("⚠️ Not saved: this report was changed by someone else. See the notice above the plots.")
 
         # Generate Final PDF Button
         if st.button("📄 Generate PDF Report"):
-            self.generate_report_data()
-            self.generate_pdf(self.s3_client)
-
-
-    def generate_pdf(self, s3_client):
-        """Generate the final PDF report from user inputs and upload it to S3."""
-
-        # Setup
-        df = st.session_state.get("df")
-        plot_functions = self.get_plot_functions()
-        client_data = st.session_state.get("client_data", {})
-        vo2_data = st.session_state.get("vo2_data", {})
-        plot_comments = st.session_state.get("plot_comments", {})
-        initial_report_text = st.session_state.get("initial_report_text", "")
+            # Persist pending edits before the PDF is built from them; never publish unsaved (conflicting) edits
+            if self.draft.flush(immediate=True):
+                self.generate_report_data()
+                self.generate_pdf(self.s3_client)
+            else:
+                st.warning("⚠️ PDF not generated: this report was changed by someone else. See the notice above the plots.")
 
-        # ==============================
-        # Build PDF filename (Name + Test Date)
-        # ==============================
 
-        name = client_data.get("Name", "Unknown")
+    def pdf_filename(self):
+        """File name of this test's PDF report: VO2MAX_report_<Name>_<YYYY-MM-DD>.pdf."""
+        report_info = self.document.get("VO2 Max Report Info", {})
+        name = report_info.get("Client Info", {}).get("Name") or "Unknown"
 
         # Extract test date for filename
-        date_dict = st.session_state.selected_test.get("VO2 Max Report Info", {}).get("Report Info", {}).get("Date", {})
+        date_dict = report_info.get("Report Info", {}).get("Date", {})
         if isinstance(date_dict, dict):
             year = str(date_dict.get("Year", ""))
             month = str(date_dict.get("Month", "")).zfill(2)
@@ -552,8 +628,18 @@ class VO2MaxTest:
         else:
             test_date_str = "unknown-date"
 
-        # Final filename
-        pdf_path = f"VO2MAX_report_{name.replace(',', '').replace(' ', '_')}_{test_date_str}.pdf"
+        return f"VO2MAX_report_{name.replace(',', '').replace(' ', '_')}_{test_date_str}.pdf"
+
+    @timed("build_pdf")
+    def build_pdf(self, output, client_data, vo2_data, plot_comments, include_flags, initial_report_text,
+                  plot_format=None):
+        """Render the plots and lay out the PDF report into `output` (a path or binary file object).
+
+        Uses only its arguments and the parsed test, so batch jobs can call it outside a Streamlit session.
+        plot_format: "svg" (vector plots, the default when svglib is installed), "png" or "jpeg".
+        """
+        df = self.df
+        plot_functions = self.get_plot_functions()
 
         pdf_buffers = []
 
@@ -561,7 +647,6 @@ class VO2MaxTest:
         # Create Plot Images
         # ==============================
 
-        include_flags = st.session_state.get("include_plot_flags", {})
         for plot_name, func in plot_functions:
             if not include_flags.get(plot_name, True):
                 continue  # Skip plots that user chose not to include
@@ -571,56 +656,16 @@ class VO2MaxTest:
             ax.set_title(plot_name, fontsize=15, fontweight='bold')
             plt.tight_layout()
 
-            buf = io.BytesIO()
-            fig.savefig(buf, format="PNG")
-            buf.seek(0)
-            pdf_buffers.append((plot_name, buf, plot_comments.get(plot_name, "")))
+            graphic = render_figure(fig, plot_format)
+            pdf_buffers.append((plot_name, graphic, plot_comments.get(plot_name, "")))
             plt.close(fig)
 
         # ==============================
-        # Setup PDF Document Template
+        # Setup PDF Document Template (prepared once, see utils/report_layout.py)
         # ==============================
 
-        from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, FrameBreak, PageBreak, NextPageTemplate
-
-        doc = BaseDocTemplate(pdf_path, pagesize=LETTER)
-        styles = getSampleStyleSheet()
-        width, height = LETTER
-
-        # Page layout settings
-        doc.topMargin = 5
-        doc.bottomMargin = 140
-        doc.leftMargin = 72
-        doc.rightMargin = 72
-        header_height = 180
-        body_height = height - doc.topMargin - doc.bottomMargin - header_height
-
-        # Layout for the plot/comment pages
-        plot_left_margin = 30
-        plot_right_margin = 30
-        usable_width = width - plot_left_margin - plot_right_margin
-        half_width = (usable_width - 12) / 2  # 6pt gutter between plot frames
-
-        # Define page templates
-        doc.addPageTemplates([
-            PageTemplate(
-                id='ContentPage',
-                frames=[
-                    Frame(doc.leftMargin, doc.bottomMargin + body_height, doc.width, header_height, id='header'),
-                    Frame(doc.leftMargin, doc.bottomMargin, doc.width / 2 - 6, body_height, id='left'),
-                    Frame(doc.leftMargin + doc.width / 2 + 6, doc.bottomMargin, doc.width / 2 - 6, body_height, id='right'),
-                    Frame(doc.leftMargin, doc.bottomMargin, doc.width, body_height, id='bottom')
-                ]
-            ),
-            PageTemplate(
-                id='PlotPage',
-                frames=[
-                    Frame(plot_left_margin, height - 350, half_width, 300, id='plot_left'),
-                    Frame(plot_left_margin + half_width + 12, height - 350, half_width, 300, id='plot_right'),
-                    Frame(plot_left_margin, doc.bottomMargin, usable_width, 350, id='comments')
-                ]
-            )
-        ])
+        doc = vo2max_document(output)
+        styles = report_styles()
 
         # ==============================
         # Build Story (Content of PDF)
@@ -628,11 +673,9 @@ class VO2MaxTest:
 
         story = []
 
-        # Add Logo
-        logo_path = "graphics/CHAMPlogo.png"
-        if logo_path and os.path.exists(logo_path):
-            logo = Image(logo_path, width=100, height=100)
-            logo.hAlign = "CENTER"
+        # Add Logo (decoded once per process)
+        logo = logo_flowable(100, 100)
+        if logo:
             story.append(logo)
 
         # Title + School
@@ -646,25 +689,13 @@ class VO2MaxTest:
         # Athlete Info Table
         client_table_data = [["Client Info", ""]] + [[k, str(v)] for k, v in client_data.items()]
         client_table = Table(client_table_data, colWidths=[100, 120])
-        client_table.setStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-        ])
+        client_table.setStyle(VO2_CLIENT_TABLE_STYLE)
         story.extend([client_table, FrameBreak()])
 
         # Test Results Table
         vo2_table_data = [["Test Results", ""]] + [[k, str(v)] for k, v in vo2_data.items()]
         vo2_table = Table(vo2_table_data, colWidths=[100, 150])
-        vo2_table.setStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
-            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-        ])
+        vo2_table.setStyle(VO2_RESULTS_TABLE_STYLE)
         story.append(vo2_table)
         story.append(FrameBreak())
         story.append(Spacer(1, 110))
@@ -691,10 +722,8 @@ class VO2MaxTest:
             for plot_buf in [left, right]:
                 if not plot_buf:
                     continue
-                plot_name, buf, _ = plot_buf
-                img = Image(buf, width=half_width, height=190)
-                img.hAlign = "CENTER"
-                story.append(img)
+                plot_name, graphic, _ = plot_buf
+                story.append(plot_flowable(graphic, VO2_PLOT_WIDTH, VO2_PLOT_HEIGHT))
                 story.append(FrameBreak())
 
             # Add Comments
@@ -715,6 +744,38 @@ class VO2MaxTest:
         # ==============================
 
         doc.build(story)
+        return output
+
+    def generate_pdf(self, s3_client):
+        """Generate the final PDF report from user inputs and upload it to S3."""
+
+        # Setup
+        client_data = st.session_state.get("client_data", {})
+        vo2_data = st.session_state.get("vo2_data", {})
+        plot_comments = st.session_state.get("plot_comments", {})
+        include_flags = st.session_state.get("include_plot_flags", {})
+        initial_report_text = st.session_state.get("initial_report_text", "")
+
+        # Reuse the last uploaded PDF when nothing it was built from has changed
+        report_key = {"user_id": st.session_state.selected_client_id, "test_id": st.session_state.selected_test_id}
+        fingerprint = report_fingerprint(
+            self.document, [title for title, _ in self.get_plot_functions()],
+            plot_comments, include_flags, initial_report_text
+        )
+        existing_key = current_pdf(s3_client, self.reports_col.find_one(report_key, {"pdf": 1}), fingerprint)
+        if existing_key:
+            url = s3_client.generate_presigned_url(
+                "get_object", Params={"Bucket": BUCKET_NAME, "Key": existing_key}, ExpiresIn=3600
+            )
+            st.success("✅ Report unchanged since it was last generated, using the existing PDF.")
+            st.link_button("📥 Download PDF", url)
+            st.session_state.reviewing = False
+            return
+
+        # Final filename (Name + Test Date)
+        pdf_path = self.pdf_filename()
+
+        self.build_pdf(pdf_path, client_data, vo2_data, plot_comments, include_flags, initial_report_text)
 
         st.success("✅ PDF generated successfully!")
         #st.write("PDF saved as:", pdf_path)
@@ -724,22 +785,24 @@ class VO2MaxTest:
             st.download_button("📥 Download PDF", f, file_name=pdf_path)
 
         # Upload to AWS S3
-        bucket_name = "champ-hpl-bucket"
         s3_key = f"reports/{os.path.basename(pdf_path)}"
 
-        try:
-            s3_client.upload_file(
-                Filename=pdf_path,
-                Bucket=bucket_name,
-                Key=s3_key,
-                ExtraArgs={
-                    "ContentType": "application/pdf",
-                    "ContentDisposition": "inline"
-                }
-            )
-            st.success("📤 Report successfully uploaded to S3!")
-        except Exception as e:
-            st.error(f"❌ Upload failed: {e}")
+        # Multipart-tuned upload with retries (utils/storage.py)
+        upload = upload_path(s3_client, pdf_path, s3_key)
+        if upload["error"]:
+            st.error(f"❌ Upload failed: {upload['error']}")
+        else:
+            st.success(f"📤 Report successfully uploaded to S3! ({upload['seconds']:.1f}s)")
+
+            # First-page preview for the report viewer
+            with open(pdf_path, "rb") as f:
+                preview_key = store_thumbnail(s3_client, f.read(), s3_key)
+            try:
+                record_pdf(self.reports_col, report_key["user_id"], report_key["test_id"],
+                           fingerprint, s3_key, uploaded_etag(s3_client, s3_key), preview_key,
+                           test_type=self.draft.test_type, test_date=self.draft.test_date)
+            except Exception as e:
+                st.warning(f"⚠️ PDF uploaded, but its fingerprint could not be recorded ({e}); it will be rebuilt next time.")
 
         # Reset session state
         st.session_state.reviewing = False
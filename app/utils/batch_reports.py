@@ -0,0 +1,350 @@
+import argparse
+import calendar
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from bson import ObjectId
+
+from utils.test_frames import REPORT_KEYS
+from utils.report_fingerprint import report_fingerprint, current_pdf, uploaded_etag, record_pdf
+from utils.storage import upload_bytes, transfer_pool, BUCKET_NAME
+from utils.report_thumbnails import render_thumbnail, store_thumbnail
+
+###################################
+#Batch Report Generation
+#Builds the PDF reports for many tests at once (e.g. a team testing day). Tests are picked
+#by id, or by test date range plus test type; saved comments/selections come from the
+#`reports` collection. PDFs are rendered in a process pool with the same layouts as the
+#report builder (VO2MaxTest.build_pdf / RMRTest.build_pdf) and uploaded to S3 on the shared
+#transfer pool (utils/storage.py) as soon as each one is ready. Reports whose content fingerprint matches the
+#PDF already in S3 are skipped (see utils/report_fingerprint.py).
+#
+#Command line (run from the app/ folder):
+#    python -m utils.batch_reports --test-ids <id> <id> ...
+#    python -m utils.batch_reports --test-type "VO2 Max" --start 2025-03-01 --end 2025-03-02
+###################################
+
+logger = logging.getLogger(__name__)
+
+# Rendering is CPU bound (matplotlib + ReportLab); uploads are I/O bound and run on
+# the shared S3 transfer pool (utils/storage.py)
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# test_type in the tests collection -> test_type stored on reports
+REPORT_TEST_TYPES = {
+    "VO2 Max": "VO2Max",
+    "RMR": "RMR",
+}
+
+MONTHS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+
+# ===============================
+# Selecting tests
+# ===============================
+
+def parse_test_date(document):
+    """Date the test was performed (from Report Info), falling back to the upload date."""
+    report_key = REPORT_KEYS.get(document.get("test_type"), "")
+    date_dict = document.get(report_key, {}).get("Report Info", {}).get("Date", {})
+    try:
+        month = date_dict.get("Month")
+        month = MONTHS.get(str(month).strip(), month)
+        return date(int(date_dict["Year"]), int(month), int(date_dict["Day"]))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        upload_date = document.get("Upload Date")
+        return upload_date.date() if isinstance(upload_date, datetime) else None
+
+
+def find_tests(db, test_ids=None, test_type=None, start=None, end=None):
+    """Return full test documents for the given ids, or for a test type within [start, end]."""
+    tests_col = db['tests']
+
+    if test_ids:
+        ids = [ObjectId(str(test_id)) for test_id in test_ids]
+        return list(tests_col.find({"_id": {"$in": ids}}))
+
+    # Pick matching ids from light documents first, then load only those in full
+    query = {"test_type": test_type} if test_type else {}
+    projection = {f"{key}.{section}": 0 for key in REPORT_KEYS.values() for section in ("Tabular Data", "Plot Data")}
+    matching = []
+    for document in tests_col.find(query, projection):
+        test_date = parse_test_date(document)
+        if test_date is None:
+            continue
+        if (start is None or test_date >= start) and (end is None or test_date <= end):
+            matching.append(document["_id"])
+
+    if not matching:
+        return []
+    return list(tests_col.find({"_id": {"$in": matching}}))
+
+
+def plot_titles(test_type):
+    """Plot titles of a test type's report, in report order."""
+    from tests.vo2max_test import VO2MaxTest
+    from tests.rmr_test import RMRTest
+
+    test_classes = {"VO2 Max": VO2MaxTest, "RMR": RMRTest}
+    return [title for title, _ in test_classes[test_type](connect=False).get_plot_functions()]
+
+
+def saved_report_inputs(report):
+    """(plot_comments, include_flags, summary, activity_level) saved in the report builder, or the defaults."""
+    report = report or {}
+    plots = report.get("plots", [])
+    plot_comments = {plot["title"]: plot.get("comment", "") for plot in plots if plot}
+    include_flags = {plot["title"]: plot.get("include", True) for plot in plots if plot}
+    return plot_comments, include_flags, report.get("summary", ""), report.get("activity_level", "moderate")
+
+
+def load_saved_reports(db, documents):
+    """Map test_id -> saved report document (one query for the whole batch)."""
+    test_ids = [document["_id"] for document in documents]
+    return {report["test_id"]: report for report in db['reports'].find({"test_id": {"$in": test_ids}})}
+
+
+# ===============================
+# Rendering (runs in worker processes)
+# ===============================
+
+def _init_worker():
+    """Headless matplotlib and warm imports in every worker, so per-report timings exclude start-up."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401  (font cache / backend load)
+    from tests.vo2max_test import VO2MaxTest  # noqa: F401
+    from tests.rmr_test import RMRTest  # noqa: F401
+    from utils.report_assets import logo_flowable
+    logo_flowable()  # decode the logo once per worker
+
+
+def render_report(document, report):
+    """Render one report PDF in memory. Returns a result dict with the bytes and timing."""
+    from tests.vo2max_test import VO2MaxTest
+    from tests.rmr_test import RMRTest
+
+    test_classes = {"VO2 Max": VO2MaxTest, "RMR": RMRTest}
+    result = {
+        "test_id": str(document["_id"]),
+        "test_type": document.get("test_type"),
+        "filename": None,
+        "pdf": None,
+        "thumbnail": None,
+        "render_seconds": 0.0,
+        "upload_seconds": 0.0,
+        "size_bytes": 0,
+        "skipped": False,
+        "error": None,
+    }
+
+    started = time.perf_counter()
+    try:
+        test = test_classes[document.get("test_type")](connect=False)  # no MongoDB / S3 handles in the workers
+        if test.parse_test(document) is None:
+            raise ValueError("could not parse test document")
+
+        # Saved comments / selections from the report builder (defaults when none saved)
+        plot_comments, include_flags, summary, activity_level = saved_report_inputs(report)
+        client_data, test_data = test.report_data()
+
+        buffer = io.BytesIO()
+        if document.get("test_type") == "RMR":
+            built = test.build_pdf(buffer, client_data, test_data, plot_comments, include_flags, summary,
+                                   activity_level=activity_level)
+        else:
+            built = test.build_pdf(buffer, client_data, test_data, plot_comments, include_flags, summary)
+        if built is None:
+            raise ValueError("report data is incomplete")
+
+        result["filename"] = test.pdf_filename()
+        result["pdf"] = buffer.getvalue()
+        result["thumbnail"] = render_thumbnail(result["pdf"])  # first-page preview for the viewer
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["render_seconds"] = time.perf_counter() - started
+    return result
+
+
+# ===============================
+# Uploading (runs in threads)
+# ===============================
+
+def upload_report(s3_client, result, bucket_name=BUCKET_NAME, reports_col=None, document=None):
+    """Upload one rendered PDF to S3 under reports/<filename> (with retries); records the upload time.
+
+    With reports_col/document given, the PDF's fingerprint, key and ETag are stored on the
+    test's report (created when the test has none).
+    """
+    s3_key = f"reports/{result['filename']}"
+    upload = upload_bytes(s3_client, result["pdf"], s3_key, bucket_name=bucket_name)
+    result["upload_seconds"] = upload["seconds"]
+    result["upload_attempts"] = upload["attempts"]
+    if upload["error"]:
+        result["error"] = f"Upload failed: {upload['error']}"
+        return result
+
+    preview_key = store_thumbnail(s3_client, result["pdf"], s3_key, result["thumbnail"], bucket_name)
+
+    if reports_col is not None and document is not None:
+        test_type = document.get("test_type")
+        try:
+            record_pdf(reports_col, document.get("user_id"), document["_id"], result["fingerprint"],
+                       s3_key, uploaded_etag(s3_client, s3_key, bucket_name), preview_key,
+                       test_type=REPORT_TEST_TYPES.get(test_type, test_type),
+                       test_date=document.get(REPORT_KEYS.get(test_type, ""), {}).get("Report Info", {}).get("Date", {}))
+        except Exception as e:
+            logger.warning("Could not record PDF fingerprint for %s: %s", s3_key, e)
+    return result
+
+
+# ===============================
+# Batch driver
+# ===============================
+
+def _skipped_result(document, s3_key):
+    return {
+        "test_id": str(document["_id"]),
+        "test_type": document.get("test_type"),
+        "filename": os.path.basename(s3_key),
+        "pdf": None,
+        "thumbnail": None,
+        "render_seconds": 0.0,
+        "upload_seconds": 0.0,
+        "size_bytes": 0,
+        "skipped": True,
+        "error": None,
+    }
+
+
+def result_rows(results):
+    """One table row per batch result (rendered, skipped or failed)."""
+    return [{
+        "Report": r["filename"] or r["test_id"],
+        "Test Type": r["test_type"],
+        "Render (s)": round(r["render_seconds"], 2),
+        "Upload (s)": round(r["upload_seconds"], 2),
+        "Size (KB)": round(r["size_bytes"] / 1024, 1),
+        "Skipped": r["skipped"],
+        "Error": r["error"] or "",
+    } for r in results]
+
+
+def run_batch(db, s3_client, documents, workers=DEFAULT_WORKERS, upload=True, output_dir=None, progress=None,
+              force=False):
+    """Render (process pool) and upload (thread pool) reports for `documents`.
+
+    Reports whose PDF in S3 was built from the same content are skipped unless `force`
+    (or when only rendering locally: upload=False).
+    progress(done, total, result) is called as each report finishes.
+    Returns (results, total_seconds); each result carries render/upload timings or an error.
+    """
+    started = time.perf_counter()
+    saved_reports = load_saved_reports(db, documents)
+    reports_col = db['reports']
+    results = []
+    total = len(documents)
+
+    titles = {test_type: plot_titles(test_type) for test_type in {d.get("test_type") for d in documents}}
+    fingerprints = {}
+    for document in documents:
+        plot_comments, include_flags, summary, activity_level = saved_report_inputs(saved_reports.get(document["_id"]))
+        fingerprints[str(document["_id"])] = report_fingerprint(
+            document, titles[document.get("test_type")], plot_comments, include_flags, summary, activity_level
+        )
+
+    # "spawn" keeps the parent's MongoClient/boto3 sockets out of the workers, and render_report
+    # opens none of its own (the parent does all MongoDB / S3 work)
+    context = multiprocessing.get_context("spawn")
+    uploaders = transfer_pool()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as renderers:
+
+        # Check which saved PDFs are still current (one HEAD request each, in the upload threads)
+        if upload and not force:
+            existing = list(uploaders.map(
+                lambda d: current_pdf(s3_client, saved_reports.get(d["_id"]), fingerprints[str(d["_id"])]),
+                documents
+            ))
+        else:
+            existing = [None] * total
+
+        by_id = {str(document["_id"]): document for document in documents}
+        rendering = []
+        for document, s3_key in zip(documents, existing):
+            if s3_key:
+                results.append(_skipped_result(document, s3_key))
+                if progress:
+                    progress(len(results), total, results[-1])
+            else:
+                rendering.append(renderers.submit(render_report, document, saved_reports.get(document["_id"])))
+
+        # Hand each PDF to an upload thread as soon as it is rendered
+        finishing = []
+        for future in as_completed(rendering):
+            result = future.result()
+            result["upload_seconds"] = 0.0
+            result["fingerprint"] = fingerprints[result["test_id"]]
+            if result["error"] is None and output_dir:
+                with open(os.path.join(output_dir, result["filename"]), "wb") as f:
+                    f.write(result["pdf"])
+            if result["error"] is None and upload:
+                finishing.append(uploaders.submit(upload_report, s3_client, result, BUCKET_NAME, reports_col,
+                                                  by_id[result["test_id"]]))
+            else:
+                finishing.append(uploaders.submit(lambda r: r, result))
+
+        for future in as_completed(finishing):
+            result = future.result()
+            result["size_bytes"] = len(result["pdf"]) if result["pdf"] else 0
+            result["pdf"] = result["thumbnail"] = None  # don't keep every PDF in memory
+            results.append(result)
+            if progress:
+                progress(len(results), total, result)
+
+    return results, time.perf_counter() - started
+
+
+def main():
+    from utils.data_cache import get_database, get_s3_client
+
+    parser = argparse.ArgumentParser(description="Generate PDF reports for a batch of tests.")
+    parser.add_argument("--test-ids", nargs="+", help="Test document ids")
+    parser.add_argument("--test-type", choices=list(REPORT_TEST_TYPES), help="Test type for a date range")
+    parser.add_argument("--start", type=date.fromisoformat, help="First test date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last test date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Rendering processes")
+    parser.add_argument("--no-upload", action="store_true", help="Render only, skip the S3 upload")
+    parser.add_argument("--output-dir", help="Also write the PDFs to this folder")
+    parser.add_argument("--force", action="store_true", help="Regenerate reports even if unchanged")
+    args = parser.parse_args()
+
+    if not args.test_ids and not args.test_type:
+        parser.error("give --test-ids or --test-type with --start/--end")
+
+    db = get_database()
+    documents = find_tests(db, args.test_ids, args.test_type, args.start, args.end)
+    print(f"{len(documents)} test(s) selected")
+
+    def report_progress(done, total, result):
+        status = result["error"] or ("unchanged, skipped" if result["skipped"] else "ok")
+        print(f"[{done}/{total}] {result['filename'] or result['test_id']}: "
+              f"render {result['render_seconds']:.2f}s, upload {result['upload_seconds']:.2f}s - {status}")
+
+    results, total_seconds = run_batch(
+        db, get_s3_client(), documents,
+        workers=args.workers, upload=not args.no_upload,
+        output_dir=args.output_dir, progress=report_progress, force=args.force
+    )
+    failed = sum(1 for result in results if result["error"])
+    skipped = sum(1 for result in results if result["skipped"])
+    print(f"Done: {len(results) - failed - skipped} generated, {skipped} unchanged, {failed} failed, "
+          f"total wall-clock {total_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
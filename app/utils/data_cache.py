@@ -0,0 +1,90 @@
+import os
+import streamlit as st
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from bson import ObjectId
+import boto3
+from utils.storage import CLIENT_CONFIG
+from utils.metrics import timed
+from utils.mongo_monitor import command_monitor
+
+###################################
+#Shared Data Cache
+#Process-wide, bounded caches for the MongoDB/S3 handles and the documents the
+#report pages read. Session state only keeps ObjectIds; every session that opens
+#the same client or test resolves it through here and shares one copy in memory.
+#Documents returned from these helpers are shared between sessions: treat them as read-only.
+###################################
+
+# Upper bounds on how many documents stay resident per process
+MAX_CACHED_TESTS = 32
+MAX_CACHED_CLIENTS = 256
+
+# Re-read documents from MongoDB after this many seconds
+CACHE_TTL_SECONDS = 600
+
+
+# ===============================
+# Connections
+# ===============================
+
+@st.cache_resource
+def get_database():
+    """Return the shared MongoDB database handle (one MongoClient per process)."""
+    load_dotenv()
+    database_credentials = os.getenv("database_credentials")
+    client = MongoClient(database_credentials, event_listeners=[command_monitor])
+    return client['performance-lab']
+
+
+@st.cache_resource
+def get_s3_client():
+    """Return the shared boto3 S3 client (one per process).
+
+    `s3_endpoint_url` in .env points it at a local stand-in (moto server, MinIO) instead of AWS.
+    """
+    load_dotenv()
+    return boto3.client(
+        's3',
+        aws_access_key_id=os.getenv("aws_access_key_id"),
+        aws_secret_access_key=os.getenv("aws_secret_access_key"),
+        region_name='us-east-1',
+        endpoint_url=os.getenv("s3_endpoint_url") or None,
+        config=CLIENT_CONFIG
+    )
+
+
+# ===============================
+# Documents
+# ===============================
+
+@st.cache_resource(max_entries=MAX_CACHED_TESTS, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _load_test(test_id):
+    with timed("mongo:load_test"):
+        return get_database()['tests'].find_one({"_id": ObjectId(test_id)})
+
+
+@st.cache_resource(max_entries=MAX_CACHED_CLIENTS, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _load_client(user_id):
+    with timed("mongo:load_client"):
+        return get_database()['users'].find_one({"_id": ObjectId(user_id)})
+
+
+def load_test(test_id):
+    """Resolve a test document by id through the shared cache (None if missing)."""
+    if not test_id:
+        return None
+    return _load_test(str(test_id))
+
+
+def load_client(user_id):
+    """Resolve a client (users collection) document by id through the shared cache."""
+    if not user_id:
+        return None
+    return _load_client(str(user_id))
+
+
+def clear_document_cache():
+    """Drop every cached test and client document (e.g. after an upload or edit)."""
+    _load_test.clear()
+    _load_client.clear()
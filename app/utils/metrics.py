@@ -0,0 +1,152 @@
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+###################################
+#Stage Timing Metrics
+#Process-wide timings of the slow parts of a page rerun (MongoDB calls, parsing, plots,
+#PDF builds, S3 transfers), labelled by page and stage:
+#    with timed("build_pdf"): ...          @timed("parse_test")
+#    observe("s3:upload", seconds)
+#Every observation goes into a histogram per (page, stage) (counts since the process
+#started) and a bounded list of recent ones for the admin page (slowest stages over the
+#last hour). prometheus_text() renders the histograms in the Prometheus text format;
+#with METRICS_FILE set they are also written there every METRICS_FILE_SECONDS (e.g. for
+#node_exporter's textfile collector).
+#Safe to call from any thread; outside a script run the page is "(background)".
+###################################
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds (seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Recent observations kept for the admin page
+RECENT_SECONDS = 3600
+MAX_RECENT = 50000
+
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_SECONDS = 15
+
+METRIC_NAME = "hpl_stage_seconds"
+BACKGROUND_PAGE = "(background)"
+
+_lock = threading.Lock()
+_histograms = {}                      # (page, stage) -> [bucket counts..., +Inf count], sum
+_recent = deque(maxlen=MAX_RECENT)    # (unix time, page, stage, seconds)
+_writer = None
+
+
+def current_page():
+    """Name of the page the calling script run is on (BACKGROUND_PAGE outside one)."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return BACKGROUND_PAGE
+    pages = ctx.pages_manager
+    page = pages.get_pages().get(pages.current_page_script_hash, {})
+    return page.get("page_name") or os.path.basename(ctx.main_script_path)
+
+
+def observe(stage, seconds, page=None):
+    """Record one timing of `stage` (on the current page unless given)."""
+    page = page or current_page()
+    with _lock:
+        counts, total = _histograms.get((page, stage)) or ([0] * (len(BUCKETS) + 1), 0.0)
+        counts[bisect_left(BUCKETS, seconds)] += 1
+        _histograms[(page, stage)] = (counts, total + seconds)
+        _recent.append((time.time(), page, stage, seconds))
+    if METRICS_FILE:
+        _start_file_writer()
+
+
+class timed:
+    """Time a block or function as `stage`: `with timed("build_pdf"):` / `@timed("parse_test")`."""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage):  # a timer per call: decorated functions run in many sessions at once
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self._started)
+        return False
+
+
+# ===============================
+# Reading
+# ===============================
+
+def recent_observations(seconds=RECENT_SECONDS):
+    """Observations of the last `seconds` as (unix time, page, stage, seconds) tuples."""
+    since = time.time() - seconds
+    with _lock:
+        return [row for row in _recent if row[0] >= since]
+
+
+def prometheus_text():
+    """All histograms in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: (list(counts), total) for key, (counts, total) in _histograms.items()}
+
+    lines = [
+        f"# HELP {METRIC_NAME} Duration of page rerun stages (MongoDB, parsing, plots, PDF, S3).",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    for (page, stage), (counts, total) in sorted(histograms.items()):
+        labels = f'page="{_escape(page)}",stage="{_escape(stage)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {total:.6f}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ===============================
+# Metrics file
+# ===============================
+
+def write_metrics_file(path=METRICS_FILE):
+    """Write prometheus_text() to `path` (atomically, so scrapers never see half a file)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def _start_file_writer():
+    global _writer
+    with _lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(target=_write_periodically, name="metrics-file", daemon=True)
+    _writer.start()
+
+
+def _write_periodically():
+    while True:
+        try:
+            write_metrics_file()
+        except OSError as e:
+            logger.warning("Could not write metrics file %s: %s", METRICS_FILE, e)
+        time.sleep(METRICS_FILE_SECONDS)
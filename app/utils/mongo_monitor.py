@@ -0,0 +1,281 @@
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from itertools import count
+import bson
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from utils.metrics import current_page, observe
+
+###################################
+#MongoDB Command Monitoring
+#A pymongo CommandListener that records every command the app sends (latency, documents
+#returned / written, reply size) with the page and rerun that issued it. Register it on
+#each MongoClient:
+#    MongoClient(uri, event_listeners=[command_monitor])
+#and wrap a page rerun in monitored_rerun(page) so its commands are counted per rerun.
+#- Latencies go into utils/metrics.py as "db:<command> <collection>" stages.
+#- The same query shape (filter keys, values stripped) repeated N_PLUS_ONE_MIN or more times
+#  in one rerun is flagged as an N+1 pattern (find_one in a loop instead of one $in query).
+#- Each query shape is explained once every EXPLAIN_INTERVAL_SECONDS on a background thread;
+#  a winning plan with a COLLSCAN (no usable index) is flagged.
+#Everything is kept in memory for the admin Performance page.
+###################################
+
+logger = logging.getLogger(__name__)
+
+# Commands kept for the admin page
+MAX_COMMANDS = 20000
+MAX_RERUNS = 2000
+MAX_FINDINGS = 500
+
+# Same query shape this many times in one rerun = N+1 pattern
+N_PLUS_ONE_MIN = 5
+
+# Re-explain a query shape after this many seconds
+EXPLAIN_INTERVAL_SECONDS = 900
+EXPLAIN_QUEUE_SIZE = 100
+
+# Commands the explain sampler looks at
+EXPLAINABLE = {"find", "count", "distinct", "aggregate", "update", "delete", "findAndModify"}
+
+# Driver housekeeping, not app queries (our own explains included)
+IGNORED = {"hello", "ismaster", "isMaster", "ping", "buildInfo", "saslStart", "saslContinue",
+           "authenticate", "endSessions", "explain"}
+
+# Command fields explain doesn't accept
+SESSION_FIELDS = {"lsid", "txnNumber", "startTransaction", "autocommit", "readConcern", "writeConcern",
+                  "apiVersion", "apiStrict", "apiDeprecationErrors"}
+
+_lock = threading.Lock()
+_pending = {}                           # (connection_id, request_id) -> (page, collection, shape)
+_commands = deque(maxlen=MAX_COMMANDS)  # dicts: time, page, rerun, command, collection, shape, seconds, docs, bytes
+_reruns = deque(maxlen=MAX_RERUNS)      # dicts: time, page, rerun, commands, seconds, docs, bytes
+_repeats = deque(maxlen=MAX_FINDINGS)   # N+1 findings
+_collscans = {}                         # (command, collection, shape) -> finding
+_explained = {}                         # (command, collection, shape) -> unix time last queued
+_explain_queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+_explainer = None
+_rerun_ids = count(1)
+_local = threading.local()
+
+
+# ===============================
+# Query shapes
+# ===============================
+
+def _shape(value):
+    """`value` with every literal replaced by "?" (keeps field names and operators)."""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0])] if value else []
+    return "?"
+
+
+def _query(command_name, command):
+    """The filter part of a command (None when it has none)."""
+    if command_name in ("update", "delete"):
+        statements = command.get(f"{command_name}s") or [{}]
+        return statements[0].get("q")
+    if command_name == "find":
+        return command.get("filter", {})
+    if command_name == "aggregate":
+        return next((stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage), {})
+    return command.get("query")
+
+
+def _collection(command_name, command):
+    name = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return name if isinstance(name, str) else ""
+
+
+def _docs(reply):
+    """Documents a reply returned (cursor batch) or touched (n)."""
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    return reply.get("n", 0)
+
+
+# ===============================
+# Listener
+# ===============================
+
+class CommandMonitor(monitoring.CommandListener):
+    """Runs on the thread that sent the command, i.e. the page's script thread."""
+
+    def started(self, event):
+        if event.command_name in IGNORED:
+            return
+        command = event.command
+        collection = _collection(event.command_name, command)
+        query = _query(event.command_name, command)
+        shape = json.dumps(_shape(query), sort_keys=True, default=str) if query is not None else ""
+        with _lock:
+            _pending[(event.connection_id, event.request_id)] = (current_page(), collection, shape)
+        if event.command_name in EXPLAINABLE:
+            _sample_explain(event, collection, shape)
+
+    def succeeded(self, event):
+        self._finished(event, event.reply)
+
+    def failed(self, event):
+        self._finished(event, {})
+
+    def _finished(self, event, reply):
+        with _lock:
+            started = _pending.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        page, collection, shape = started
+        seconds = event.duration_micros / 1e6
+        docs = _docs(reply)
+        size = len(bson.encode(reply)) if reply else 0
+        rerun = getattr(_local, "rerun", None)
+
+        observe(f"db:{event.command_name} {collection}".strip(), seconds, page=page)
+        with _lock:
+            _commands.append({
+                "time": time.time(), "page": page, "rerun": rerun["id"] if rerun else None,
+                "command": event.command_name, "collection": collection, "shape": shape,
+                "seconds": seconds, "docs": docs, "bytes": size,
+            })
+        if rerun is not None:
+            rerun["commands"] += 1
+            rerun["seconds"] += seconds
+            rerun["docs"] += docs
+            rerun["bytes"] += size
+            rerun["shapes"][(event.command_name, collection, shape)] += 1
+
+
+command_monitor = CommandMonitor()
+
+
+@contextmanager
+def monitored_rerun(page):
+    """Count the MongoDB commands of the enclosed rerun of `page` and flag N+1 patterns."""
+    rerun = {"id": next(_rerun_ids), "page": page, "commands": 0, "seconds": 0.0, "docs": 0, "bytes": 0,
+             "shapes": Counter()}
+    _local.rerun = rerun
+    try:
+        yield
+    finally:
+        # st.rerun()/st.stop() end the run with an exception: still count it
+        _local.rerun = None
+        now = time.time()
+        with _lock:
+            _reruns.append({key: rerun[key] for key in ("page", "commands", "seconds", "docs", "bytes")}
+                           | {"time": now, "rerun": rerun["id"]})
+            for (command, collection, shape), calls in rerun["shapes"].items():
+                if calls >= N_PLUS_ONE_MIN:
+                    _repeats.append({"time": now, "page": page, "rerun": rerun["id"], "command": command,
+                                     "collection": collection, "shape": shape, "calls": calls})
+
+
+# ===============================
+# Explain sampling (COLLSCAN)
+# ===============================
+
+def _sample_explain(event, collection, shape):
+    """Queue an explain of this command if its shape wasn't explained recently."""
+    key = (event.command_name, collection, shape)
+    now = time.time()
+    with _lock:
+        if now - _explained.get(key, 0) < EXPLAIN_INTERVAL_SECONDS:
+            return
+        _explained[key] = now
+    command = {field: value for field, value in event.command.items()
+               if field not in SESSION_FIELDS and not field.startswith("$")}
+    try:
+        _explain_queue.put_nowait((key, event.database_name, copy.deepcopy(command), current_page()))
+    except queue.Full:
+        with _lock:
+            _explained.pop(key, None)  # try again next time it runs
+        return
+    _start_explainer()
+
+
+def _start_explainer():
+    global _explainer
+    with _lock:
+        if _explainer is not None:
+            return
+        _explainer = threading.Thread(target=_explain_forever, name="mongo-explain", daemon=True)
+    _explainer.start()
+
+
+def _has_collscan(plan):
+    if isinstance(plan, dict):
+        return plan.get("stage") == "COLLSCAN" or any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(item) for item in plan)
+    return False
+
+
+def _winning_plans(explain):
+    """Every queryPlanner.winningPlan in an explain result (aggregate nests them per stage)."""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            else:
+                yield from _winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _winning_plans(item)
+
+
+def _explain_forever():
+    # Commands can't be sent from inside a listener, so explains run here on the shared client
+    from utils.data_cache import get_database
+
+    while True:
+        key, database_name, command, page = _explain_queue.get()
+        try:
+            explain = get_database().client[database_name].command(
+                {"explain": command, "verbosity": "queryPlanner"})
+        except PyMongoError as e:
+            logger.warning("Could not explain %s on %s: %s", key[0], key[1], e)
+            continue
+        command_name, collection, shape = key
+        with _lock:
+            if any(_has_collscan(plan) for plan in _winning_plans(explain)):
+                _collscans[key] = {"time": time.time(), "page": page, "command": command_name,
+                                   "collection": collection, "shape": shape}
+            else:
+                _collscans.pop(key, None)  # an index was added since
+
+
+# ===============================
+# Reading
+# ===============================
+
+def recent_commands(seconds=None):
+    """Recorded commands (newest last), optionally only those of the last `seconds`."""
+    since = time.time() - seconds if seconds else 0
+    with _lock:
+        return [row for row in _commands if row["time"] >= since]
+
+
+def recent_reruns(seconds=None):
+    since = time.time() - seconds if seconds else 0
+    with _lock:
+        return [row for row in _reruns if row["time"] >= since]
+
+
+def repeated_queries():
+    """N+1 findings, newest first."""
+    with _lock:
+        return list(reversed(_repeats))
+
+
+def unindexed_queries():
+    """Query shapes whose last explain used a COLLSCAN."""
+    with _lock:
+        return list(_collscans.values())
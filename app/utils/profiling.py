@@ -0,0 +1,166 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from itertools import count
+import streamlit as st
+from utils.data_cache import load_test
+from utils.test_frames import REPORT_KEYS
+
+###################################
+#Rerun Profiling (opt-in)
+#Wraps one full rerun of a page in cProfile plus a stack sampler, for "the report builder
+#is slow for this client" reports that don't reproduce elsewhere. A rerun is profiled when
+#- its URL has ?profile=1 (the parameter is removed again, so only that rerun), or
+#- an admin armed the page on the Performance page (next rerun of it, any session).
+#Each profile keeps the page, the selected test id and its row count, and is downloadable
+#as a .prof file (pstats / snakeviz) and as collapsed stacks ("a;b;c count" lines, for
+#flamegraph.pl / speedscope). Only the script thread is profiled, not the S3 transfer pool.
+###################################
+
+# Profiles kept in memory (oldest dropped first)
+MAX_PROFILES = 20
+
+# Stack sampling interval (seconds)
+SAMPLE_INTERVAL = 0.005
+
+# Functions listed in a profile's text summary
+SUMMARY_LINES = 40
+
+QUERY_PARAM = "profile"
+
+_lock = threading.Lock()
+_armed = {}                            # page -> reruns left to profile
+_profiles = deque(maxlen=MAX_PROFILES)
+_profile_ids = count(1)
+
+
+def arm(page, runs=1):
+    """Profile the next `runs` full reruns of `page` (in whichever session comes first)."""
+    with _lock:
+        _armed[page] = _armed.get(page, 0) + runs
+
+
+def armed_pages():
+    with _lock:
+        return dict(_armed)
+
+
+def _take_armed(page):
+    with _lock:
+        if not _armed.get(page):
+            return False
+        _armed[page] -= 1
+        if not _armed[page]:
+            del _armed[page]
+        return True
+
+
+def profiles():
+    """Stored profiles, newest first."""
+    with _lock:
+        return list(reversed(_profiles))
+
+
+# ===============================
+# Stack sampling
+# ===============================
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Counts the call stacks of one thread every SAMPLE_INTERVAL seconds until stopped."""
+
+    def __init__(self, thread_id):
+        super().__init__(name="rerun-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed stack format."""
+        return "\n".join(f"{stack} {samples}" for stack, samples in self.stacks.most_common())
+
+
+# ===============================
+# Profiling a rerun
+# ===============================
+
+def _requested(page):
+    """Whether this rerun should be profiled (consumes the query parameter / armed run)."""
+    if st.query_params.get(QUERY_PARAM) == "1":
+        del st.query_params[QUERY_PARAM]
+        return True
+    return _take_armed(page)
+
+
+def _test_tags():
+    """(test_id, rows) of the test selected in this session, if any."""
+    test_id = st.session_state.get("selected_test_id")
+    document = load_test(test_id)
+    if not document:
+        return (str(test_id) if test_id else None), None
+    records = document.get(REPORT_KEYS.get(document.get("test_type"), ""), {}).get("Tabular Data") or []
+    return str(test_id), len(records)
+
+
+@contextmanager
+def profiled_run(page):
+    """Profile the enclosed rerun of `page` when requested; a no-op otherwise."""
+    if not _requested(page):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        # st.rerun()/st.stop() end the run with an exception: keep the profile anyway
+        profiler.disable()
+        sampler.stop()
+        seconds = time.perf_counter() - started
+
+        profiler.create_stats()
+        prof = marshal.dumps(profiler.stats)  # before pstats.Stats(), which empties profiler.stats
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        test_id, rows = _test_tags()
+        with _lock:
+            _profiles.append({
+                "id": next(_profile_ids),
+                "time": time.time(),
+                "page": page,
+                "test_id": test_id,
+                "rows": rows,
+                "seconds": seconds,
+                "summary": summary.getvalue(),
+                "prof": prof,
+                "collapsed": sampler.collapsed(),
+            })
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from PIL import Image as PILImage
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable
+
+###################################
+#Report Image Assets
+#Static graphics (the CHAMP logo) are decoded and downscaled to their print size once per
+#process and shared by every report. Raster plots are encoded with configurable
+#DPI / format / palette size, and identical images resolve to one shared ImageReader so
+#their pixels are only decoded once.
+#Settings come from environment variables so batch runs can trade quality for size:
+#    REPORT_PLOT_DPI      raster plot resolution (default 100, matplotlib's own)
+#    REPORT_PNG_COLORS    palette size for PNG plots, 0 = full colour (default 256)
+#    REPORT_JPEG_QUALITY  quality for "jpeg" plots (default 85)
+#    REPORT_LOGO_DPI      logo resolution at its printed size (default 300)
+###################################
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOGO_PATH = os.path.join(ROOT_DIR, "graphics", "CHAMPlogo.png")
+
+PLOT_DPI = int(os.getenv("REPORT_PLOT_DPI", 100))
+PNG_COLORS = int(os.getenv("REPORT_PNG_COLORS", 256))
+JPEG_QUALITY = int(os.getenv("REPORT_JPEG_QUALITY", 85))
+LOGO_DPI = int(os.getenv("REPORT_LOGO_DPI", 300))
+
+# Raster images kept for de-duplication
+MAX_CACHED_IMAGES = 64
+
+
+class SharedImage(Flowable):
+    """Draws a shared ImageReader (decoded once) at a fixed size."""
+
+    def __init__(self, reader, width, height, h_align="CENTER"):
+        super().__init__()
+        self.reader = reader
+        self.drawWidth = self.width = width
+        self.drawHeight = self.height = height
+        self.hAlign = h_align
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        self.canv.drawImage(self.reader, 0, 0, self.width, self.height, mask="auto")
+
+
+# ===============================
+# Static graphics
+# ===============================
+
+@lru_cache(maxsize=None)
+def static_image(path, width, height, dpi=LOGO_DPI):
+    """ImageReader of a static graphic downscaled to `dpi` at width x height points (None if missing)."""
+    if not os.path.exists(path):
+        return None
+    image = PILImage.open(path)
+    image.load()
+
+    # Never upscale; print size in pixels = points / 72 * dpi
+    target = (round(width / 72 * dpi), round(height / 72 * dpi))
+    if image.width > target[0] or image.height > target[1]:
+        image = image.resize(target, PILImage.LANCZOS)
+
+    reader = ImageReader(image)
+    reader.getRGBData()  # decode now, not on every build
+    return reader
+
+
+def logo_flowable(width=100, height=100, h_align="CENTER"):
+    """The CHAMP logo as a flowable, or None when the graphic is missing."""
+    reader = static_image(LOGO_PATH, width, height)
+    return SharedImage(reader, width, height, h_align) if reader else None
+
+
+# ===============================
+# Raster plots
+# ===============================
+
+_images = OrderedDict()
+_images_lock = threading.Lock()
+
+
+def shared_image(data):
+    """One ImageReader per distinct encoded image (LRU of MAX_CACHED_IMAGES)."""
+    key = hashlib.sha1(data).hexdigest()
+    with _images_lock:
+        reader = _images.get(key)
+        if reader is not None:
+            _images.move_to_end(key)
+            return reader
+        reader = ImageReader(io.BytesIO(data))
+        _images[key] = reader
+        if len(_images) > MAX_CACHED_IMAGES:
+            _images.popitem(last=False)
+        return reader
+
+
+def raster_plot(fig, image_format="png"):
+    """Encode a finished figure as a PNG (palette-quantized) or JPEG ImageReader."""
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=PLOT_DPI)
+    buf.seek(0)
+
+    # Plots are drawn on white, the alpha channel is dead weight
+    image = PILImage.open(buf).convert("RGB")
+    out = io.BytesIO()
+    if image_format == "jpeg":
+        image.save(out, format="JPEG", quality=JPEG_QUALITY)
+    else:
+        # Fewer distinct colours compress much better in the PDF's Flate stream
+        if PNG_COLORS:
+            image = image.quantize(colors=PNG_COLORS)
+        image.save(out, format="PNG", compress_level=1)  # ReportLab re-compresses the pixels anyway
+    return shared_image(out.getvalue())
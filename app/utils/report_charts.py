@@ -0,0 +1,139 @@
+import json
+import numpy as np
+import streamlit as st
+
+###################################
+#Browser-Rendered Report Charts
+#Vega-Lite versions of the report builder plots. Only the (downsampled) series go to the
+#browser as JSON and it draws them, so a rerun costs the server about a millisecond per
+#chart instead of a matplotlib render. Specs are plain dicts: building the same chart
+#through Altair costs ~50 ms, most of what we're trying to save.
+#    chart(layers, x_title, y_title, y2_title=None)   scatter/line/rule/band layers
+#    pie(labels, values, colors, text)
+#Matplotlib stays the PDF renderer. Each test class keeps get_chart_functions() in step
+#with get_plot_functions() (same titles, same order); the builder picks one per session.
+###################################
+
+CHART_BACKENDS = {
+    "vega": "Interactive (drawn in the browser)",
+    "matplotlib": "Static (as in the PDF)",
+}
+DEFAULT_CHART_BACKEND = "vega"
+
+CHART_HEIGHT = 320
+
+# Decimals kept in the JSON sent to the browser
+DECIMALS = 4
+
+# Matplotlib's default color cycle, so both backends use the same colors
+TAB_COLORS = {
+    "tab:blue": "#1f77b4",
+    "tab:orange": "#ff7f0e",
+    "tab:green": "#2ca02c",
+    "tab:red": "#d62728",
+}
+
+
+def chart_backend_selector():
+    """Radio for how the builder draws its plots; returns the chosen CHART_BACKENDS key."""
+    return st.radio("Plot rendering", list(CHART_BACKENDS), format_func=CHART_BACKENDS.get, horizontal=True,
+                    index=list(CHART_BACKENDS).index(DEFAULT_CHART_BACKEND), key="chart_backend")
+
+
+def render_chart(spec):
+    st.vega_lite_chart(spec, use_container_width=True)
+
+
+# ===============================
+# Layers
+# ===============================
+
+def _color(color):
+    return TAB_COLORS.get(color, color)
+
+
+def _points(x, y):
+    """[{"x": .., "y": ..}] for the finite (x, y) pairs."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    return [{"x": a, "y": b} for a, b in zip(np.round(x[keep], DECIMALS).tolist(), np.round(y[keep], DECIMALS).tolist())]
+
+
+def scatter(x, y, label, color="tab:blue", axis="left"):
+    return {"label": label, "color": _color(color), "axis": axis, "mark": {"type": "circle", "size": 25},
+            "values": _points(x, y)}
+
+
+def line(x, y, label, color="tab:blue", dashed=False, axis="left"):
+    mark = {"type": "line", "strokeWidth": 1.5}
+    if dashed:
+        mark["strokeDash"] = [6, 4]
+    return {"label": label, "color": _color(color), "axis": axis, "mark": mark, "values": _points(x, y)}
+
+
+def rule(x, label, color="blue"):
+    """Vertical line at x (spans the whole plot)."""
+    return {"label": label, "color": _color(color), "axis": "left", "mark": {"type": "rule", "strokeDash": [2, 3]},
+            "values": [{"x": round(float(x), DECIMALS)}]}
+
+
+def band(start, end, label, color="green", opacity=0.15):
+    """Shaded x range (spans the whole plot)."""
+    return {"label": label, "color": _color(color), "axis": "left", "mark": {"type": "rect", "opacity": opacity},
+            "values": [{"x": round(float(start), DECIMALS), "x2": round(float(end), DECIMALS)}]}
+
+
+def _layer_spec(layer, color_scale, x_title, y_title):
+    encoding = {
+        "x": {"field": "x", "type": "quantitative", "title": x_title, "scale": {"zero": False}},
+        "color": {"field": "series", "type": "nominal", "scale": color_scale, "legend": {"title": None, "orient": "top"}},
+    }
+    if layer["mark"]["type"] == "rect":
+        encoding["x2"] = {"field": "x2"}
+    elif layer["mark"]["type"] != "rule":
+        encoding["y"] = {"field": "y", "type": "quantitative", "title": y_title, "scale": {"zero": False}}
+        encoding["tooltip"] = [{"field": "x", "title": x_title, "format": ".2f"},
+                               {"field": "y", "title": layer["label"], "format": ".2f"}]
+    # The legend entry comes from a constant "series" field (a JS string literal, hence json.dumps)
+    return {"data": {"values": layer["values"]}, "transform": [{"calculate": json.dumps(layer["label"]), "as": "series"}],
+            "mark": layer["mark"], "encoding": encoding}
+
+
+def chart(layers, x_title, y_title, y2_title=None):
+    """Vega-Lite spec of layers over one x axis; layers with axis="right" get their own y axis (y2_title)."""
+    labels = list(dict.fromkeys(layer["label"] for layer in layers))
+    colors = {layer["label"]: layer["color"] for layer in layers}
+    color_scale = {"domain": labels, "range": [colors[label] for label in labels]}
+
+    left = [_layer_spec(layer, color_scale, x_title, y_title) for layer in layers if layer["axis"] == "left"]
+    right = [_layer_spec(layer, color_scale, x_title, y2_title) for layer in layers if layer["axis"] == "right"]
+
+    # Drag to pan, scroll to zoom (selections have to sit on a single layer)
+    left[0]["params"] = [{"name": "zoom", "select": "interval", "bind": "scales"}]
+
+    if not right:
+        return {"height": CHART_HEIGHT, "layer": left}
+    return {"height": CHART_HEIGHT, "layer": [{"layer": left}, {"layer": right}],
+            "resolve": {"scale": {"y": "independent"}}}
+
+
+def pie(labels, values, colors, text):
+    """Vega-Lite pie: one wedge per label, `text` printed next to each wedge."""
+    rows = [{"label": label, "value": round(float(value), 1), "text": txt}
+            for label, value, txt in zip(labels, values, text)]
+    color = {"field": "label", "type": "nominal", "sort": None,
+             "scale": {"domain": list(labels), "range": [_color(c) for c in colors]}, "legend": {"title": None}}
+    return {
+        "height": CHART_HEIGHT,
+        "data": {"values": rows},
+        "encoding": {"theta": {"field": "value", "type": "quantitative", "stack": True}, "color": color,
+                     "order": {"field": "order", "type": "quantitative"}},
+        "transform": [{"window": [{"op": "row_number", "as": "order"}]}],
+        "layer": [
+            {"mark": {"type": "arc", "outerRadius": 110},
+             "encoding": {"tooltip": [{"field": "label"}, {"field": "text"}]}},
+            {"mark": {"type": "text", "radius": 145, "fontSize": 11, "lineBreak": "\n"},
+             "encoding": {"text": {"field": "text"}, "color": {"value": "black"}}},
+        ],
+    }
@@ -0,0 +1,247 @@
+import logging
+import time
+from datetime import datetime
+import streamlit as st
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from utils.metrics import timed
+
+###################################
+#Report Draft Autosave
+#Tracks which report fields (per-plot comment/include, summary) a lab tech has
+#changed in this session and writes them to MongoDB in a single batched $set,
+#either after the edits have settled for AUTOSAVE_DEBOUNCE_SECONDS or right
+#away on navigation / PDF generation.
+#Writes are guarded by the report's `last_updated` value (optimistic concurrency):
+#if another tech saved the same report in the meantime nothing is overwritten and
+#the draft is flagged as a conflict for the UI to resolve.
+###################################
+
+logger = logging.getLogger(__name__)
+
+# Seconds without new edits before dirty fields are flushed
+AUTOSAVE_DEBOUNCE_SECONDS = 5
+
+# Session state key the draft lives under
+DRAFT_STATE_KEY = "report_draft"
+
+
+@st.cache_resource
+def ensure_report_indexes(_reports_col):
+    """Create the unique (user_id, test_id) index the upserts rely on, once per process."""
+    try:
+        _reports_col.create_index([("user_id", 1), ("test_id", 1)], unique=True)
+    except OperationFailure as e:
+        # Existing duplicate reports; the version check still guards updates
+        logger.warning("Could not create unique report index: %s", e)
+    return True
+
+
+def _mongo_now():
+    """Current UTC time truncated to the millisecond precision MongoDB stores."""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def _has_content(saved):
+    """True for a report saved from the builder; reports holding only a batch PDF record have no last_updated."""
+    return bool(saved and saved.get("last_updated"))
+
+
+class ReportDraft:
+    def __init__(self, reports_col, user_id, test_id, test_type, test_date, plot_titles,
+                 debounce_seconds=AUTOSAVE_DEBOUNCE_SECONDS):
+        """Attach to (or start) the session's draft for one client/test report."""
+        self.reports_col = reports_col
+        self.user_id = user_id
+        self.test_id = test_id
+        self.test_type = test_type
+        self.test_date = test_date
+        self.plot_titles = plot_titles
+        self.debounce_seconds = debounce_seconds
+
+        ensure_report_indexes(reports_col)
+
+        # Start a fresh draft when none exists or it belongs to another test
+        state = st.session_state.get(DRAFT_STATE_KEY)
+        if not state or state.get("test_id") != test_id:
+            saved = reports_col.find_one(
+                {"user_id": user_id, "test_id": test_id},
+                {"last_updated": 1, "activity_level": 1}
+            )
+            state = {
+                "test_id": test_id,
+                "user_id": user_id,
+                "test_type": test_type,
+                "test_date": test_date,
+                "plot_titles": list(plot_titles),
+                "dirty": {},                 # MongoDB field path -> new value
+                "last_edit": 0.0,
+                "base": saved.get("last_updated") if saved else None,  # version we edit on top of
+                "exists": _has_content(saved),
+                "status": "saved",           # saved | dirty | conflict
+                "saved_at": None,
+                "activity_level": (saved or {}).get("activity_level", "moderate"),
+            }
+            st.session_state[DRAFT_STATE_KEY] = state
+        self.state = state
+
+    # ==============================
+    # Tracking edits
+    # ==============================
+
+    def mark_plot(self, index, title, comment, include):
+        """Record a changed comment/include flag for one plot."""
+        self._mark(f"plots.{index}", {
+            "index": index,
+            "title": title,
+            "comment": comment,
+            "include": include
+        })
+
+    def mark_summary(self, summary):
+        """Record a changed summary text."""
+        self._mark("summary", summary)
+
+    def mark_activity_level(self, activity_level):
+        """Record a changed activity level (RMR TDEE plots)."""
+        self.state["activity_level"] = activity_level
+        self._mark("activity_level", activity_level)
+
+    def _mark(self, field, value):
+        self.state["dirty"][field] = value
+        self.state["last_edit"] = time.time()
+        if self.state["status"] != "conflict":
+            self.state["status"] = "dirty"
+
+    @property
+    def is_dirty(self):
+        return bool(self.state["dirty"])
+
+    # ==============================
+    # Flushing
+    # ==============================
+
+    def _full_report_fields(self):
+        """Every plot entry, the summary and other dirty fields (dirty values win), for creating the report document."""
+        comments = st.session_state.get("plot_comments", {})
+        flags = st.session_state.get("include_plot_flags", {})
+        plots = [
+            {
+                "index": i,
+                "title": title,
+                "comment": comments.get(title, ""),
+                "include": flags.get(title, True)
+            }
+            for i, title in enumerate(self.plot_titles)
+        ]
+        fields = {"summary": st.session_state.get("initial_report_text", "")}
+
+        for field, value in self.state["dirty"].items():
+            if field.startswith("plots."):
+                if value["index"] < len(plots):
+                    plots[value["index"]] = value
+            else:
+                fields[field] = value
+        fields["plots"] = plots
+        return fields
+
+    def flush(self, immediate=False, overwrite=False):
+        """Write dirty fields in one $set. Returns True when nothing is left unsaved.
+
+        immediate: skip the debounce wait (navigation, PDF generation, "Save All").
+        overwrite: skip the last_updated check (the user chose to overwrite after a conflict).
+        """
+        state = self.state
+        if not state["dirty"]:
+            return True
+        if state["status"] == "conflict" and not overwrite:
+            return False
+        if not immediate and time.time() - state["last_edit"] < self.debounce_seconds:
+            return False
+
+        now = _mongo_now()
+        query = {"user_id": self.user_id, "test_id": self.test_id}
+        if not overwrite:
+            query["last_updated"] = state["base"]
+
+        # Creating (or overwriting) the report writes the whole plots array;
+        # otherwise only the dirty plots.<i> / summary paths are sent
+        full_write = overwrite or not state["exists"]
+        fields = self._full_report_fields() if full_write else dict(state["dirty"])
+        fields.update({
+            "user_id": self.user_id,
+            "test_id": self.test_id,
+            "test_type": self.test_type,
+            "test_date": self.test_date,
+            "last_updated": now,
+        })
+
+        try:
+            with timed("mongo:save_draft"):
+                result = self.reports_col.update_one(query, {"$set": fields}, upsert=full_write)
+        except DuplicateKeyError:
+            # Someone else created the report since this draft started
+            state["status"] = "conflict"
+            return False
+
+        # No match: the report's last_updated moved on (or it was deleted) since we loaded it
+        if result.matched_count == 0 and result.upserted_id is None:
+            state["status"] = "conflict"
+            return False
+
+        state.update({
+            "dirty": {},
+            "base": now,
+            "exists": True,
+            "status": "saved",
+            "saved_at": now,
+        })
+        return True
+
+    def discard(self):
+        """Drop unsaved edits and adopt the currently saved report version."""
+        saved = self.reports_col.find_one(
+            {"user_id": self.user_id, "test_id": self.test_id},
+            {"last_updated": 1}
+        )
+        self.state.update({
+            "dirty": {},
+            "base": saved.get("last_updated") if saved else None,
+            "exists": _has_content(saved),
+            "status": "saved",
+        })
+
+
+def flush_session_draft(reports_col):
+    """Flush the session's draft right away (used when leaving the builder). True if nothing is left unsaved."""
+    state = st.session_state.get(DRAFT_STATE_KEY)
+    if not state:
+        return True
+    draft = ReportDraft(
+        reports_col, state["user_id"], state["test_id"],
+        state["test_type"], state["test_date"], state["plot_titles"]
+    )
+    return draft.flush(immediate=True)
+
+
+def render_autosave_status(draft):
+    """Flush settled edits and show the draft's save status / conflict resolution controls."""
+    draft.flush()
+    state = draft.state
+
+    if state["status"] == "conflict":
+        st.warning("⚠️ This report was saved by someone else after you opened it. Your latest edits have not been saved.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("⬆️ Overwrite with my changes", key="draft_overwrite"):
+                draft.flush(immediate=True, overwrite=True)
+                st.rerun(scope="fragment")
+        with col2:
+            if st.button("🔄 Discard my changes and reload", key="draft_reload"):
+                draft.discard()
+                st.session_state.report_loaded = False
+                st.rerun()
+    elif state["status"] == "dirty":
+        st.caption("✏️ Unsaved changes, autosaving…")
+    elif state["saved_at"]:
+        st.caption(f"✅ All changes saved ({state['saved_at']:%H:%M:%S} UTC)")
@@ -0,0 +1,89 @@
+import hashlib
+import json
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+from utils.test_frames import document_version
+from utils.storage import BUCKET_NAME
+
+###################################
+#Report Fingerprints
+#A report PDF only depends on the test data, the saved comments / plot selections,
+#the summary, the RMR activity level and the PDF layout. We hash those into a
+#fingerprint and keep it on the `reports` document next to the S3 key and ETag of
+#the PDF built from them:
+#    pdf: {fingerprint, s3_key, etag, generated_at, thumbnail_key}
+#Tests without saved comments get a `reports` document holding only this record (no
+#`last_updated`), so their PDFs are reused as well.
+#When nothing changed the existing PDF is reused instead of being rebuilt.
+###################################
+
+# Bump when a PDF layout changes so every report of that type is regenerated
+TEMPLATE_VERSIONS = {
+    "VO2 Max": 2,
+    "RMR": 2,
+}
+
+
+def report_fingerprint(document, plot_titles, plot_comments, include_flags, summary, activity_level=None):
+    """Hash everything a report PDF is built from (sha256 hex digest)."""
+    test_type = document.get("test_type")
+    content = {
+        "test_id": str(document.get("_id")),
+        "test_version": document_version(document),
+        "template": [test_type, TEMPLATE_VERSIONS.get(test_type, 0)],
+        # Only the plot titles of this test type, with the builder's defaults filled in
+        "plots": [
+            [title, plot_comments.get(title, "") or "", bool(include_flags.get(title, True))]
+            for title in plot_titles
+        ],
+        "summary": summary or "",
+        "activity_level": activity_level if test_type == "RMR" else None,
+    }
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def current_pdf(s3_client, report, fingerprint, bucket_name=BUCKET_NAME):
+    """Return the S3 key of the saved PDF if it was built from `fingerprint` and is still in S3, else None."""
+    pdf = (report or {}).get("pdf") or {}
+    if not pdf.get("s3_key") or pdf.get("fingerprint") != fingerprint:
+        return None
+
+    # The object may have been replaced (same filename, other test) or deleted since
+    try:
+        head = s3_client.head_object(Bucket=bucket_name, Key=pdf["s3_key"])
+    except ClientError:
+        return None
+    if pdf.get("etag") and head.get("ETag") != pdf["etag"]:
+        return None
+    return pdf["s3_key"]
+
+
+def uploaded_etag(s3_client, s3_key, bucket_name=BUCKET_NAME):
+    """ETag of an uploaded object (upload_file / upload_fileobj don't return it)."""
+    return s3_client.head_object(Bucket=bucket_name, Key=s3_key).get("ETag")
+
+
+def record_pdf(reports_col, user_id, test_id, fingerprint, s3_key, etag, thumbnail_key=None,
+               test_type=None, test_date=None):
+    """Store the fingerprint / S3 key / ETag (and preview key) of a freshly uploaded PDF on its report.
+
+    Upserts on (user_id, test_id): tests without a saved report get one holding only the
+    PDF record (plus test_type / test_date for the viewer).
+    Doesn't touch `last_updated`, so open report drafts are not put in conflict.
+    """
+    reports_col.update_one(
+        {"user_id": user_id, "test_id": test_id},
+        {
+            "$set": {"pdf": {
+                "fingerprint": fingerprint,
+                "s3_key": s3_key,
+                "etag": etag,
+                "generated_at": datetime.utcnow(),
+                "thumbnail_key": thumbnail_key,
+            }},
+            "$setOnInsert": {"test_type": test_type, "test_date": test_date},
+        },
+        upsert=True
+    )
@@ -0,0 +1,79 @@
+import io
+import matplotlib
+from utils.report_assets import SharedImage, raster_plot
+
+try:
+    from svglib.svglib import svg2rlg
+except ImportError:  # optional: without svglib plots are embedded as PNG
+    svg2rlg = None
+
+###################################
+#Report Plot Graphics
+#Turns the matplotlib figures of a report into ReportLab flowables.
+#"svg": the figure is saved as SVG and converted to a ReportLab Drawing (via svglib), so
+#       lines, markers and text stay vector graphics in the PDF (sharp when printed).
+#       Layers with more than RASTERIZE_MIN_POINTS points (dense breath-by-breath scatter)
+#       are rasterized at RASTER_DPI inside the vector figure to keep the PDF small.
+#"png" / "jpeg": raster plots, encoded per the settings in utils/report_assets.py.
+#svglib is optional; without it "svg" falls back to PNG.
+###################################
+
+PLOT_FORMATS = ("svg", "png", "jpeg")
+DEFAULT_PLOT_FORMAT = "svg" if svg2rlg is not None else "png"
+
+# Scatter/line layers with more points than this are rasterized (None = never)
+RASTERIZE_MIN_POINTS = 2000
+RASTER_DPI = 200
+
+
+def _point_count(artist):
+    if hasattr(artist, "get_offsets"):
+        return len(artist.get_offsets())
+    if hasattr(artist, "get_xdata"):
+        return len(artist.get_xdata())
+    return 0
+
+
+def rasterize_dense_layers(fig, min_points=RASTERIZE_MIN_POINTS):
+    """Mark scatter/line layers with more than `min_points` points as rasterized. Returns how many were marked."""
+    if min_points is None:
+        return 0
+    marked = 0
+    for ax in fig.axes:
+        for artist in list(ax.collections) + list(ax.lines):
+            if _point_count(artist) > min_points:
+                artist.set_rasterized(True)
+                marked += 1
+    return marked
+
+
+def render_figure(fig, plot_format=None):
+    """Capture a finished figure for the PDF: a ReportLab Drawing ("svg") or an ImageReader ("png"/"jpeg").
+
+    The figure can be closed afterwards; size it into the layout with plot_flowable().
+    """
+    plot_format = plot_format or DEFAULT_PLOT_FORMAT
+    if plot_format not in PLOT_FORMATS:
+        raise ValueError(f"Unknown plot format: {plot_format}")
+
+    buf = io.BytesIO()
+    if plot_format == "svg" and svg2rlg is not None:
+        rasterize_dense_layers(fig, RASTERIZE_MIN_POINTS)
+        # Keep text as <text> (much smaller than glyph paths); svglib maps it to Helvetica
+        with matplotlib.rc_context({"svg.fonttype": "none"}):
+            fig.savefig(buf, format="svg", dpi=RASTER_DPI)
+        # svglib only understands the keyword form of bold
+        svg = buf.getvalue().replace(b"font-weight: 700", b"font-weight: bold")
+        return svg2rlg(io.BytesIO(svg))
+
+    return raster_plot(fig, "jpeg" if plot_format == "jpeg" else "png")
+
+
+def plot_flowable(graphic, width, height, h_align="CENTER"):
+    """Flowable of a captured figure scaled to width x height points."""
+    if hasattr(graphic, "scale"):  # svglib Drawing
+        graphic.scale(width / graphic.width, height / graphic.height)
+        graphic.width, graphic.height = width, height
+        graphic.hAlign = h_align
+        return graphic
+    return SharedImage(graphic, width, height, h_align)
@@ -0,0 +1,216 @@
+import threading
+from functools import lru_cache
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import LETTER, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import BaseDocTemplate, Frame, PageTemplate, TableStyle
+
+###################################
+#Report Layouts
+#Page geometry, page templates, paragraph styles and table styles of the PDF reports,
+#prepared once instead of on every build. The build_pdf methods only supply content.
+#Styles and table styles are read-only and shared by the whole process. Frames keep a
+#cursor while a document is built, so each thread gets its own set of page templates
+#(threading.local) and reuses it for every report it builds.
+###################################
+
+# Draw outlines around the RMR layout blocks while adjusting the layout
+DEBUG_LAYOUT = False
+
+
+# ===============================
+# Geometry
+# ===============================
+
+# VO2 Max: portrait letter, header + two columns on page 1, two plots per later page
+VO2_PAGE_SIZE = LETTER
+VO2_MARGINS = {"leftMargin": 72, "rightMargin": 72, "topMargin": 5, "bottomMargin": 140}
+VO2_HEADER_HEIGHT = 180
+VO2_PLOT_MARGIN = 30       # left/right margin of the plot pages
+VO2_PLOT_GUTTER = 12
+VO2_PLOT_WIDTH = (VO2_PAGE_SIZE[0] - 2 * VO2_PLOT_MARGIN - VO2_PLOT_GUTTER) / 2
+VO2_PLOT_HEIGHT = 190
+
+# RMR: landscape letter, single frame with a footer bar
+RMR_PAGE_SIZE = landscape(LETTER)
+RMR_MARGINS = {"leftMargin": 20, "rightMargin": 20, "topMargin": 0, "bottomMargin": 30}
+
+
+# ===============================
+# Styles (shared, read-only)
+# ===============================
+
+@lru_cache(maxsize=None)
+def report_styles():
+    """The paragraph style sheet of the reports (built once per process)."""
+    return getSampleStyleSheet()
+
+
+def _debug_box(color):
+    return [("BOX", (0, 0), (-1, -1), 0.75, color)] if DEBUG_LAYOUT else []
+
+
+_NO_PADDING = [
+    ("LEFTPADDING", (0, 0), (-1, -1), 0),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+    ("TOPPADDING", (0, 0), (-1, -1), 0),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+]
+
+# VO2 Max tables
+VO2_CLIENT_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightblue),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+])
+
+VO2_RESULTS_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.black),
+    ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+])
+
+# RMR tables
+RMR_BLUE = colors.HexColor("#0077CC")
+RMR_LIGHT_BLUE = colors.HexColor("#E6F2FF")
+
+RMR_LOGO_STYLE = TableStyle([
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+    *_debug_box(colors.blue),
+])
+
+RMR_TITLE_STYLE = TableStyle([
+    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ("TOPPADDING", (0, 0), (-1, -1), 4),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 4),
+    *_debug_box(colors.green),
+])
+
+RMR_CLIENT_TABLE_STYLE = TableStyle([
+    ("BACKGROUND", (0, 0), (-1, 0), RMR_LIGHT_BLUE),
+    ("TEXTCOLOR", (0, 0), (-1, 0), RMR_BLUE),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("GRID", (0, 0), (-1, -1), 1, colors.grey),
+])
+
+RMR_RESULTS_TABLE_STYLE = TableStyle([
+    ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ("BACKGROUND", (0, 0), (-1, 0), RMR_LIGHT_BLUE),
+    ("TEXTCOLOR", (0, 0), (-1, 0), RMR_BLUE),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    # Highlight the Avg RMR and RQ rows
+    ("TEXTCOLOR", (1, 1), (1, 1), colors.red),
+    ("FONTNAME", (0, 1), (1, 1), "Helvetica-Bold"),
+    ("TEXTCOLOR", (1, 3), (1, 3), colors.red),
+    ("FONTNAME", (0, 3), (1, 3), "Helvetica-Bold"),
+])
+
+RMR_LEFT_STACK_STYLE = TableStyle(_NO_PADDING + _debug_box(colors.red))
+
+RMR_CHART_CELL_STYLE = TableStyle(_NO_PADDING + [
+    ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+] + _debug_box(colors.green))
+
+RMR_TOP_ROW_STYLE = TableStyle([("VALIGN", (0, 0), (-1, -1), "TOP")] + _NO_PADDING)
+
+RMR_PIE_ROW_STYLE = TableStyle([
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ("ALIGN", (0, 0), (0, 0), "LEFT"),   # left column left-aligned
+    ("LEFTPADDING", (0, 0), (-1, -1), 2),
+    ("RIGHTPADDING", (0, 0), (-1, -1), 2),
+    ("TOPPADDING", (0, 0), (-1, -1), 2),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+    *([("GRID", (0, 0), (-1, -1), 0.25, colors.grey)] if DEBUG_LAYOUT else []),
+])
+
+
+# ===============================
+# Page templates (one set per thread)
+# ===============================
+
+def _vo2max_templates():
+    left, right = VO2_MARGINS["leftMargin"], VO2_MARGINS["rightMargin"]
+    bottom = VO2_MARGINS["bottomMargin"]
+    width, height = VO2_PAGE_SIZE
+    content_width = width - left - right
+    body_height = height - VO2_MARGINS["topMargin"] - bottom - VO2_HEADER_HEIGHT
+    plot_right_x = VO2_PLOT_MARGIN + VO2_PLOT_WIDTH + VO2_PLOT_GUTTER
+
+    return [
+        PageTemplate(
+            id='ContentPage',
+            frames=[
+                Frame(left, bottom + body_height, content_width, VO2_HEADER_HEIGHT, id='header'),
+                Frame(left, bottom, content_width / 2 - 6, body_height, id='left'),
+                Frame(left + content_width / 2 + 6, bottom, content_width / 2 - 6, body_height, id='right'),
+                Frame(left, bottom, content_width, body_height, id='bottom')
+            ]
+        ),
+        PageTemplate(
+            id='PlotPage',
+            frames=[
+                Frame(VO2_PLOT_MARGIN, height - 350, VO2_PLOT_WIDTH, 300, id='plot_left'),
+                Frame(plot_right_x, height - 350, VO2_PLOT_WIDTH, 300, id='plot_right'),
+                Frame(VO2_PLOT_MARGIN, bottom, width - 2 * VO2_PLOT_MARGIN, 350, id='comments')
+            ]
+        )
+    ]
+
+
+def _rmr_footer(canvas, doc):
+    """Solid blue bar along the bottom of every RMR page."""
+    canvas.saveState()
+    canvas.setFillColor(RMR_BLUE)
+    canvas.rect(x=doc.leftMargin, y=15, width=doc.width, height=10, fill=True, stroke=0)
+    canvas.restoreState()
+
+
+def _rmr_templates():
+    width, height = RMR_PAGE_SIZE
+    left, bottom = RMR_MARGINS["leftMargin"], RMR_MARGINS["bottomMargin"]
+    frame = Frame(
+        left, bottom,
+        width - left - RMR_MARGINS["rightMargin"],
+        height - RMR_MARGINS["topMargin"] - bottom,
+        id='normal'
+    )
+    return [PageTemplate(id='RMRPage', frames=[frame], onPage=_rmr_footer, pagesize=RMR_PAGE_SIZE)]
+
+
+_TEMPLATE_BUILDERS = {
+    "vo2max": _vo2max_templates,
+    "rmr": _rmr_templates,
+}
+
+_local = threading.local()
+
+
+def page_templates(layout):
+    """This thread's prepared page templates for a layout ("vo2max" or "rmr")."""
+    templates = getattr(_local, "templates", None)
+    if templates is None:
+        templates = _local.templates = {}
+    if layout not in templates:
+        templates[layout] = _TEMPLATE_BUILDERS[layout]()
+    return templates[layout]
+
+
+def vo2max_document(output):
+    """Document for a VO2 Max report, using the prepared page templates."""
+    return BaseDocTemplate(output, pagesize=VO2_PAGE_SIZE, pageTemplates=page_templates("vo2max"), **VO2_MARGINS)
+
+
+def rmr_document(output):
+    """Document for an RMR report, using the prepared page template (footer included)."""
+    return BaseDocTemplate(output, pagesize=RMR_PAGE_SIZE, pageTemplates=page_templates("rmr"), **RMR_MARGINS)
@@ -0,0 +1,66 @@
+import io
+import logging
+import threading
+
+from utils.storage import upload_bytes, BUCKET_NAME
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional: without it no previews are made and the viewer shows none
+    pdfium = None
+
+###################################
+#Report Thumbnails
+#A small PNG of a report's first page is rendered when the PDF is created and stored
+#next to it in S3 (reports/<name>.pdf -> reports/<name>.thumb.png), so the viewer can
+#show previews of all of a client's reports without downloading the PDFs.
+#Rendering needs pypdfium2 (optional).
+###################################
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTH = 320   # pixels
+THUMBNAIL_COLORS = 128  # palette size, previews don't need more
+
+# PDFium is not thread-safe; Streamlit sessions run in threads
+_render_lock = threading.Lock()
+
+
+def thumbnail_key(pdf_key):
+    """S3 key of the preview stored next to a report PDF."""
+    stem = pdf_key[:-4] if pdf_key.lower().endswith(".pdf") else pdf_key
+    return f"{stem}.thumb.png"
+
+
+def render_thumbnail(pdf_bytes, width=THUMBNAIL_WIDTH):
+    """PNG bytes of the first page scaled to `width` pixels, or None if pypdfium2 is missing / the PDF is unreadable."""
+    if pdfium is None:
+        return None
+    try:
+        with _render_lock:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            try:
+                page = pdf[0]
+                image = page.render(scale=width / page.get_width()).to_pil()
+            finally:
+                pdf.close()
+    except Exception as e:
+        logger.warning("Could not render report thumbnail: %s", e)
+        return None
+
+    out = io.BytesIO()
+    image.convert("RGB").quantize(colors=THUMBNAIL_COLORS).save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def store_thumbnail(s3_client, pdf_bytes, pdf_key, thumbnail=None, bucket_name=BUCKET_NAME):
+    """Render (unless given) and upload the preview of a report PDF. Returns its S3 key, or None."""
+    thumbnail = thumbnail or render_thumbnail(pdf_bytes)
+    if thumbnail is None:
+        return None
+    key = thumbnail_key(pdf_key)
+    upload = upload_bytes(s3_client, thumbnail, key, content_type="image/png", bucket_name=bucket_name)
+    if upload["error"]:
+        logger.warning("Thumbnail upload failed for %s: %s", key, upload["error"])
+        return None
+    return key
@@ -0,0 +1,169 @@
+import io
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from utils.metrics import observe
+
+###################################
+#S3 Storage
+#Report PDFs (and their previews) go through here instead of calling upload_file /
+#download_file directly:
+#- tuned multipart settings (TRANSFER_CONFIG) for every transfer
+#- upload_many / download_many run transfers on one shared thread pool
+#- failed transfers are retried with exponential backoff + jitter
+#- every transfer is timed; the recent ones are kept in TRANSFER_LOG (and the timings go
+#  to utils/metrics.py as "s3:upload" / "s3:download")
+#The client comes from utils.data_cache.get_s3_client(); set `s3_endpoint_url` in .env to
+#point it at a local stand-in (moto server, MinIO, ...). Functions take the client as an
+#argument so tests can pass a moto-mocked one.
+###################################
+
+BUCKET_NAME = "champ-hpl-bucket"
+
+# Transfers running at once on the shared pool, and parts per multipart transfer
+TRANSFER_THREADS = int(os.getenv("S3_TRANSFER_THREADS", 8))
+PART_CONCURRENCY = int(os.getenv("S3_PART_CONCURRENCY", 4))
+
+# Reports are ~0.1-1 MB: single PUT below 8 MB, 8 MB parts above (archives, exports)
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=PART_CONCURRENCY,
+    use_threads=True,
+)
+
+# Client settings: enough pooled connections for every thread/part, and no botocore retries
+# (total_max_attempts counts the first try): transfers are retried below as a whole, so a
+# failing transfer is tried RETRY_ATTEMPTS times, not RETRY_ATTEMPTS x botocore's attempts
+CLIENT_CONFIG = Config(
+    max_pool_connections=TRANSFER_THREADS * PART_CONCURRENCY,
+    retries={"total_max_attempts": 1, "mode": "standard"},
+)
+
+# The only retry layer (whole transfer), also covers dropped connections mid-upload
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5   # seconds, doubled per attempt
+
+# Recent transfers (dicts with key/direction/bytes/seconds/attempts/error)
+TRANSFER_LOG = deque(maxlen=500)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def transfer_pool():
+    """The process-wide thread pool transfers run on."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=TRANSFER_THREADS, thread_name_prefix="s3-transfer")
+        return _pool
+
+
+def _retryable(error):
+    """Client errors (missing key, access denied, ...) won't fix themselves; throttling and 5xx might."""
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error.response.get("Error", {}).get("Code", "")
+        return status >= 500 or status in (408, 429) or code in ("SlowDown", "Throttling", "RequestTimeout")
+    return True
+
+
+def _transfer(direction, key, size, action, retries=RETRY_ATTEMPTS):
+    """Run `action` with retries and record its timing. Returns the transfer record (error=None on success).
+
+    size=None: the size is taken from the returned bytes (downloads).
+    """
+    record = {"direction": direction, "key": key, "bytes": size, "seconds": 0.0, "attempts": 0,
+              "error": None, "value": None}
+    started = time.perf_counter()
+    for attempt in range(1, retries + 1):
+        record["attempts"] = attempt
+        try:
+            record["value"] = action()
+            record["error"] = None
+            break
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            if attempt == retries or not _retryable(e):
+                break
+            time.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+    record["seconds"] = time.perf_counter() - started
+    if size is None:
+        record["bytes"] = len(record["value"] or b"")
+    TRANSFER_LOG.append({k: v for k, v in record.items() if k != "value"})
+    observe(f"s3:{direction}", record["seconds"])
+    return record
+
+
+# ===============================
+# Single transfers
+# ===============================
+
+def upload_bytes(s3_client, data, key, content_type="application/pdf", bucket_name=BUCKET_NAME):
+    """Upload bytes to `key` (shown inline in the browser). Returns the transfer record."""
+    extra_args = {"ContentType": content_type, "ContentDisposition": "inline"}
+
+    def action():
+        s3_client.upload_fileobj(io.BytesIO(data), bucket_name, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+
+    return _transfer("upload", key, len(data), action)
+
+
+def upload_path(s3_client, path, key, content_type="application/pdf", bucket_name=BUCKET_NAME):
+    """Upload a local file to `key`. Returns the transfer record."""
+    extra_args = {"ContentType": content_type, "ContentDisposition": "inline"}
+
+    def action():
+        s3_client.upload_file(path, bucket_name, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+
+    return _transfer("upload", key, os.path.getsize(path), action)
+
+
+def download_bytes(s3_client, key, bucket_name=BUCKET_NAME):
+    """Download `key` into memory. Returns the transfer record; the bytes are in record["value"]."""
+    def action():
+        buf = io.BytesIO()
+        s3_client.download_fileobj(bucket_name, key, buf, Config=TRANSFER_CONFIG)
+        return buf.getvalue()
+
+    return _transfer("download", key, None, action)
+
+
+# ===============================
+# Batches (shared pool)
+# ===============================
+
+def upload_many(s3_client, items, content_type="application/pdf", bucket_name=BUCKET_NAME):
+    """Upload [(key, bytes), ...] concurrently. Returns the transfer records in input order."""
+    futures = [
+        transfer_pool().submit(upload_bytes, s3_client, data, key, content_type, bucket_name)
+        for key, data in items
+    ]
+    return [future.result() for future in futures]
+
+
+def download_many(s3_client, keys, bucket_name=BUCKET_NAME):
+    """Download several keys concurrently. Returns the transfer records in input order."""
+    futures = [transfer_pool().submit(download_bytes, s3_client, key, bucket_name) for key in keys]
+    return [future.result() for future in futures]
+
+
+def transfer_summary(records=None):
+    """Count, bytes, total seconds and MB/s per direction (default: TRANSFER_LOG)."""
+    summary = {}
+    for record in list(TRANSFER_LOG) if records is None else records:
+        stats = summary.setdefault(record["direction"], {"count": 0, "failed": 0, "bytes": 0, "seconds": 0.0})
+        stats["count"] += 1
+        stats["failed"] += record["error"] is not None
+        stats["bytes"] += record["bytes"]
+        stats["seconds"] += record["seconds"]
+    for stats in summary.values():
+        stats["mb_per_second"] = stats["bytes"] / 1e6 / stats["seconds"] if stats["seconds"] else 0.0
+    return summary
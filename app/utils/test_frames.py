@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from utils.metrics import timed
+from analysis.downsample import plot_data
+
+###################################
+#Test Frame Loader
+#Builds the DataFrame the report builder plots from a test document once per
+#(test_id, document version) and shares it across reruns and sessions.
+#Frames are already unit-converted, use float32 columns and are read-only:
+#derive new frames (sort_values, filtering, ...) instead of writing into them.
+#load_plot_frames() does the same for the downsampled "Plot Data" the scatters draw
+#(see analysis/downsample.py): one small (x, y) frame per plotted channel.
+#RMR tests parsed before the column names were fixed stored REE (kcal/day) as "HR" and
+#RMR (kcal/kg/hr) as "REE"; their frames are built with the right names.
+###################################
+
+# Upper bound on how many test frames stay resident per process
+MAX_CACHED_FRAMES = 32
+
+# Where each test type keeps its data inside the test document
+REPORT_KEYS = {
+    "VO2 Max": "VO2 Max Report Info",
+    "RMR": "RMR Report Info",
+}
+
+# Unit conversions applied while building the frame.
+# VO2 Max exports store VO2/VCO2 in L/min; the plots use mL/min. RMR exports are already in mL/min.
+UNIT_CONVERSIONS = {
+    "VO2 Max": {"VO2 STPD": 1000, "VCO2 STPD": 1000},
+    "RMR": {},
+}
+
+
+# Old -> right column names of tests stored with shifted names (see legacy_columns)
+LEGACY_COLUMNS = {
+    "RMR": {"HR": "REE", "REE": "RMR"},
+}
+
+
+def legacy_columns(document):
+    """Column renames for a test stored with the old shifted names, else {}."""
+    test_type = document.get("test_type", "")
+    records = document.get(REPORT_KEYS.get(test_type, ""), {}).get("Tabular Data") or []
+    renames = LEGACY_COLUMNS.get(test_type, {})
+    first = records[0] if records else {}
+    added = set(renames.values()) - set(renames)  # names only the fixed layout has ("RMR")
+    if renames and all(old in first for old in renames) and not any(name in first for name in added):
+        return renames
+    return {}
+
+
+def document_version(document):
+    """Return the version token of a test document (its 'version' field, else its upload date)."""
+    version = document.get("version") or document.get("Upload Date")
+    return str(version) if version is not None else ""
+
+
+@timed("parse_test")
+def build_test_frame(document):
+    """Build the read-only, unit-converted DataFrame for a test document (uncached)."""
+    test_type = document.get("test_type", "")
+    records = document[REPORT_KEYS[test_type]]["Tabular Data"]
+    conversions = UNIT_CONVERSIONS.get(test_type, {})
+
+    raw = pd.DataFrame.from_records(records).rename(columns=legacy_columns(document))
+
+    # Column-wise: coerce to float32, rescale, then freeze the underlying array
+    columns = {}
+    for col in raw.columns:
+        values = pd.to_numeric(raw[col], errors="coerce").to_numpy(dtype=np.float32)
+        if col in conversions:
+            values = values * np.float32(conversions[col])
+        values.flags.writeable = False
+        columns[col] = values
+
+    # copy=False keeps the frozen arrays as the frame's storage
+    return pd.DataFrame(columns, copy=False)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_FRAMES, show_spinner=False)
+def _cached_test_frame(test_id, version, _document):
+    return build_test_frame(_document)
+
+
+def load_test_frame(document):
+    """Return the shared test frame for a document, building it only when its id/version is new."""
+    return _cached_test_frame(str(document.get("_id")), document_version(document), document)
+
+
+# ===============================
+# Plot series
+# ===============================
+
+def _frozen_column(values, factor=1):
+    values = np.asarray(values, dtype=np.float32) * np.float32(factor)
+    values.flags.writeable = False
+    return values
+
+
+def build_plot_frames(document):
+    """{y column: read-only (x, y) frame} of a test's downsampled plot series, unit-converted (uncached)."""
+    test_type = document.get("test_type", "")
+    stored = document[REPORT_KEYS[test_type]].get("Plot Data")
+    if stored and not legacy_columns(document):
+        series = stored["Series"]
+        conversions = UNIT_CONVERSIONS.get(test_type, {})
+    else:
+        # Uploaded before plot data was stored (or stored from a shifted column): reduce the
+        # (already converted, correctly named) frame now
+        series = plot_data(load_test_frame(document), test_type)["Series"]
+        conversions = {}
+
+    return {
+        y_col: pd.DataFrame({col: _frozen_column(values, conversions.get(col, 1)) for col, values in columns.items()},
+                            copy=False)
+        for y_col, columns in series.items()
+    }
+
+
+@st.cache_resource(max_entries=MAX_CACHED_FRAMES, show_spinner=False)
+def _cached_plot_frames(test_id, version, _document):
+    return build_plot_frames(_document)
+
+
+def load_plot_frames(document):
+    """Return the shared downsampled plot frames for a document, memoized per id/version like the test frame."""
+    return _cached_plot_frames(str(document.get("_id")), document_version(document), document)
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from itertools import cycle
+
+import numpy as np
+
+from sample_tests import APP_DIR
+
+###################################
+#Load Test: concurrent sessions against a live server
+#Starts the app with `streamlit run` (in a child process) and drives it like N techs at
+#once over Streamlit's websocket protocol, the same messages a browser tab sends: each
+#session logs in, searches a client in the Report Builder, opens the builder, generates
+#the PDF, then looks the client up in the Report Viewer. Every step is one script run
+#(from sending the rerun to "script finished"), timed per concurrency level next to the
+#server process's CPU (from /proc, Linux) and resident memory.
+#
+#By default the server runs against in-process stand-ins: mongomock for MongoDB (seeded
+#with synthetic clients/tests, see synthetic_tests.py) and moto for S3. --mongo-uri /
+#--s3-endpoint point it at local services instead (a local mongod, moto_server, MinIO);
+#an empty database is seeded, one with clients in it is used as is.
+#
+#    python benchmarks/load_test.py [--sessions 1 2 4 8] [--iterations 2] [--output load.json]
+#
+#(AppTest can't be used for this: it swaps Streamlit's global runtime on every run, so
+#two AppTests can't run at the same time.)
+###################################
+
+APP_SCRIPT = os.path.join(APP_DIR, "streamlit_app.py")
+
+DEFAULT_SESSIONS = [1, 2, 4, 8]
+LOGIN = ("loadtest", "loadtest")
+
+# Seconds one step (script run) may take before the session gives up
+STEP_TIMEOUT = 180
+# Server CPU / memory sampling interval
+SAMPLE_SECONDS = 0.25
+
+STEPS = ["load", "login", "open_builder", "search", "open_report", "generate_pdf", "open_viewer", "view_reports"]
+
+
+# ===============================
+# Server (child process)
+# ===============================
+
+def seed_database(db, clients, seed):
+    """Synthetic clients/tests (if there are none yet) and the load test login. Returns client names."""
+    import bcrypt
+    from synthetic_tests import synthetic_batch
+
+    if db["users"].count_documents({}) == 0:
+        users, tests = synthetic_batch(seed, clients * 3)
+        db["users"].insert_many(users)
+        db["tests"].insert_many(tests)
+    if not db["authUsers"].find_one({"username": LOGIN[0]}):
+        db["authUsers"].insert_one({
+            "username": LOGIN[0],
+            "password": bcrypt.hashpw(LOGIN[1].encode("utf-8"), bcrypt.gensalt()),
+        })
+    return [user["Name"] for user in db["users"].find({}, {"Name": 1}).limit(clients)]
+
+
+def serve(args):
+    """Seed the stand-ins / local services, then run the app in this process (blocks)."""
+    import boto3
+    import pymongo
+    from streamlit.web import cli
+    from utils.storage import BUCKET_NAME
+
+    if args.mongo_uri:
+        os.environ["database_credentials"] = args.mongo_uri
+        client = pymongo.MongoClient(args.mongo_uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *a, **kw: client  # every MongoClient(...) in the app gets the stand-in
+
+    if args.s3_endpoint:
+        os.environ["s3_endpoint_url"] = args.s3_endpoint
+    else:
+        from moto import mock_aws
+        os.environ["s3_endpoint_url"] = ""  # keep a .env endpoint from bypassing the mock
+        mock_aws().start()
+    s3 = boto3.client("s3", region_name="us-east-1", endpoint_url=args.s3_endpoint or None)
+    if BUCKET_NAME not in [bucket["Name"] for bucket in s3.list_buckets().get("Buckets", [])]:
+        s3.create_bucket(Bucket=BUCKET_NAME)
+
+    names = seed_database(client["performance-lab"], args.clients, args.seed)
+    with open(args.names_file, "w") as f:
+        json.dump(names, f)
+
+    sys.argv = ["streamlit", "run", APP_SCRIPT, "--server.headless=true", f"--server.port={args.port}",
+                "--server.fileWatcherType=none", "--browser.gatherUsageStats=false", "--logger.level=error"]
+    cli.main()
+
+
+def start_server(args, names_file):
+    """Launch `serve` in a child process and wait until the app answers. Returns (process, client names)."""
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--port", str(args.port),
+               "--clients", str(args.clients), "--seed", str(args.seed), "--names-file", names_file]
+    if args.mongo_uri:
+        command += ["--mongo-uri", args.mongo_uri]
+    if args.s3_endpoint:
+        command += ["--s3-endpoint", args.s3_endpoint]
+    # PDFs are written to the working directory: keep them out of the repo
+    server = subprocess.Popen(command, cwd=os.path.dirname(names_file), stdout=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("The app server exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{args.port}/_stcore/health", timeout=2):
+                pass
+            with open(names_file) as f:
+                return server, json.load(f)
+        except (OSError, ValueError):
+            time.sleep(0.5)
+    server.kill()
+    raise SystemExit("The app server did not come up within 5 minutes")
+
+
+class ServerStats:
+    """Samples a process's CPU time and resident memory from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_kb = os.sysconf("SC_PAGE_SIZE") / 1024
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks  # utime + stime
+
+    def rss_mb(self):
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * self.page_kb / 1024
+
+    async def sample(self, samples, stop):
+        while not stop.is_set():
+            samples.append(self.rss_mb())
+            try:
+                await asyncio.wait_for(stop.wait(), SAMPLE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+# ===============================
+# Sessions (websocket clients)
+# ===============================
+
+class StepFailed(Exception):
+    pass
+
+
+class Session:
+    """One browser tab: the websocket, the widget values it sends back and what the last run showed."""
+
+    def __init__(self, url):
+        self.url = url
+        self.widgets = {}      # widget id -> WidgetState, resent with every rerun like the browser does
+        self.elements = []     # (kind, label, widget id, fragment id) of the last run
+        self.exceptions = []
+        self.pages = {}        # url path -> page script hash (from st.navigation)
+        self.page_hash = ""
+
+    async def __aenter__(self):
+        import websockets
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.ws.close()
+
+    async def rerun(self, page=None, trigger=None):
+        """Send a rerun (optionally switching page / clicking a button) and wait for the run to finish."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.page_script_hash = self.pages[page] if page else self.page_hash
+        state.widget_states.widgets.extend(self.widgets.values())
+        if trigger:
+            _, _, widget_id, fragment_id = trigger
+            state.widget_states.widgets.append(WidgetState(id=widget_id, trigger_value=True))
+            state.fragment_id = fragment_id
+        else:
+            self.elements = []
+        self.exceptions = []
+        await self.ws.send(msg.SerializeToString())
+        await asyncio.wait_for(self._read_run(), STEP_TIMEOUT)
+        if self.exceptions:
+            raise StepFailed(self.exceptions[0])
+
+    async def _read_run(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        done = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+                ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.elements = []  # a full run (st.rerun starts another one) redraws the page
+            elif kind == "navigation":
+                self.pages = {page.url_pathname: page.page_script_hash for page in msg.navigation.app_pages}
+                self.page_hash = msg.navigation.page_script_hash
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                proto = getattr(element, element_type)
+                if element_type == "exception":
+                    self.exceptions.append(proto.message)
+                self.elements.append((element_type, getattr(proto, "label", ""), getattr(proto, "id", ""),
+                                      msg.delta.fragment_id))
+            elif kind == "script_finished" and msg.script_finished in done:
+                return
+
+    def find(self, kind, label):
+        for element in self.elements:
+            if element[0] == kind and label in element[1]:
+                return element
+        raise StepFailed(f"no {kind} labelled {label!r} on the page")
+
+    def fill(self, label, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        widget_id = self.find("text_input", label)[2]
+        self.widgets[widget_id] = WidgetState(id=widget_id, string_value=value)
+
+
+async def timed(results, step, run):
+    started = time.perf_counter()
+    try:
+        await run
+    except (StepFailed, asyncio.TimeoutError) as e:
+        results.append((step, time.perf_counter() - started, f"{type(e).__name__}: {e}"))
+        raise StepFailed(step)
+    results.append((step, time.perf_counter() - started, None))
+
+
+async def scenario(url, name, results):
+    """One tech's visit: log in, build and generate a client's report, look it up in the viewer."""
+    async with Session(url) as s:
+        await timed(results, "load", s.rerun())
+        s.fill("Username", LOGIN[0])
+        s.fill("Password", LOGIN[1])
+        await timed(results, "login", s.rerun(trigger=s.find("button", "Log In")))
+        s.find("button", "Log Out")
+
+        await timed(results, "open_builder", s.rerun(page="report_creator"))
+        s.fill("Search for a client by name", name)
+        await timed(results, "search", s.rerun())
+        open_button = next((e for e in s.elements if e[0] == "button" and ("Generate Report" in e[1] or
+                                                                             "Edit Existing Report" in e[1])), None)
+        if open_button is None:
+            raise StepFailed(f"no report button for {name!r}")
+        await timed(results, "open_report", s.rerun(trigger=open_button))
+        await timed(results, "generate_pdf", s.rerun(trigger=s.find("button", "Generate PDF Report")))
+
+        await timed(results, "open_viewer", s.rerun(page="report_viewer"))
+        s.fill("Enter client name to search", name)
+        await timed(results, "view_reports", s.rerun())
+
+
+async def run_level(url, sessions, iterations, names, stats):
+    """`sessions` concurrent techs, each running `iterations` scenarios back to back."""
+    results, errors, samples = [], [], []
+
+    async def tech():
+        for _ in range(iterations):
+            steps = []
+            try:
+                await scenario(url, next(names), steps)
+            except Exception as e:
+                errors.append(next((error for _, _, error in steps if error), f"{type(e).__name__}: {e}"))
+            results.extend(steps)
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(stats.sample(samples, stop))
+    cpu_before, started = stats.cpu_seconds(), time.perf_counter()
+    await asyncio.gather(*(tech() for _ in range(sessions)))
+    wall, cpu = time.perf_counter() - started, stats.cpu_seconds() - cpu_before
+    stop.set()
+    await sampler
+
+    steps = {}
+    for step in STEPS:
+        seconds = np.array([s for name, s, error in results if name == step and error is None])
+        if len(seconds):
+            steps[step] = {
+                "runs": len(seconds),
+                "p50_ms": round(float(np.percentile(seconds, 50)) * 1000, 1),
+                "p95_ms": round(float(np.percentile(seconds, 95)) * 1000, 1),
+                "max_ms": round(float(seconds.max()) * 1000, 1),
+            }
+    return {
+        "sessions": sessions,
+        "scenarios": sessions * iterations,
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "scenarios_per_min": round(sessions * iterations / wall * 60, 2),
+        "server_cpu_percent": round(cpu / wall * 100, 1),
+        "server_rss_mb": {"mean": round(float(np.mean(samples)), 1), "peak": round(float(np.max(samples)), 1)},
+        "steps": steps,
+    }
+
+
+def print_level(level):
+    print(f"\n{level['sessions']} session(s): {level['scenarios']} scenarios in {level['wall_s']} s "
+          f"({level['scenarios_per_min']}/min), server CPU {level['server_cpu_percent']}%, "
+          f"RSS {level['server_rss_mb']['mean']} MB mean / {level['server_rss_mb']['peak']} MB peak, "
+          f"{len(level['errors'])} failed")
+    print(f"  {'step':<14} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for step, stats in level["steps"].items():
+        print(f"  {step:<14} {stats['runs']:>5} {stats['p50_ms']:>9.0f} {stats['p95_ms']:>9.0f} {stats['max_ms']:>9.0f}")
+    for error in sorted(set(level["errors"])):
+        print(f"  ! {error}")
+
+
+async def load_test(args, server, names):
+    url = f"ws://127.0.0.1:{args.port}/_stcore/stream"
+    stats = ServerStats(server.pid)
+    names = cycle(names)
+
+    # Warm-up: imports, fonts, first plots; the caches then stay warm like on a long-running server
+    await run_level(url, 1, 1, names, stats)
+
+    levels = []
+    for sessions in args.sessions:
+        level = await run_level(url, sessions, args.iterations, names, stats)
+        print_level(level)
+        levels.append(level)
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the report pages.")
+    parser.add_argument("command", nargs="?", choices=["run", "serve"], default="run", help=argparse.SUPPRESS)
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS, help="Concurrency levels")
+    parser.add_argument("--iterations", type=int, default=2, help="Scenarios per session and level")
+    parser.add_argument("--clients", type=int, default=60, help="Synthetic clients to seed / search for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--mongo-uri", help="Local MongoDB instead of the in-process stand-in")
+    parser.add_argument("--s3-endpoint", help="Local S3 (moto_server, MinIO) instead of the in-process stand-in")
+    parser.add_argument("--output", help="Write the results here (JSON)")
+    parser.add_argument("--names-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server, names = start_server(args, os.path.join(workdir, "clients.json"))
+        try:
+            levels = asyncio.run(load_test(args, server, names))
+        finally:
+            server.terminate()
+            server.wait(30)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"sessions": args.sessions, "iterations": args.iterations, "levels": levels}, f, indent=2)
+        print(f"\nWritten to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
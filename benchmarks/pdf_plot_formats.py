@@ -0,0 +1,81 @@
+import argparse
+import io
+import logging
+import statistics
+import time
+import warnings
+
+import matplotlib
+matplotlib.use("Agg")
+
+from sample_tests import VO2MAX_FILES, RMR_FILES, test_document, densify
+
+###################################
+#Benchmark: PNG vs vector (SVG) plots in the PDF reports
+#Builds every sample report with each plot format and prints PDF size and build time.
+#Raster settings (REPORT_PLOT_DPI, REPORT_PNG_COLORS, ...) are read from the environment.
+#"svg-raster" rasterizes dense scatter layers (the default), "svg-vector" keeps every
+#point as vector paths. --dense N interpolates the tabular data to N rows to mimic
+#breath-by-breath exports.
+#
+#    python benchmarks/pdf_plot_formats.py [--repeat 3] [--dense 3000]
+###################################
+
+MODES = {
+    # name: (plot_format, rasterize_min_points)
+    "png": ("png", None),
+    "jpeg": ("jpeg", None),
+    "svg-raster": ("svg", "default"),
+    "svg-vector": ("svg", None),
+}
+
+
+def build(test, plot_format, repeat):
+    """Build the report `repeat` times; returns (pdf bytes, [seconds])."""
+    client_data, test_data = test.report_data()
+    extra = {"activity_level": "moderate"} if test.__class__.__name__ == "RMRTest" else {}
+    timings = []
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        test.build_pdf(buffer, client_data, test_data, {}, {}, "Benchmark summary.",
+                       plot_format=plot_format, **extra)
+        timings.append(time.perf_counter() - started)
+    return buffer.getvalue(), timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PNG and vector plot embedding in the PDF reports.")
+    parser.add_argument("--repeat", type=int, default=3, help="Builds per report and mode")
+    parser.add_argument("--dense", type=int, default=0, help="Also benchmark reports interpolated to this many rows")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    from tests.vo2max_test import VO2MaxTest
+    from tests.rmr_test import RMRTest
+    import utils.report_graphics as report_graphics
+
+    documents = [test_document(path, "VO2 Max") for path in VO2MAX_FILES]
+    documents += [test_document(path, "RMR") for path in RMR_FILES]
+    if args.dense:
+        documents += [densify(document, args.dense) for document in documents[:1]]
+
+    default_min_points = report_graphics.RASTERIZE_MIN_POINTS
+    print(f"{'report':<48} {'rows':>6} {'mode':<11} {'size KB':>8} {'p50 s':>7} {'max s':>7}")
+    for document in documents:
+        test = VO2MaxTest() if document["test_type"] == "VO2 Max" else RMRTest()
+        if test.parse_test(document) is None:
+            continue
+        name = test.pdf_filename()
+        for mode, (plot_format, min_points) in MODES.items():
+            report_graphics.RASTERIZE_MIN_POINTS = default_min_points if min_points == "default" else min_points
+            pdf, timings = build(test, plot_format, args.repeat)
+            print(f"{name:<48} {len(test.df):>6} {mode:<11} {len(pdf) / 1024:>8.1f} "
+                  f"{statistics.median(timings):>7.2f} {max(timings):>7.2f}")
+    report_graphics.RASTERIZE_MIN_POINTS = default_min_points
+
+
+if __name__ == "__main__":
+    main()
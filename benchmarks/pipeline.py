@@ -0,0 +1,208 @@
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+import warnings
+from datetime import datetime
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+
+from sample_tests import ROOT, VO2MAX_FILES, RMR_FILES, read_export, parse_export, make_document, densify
+
+###################################
+#Benchmark: ingest -> plots -> PDF, end to end
+#Drives the real code paths headlessly over the sample exports in "data files/" (and
+#interpolated, breath-by-breath sized copies with --dense), stage by stage:
+#    read_excel, parse, validate, encode (BSON, as stored in MongoDB), parse_test
+#    (cold test frame), plot:<title> for each get_plot_functions() entry (drawn on an
+#    Agg canvas), build_pdf (what generate_pdf renders, without the S3 upload)
+#Timings are taken over --repeat runs; peak memory (tracemalloc) comes from one extra
+#pass so tracing doesn't slow the timed runs. Results go to a JSON baseline:
+#    {"meta": {...}, "stages": {"<type>/<size>/<stage>": {runs, p50_ms, p95_ms, peak_kb}}}
+#
+#    python benchmarks/pipeline.py [--repeat 3] [--dense 1000 3000] [--output baseline.json]
+#    python benchmarks/pipeline.py --compare benchmarks/pipeline_baseline.json
+###################################
+
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "pipeline_baseline.json")
+
+# --compare flags stages whose p50 grew by more than this (and by at least REGRESSION_MIN_MS)
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_MS = 5.0
+
+
+class StageTimer:
+    """Collects durations (and optionally traced peak memory) per stage name."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peak_bytes = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.seconds.setdefault(stage, []).append(time.perf_counter() - started)
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1] - start_bytes
+            self.peak_bytes[stage] = max(self.peak_bytes.get(stage, 0), peak)
+        return result
+
+
+def test_class(test_type):
+    from tests.vo2max_test import VO2MaxTest
+    from tests.rmr_test import RMRTest
+    return VO2MaxTest if test_type == "VO2 Max" else RMRTest
+
+
+def draw_plot(func, df):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(6, 3.5))
+    try:
+        func(ax, df)
+        fig.tight_layout()
+        fig.canvas.draw()
+    finally:
+        plt.close(fig)
+
+
+def run_document_stages(timer, prefix, document):
+    """encode, parse_test, plots and build_pdf for one test document."""
+    from bson import BSON
+    from utils.test_frames import _cached_test_frame, _cached_plot_frames
+    from analysis.fits import _cached_fits
+
+    test_type = document["test_type"]
+    timer.run(f"{prefix}/encode", BSON.encode, document)
+
+    test = test_class(test_type)()
+    if test_type == "RMR":
+        test.activity_level = "moderate"  # the TDEE plots need one outside the builder
+    _cached_test_frame.clear()  # cold: build the frames like the first view of a test
+    _cached_plot_frames.clear()
+    _cached_fits.clear()
+    timer.run(f"{prefix}/parse_test", test.parse_test, document)
+
+    for title, func in test.get_plot_functions():
+        timer.run(f"{prefix}/plot:{title}", draw_plot, func, test.df)
+
+    client_data, test_data = test.report_data()
+    timer.run(f"{prefix}/build_pdf", test.build_pdf, io.BytesIO(), client_data, test_data, {}, {},
+              "Benchmark summary.")
+
+
+def run_pass(timer, exports, dense_sizes):
+    """One run over every export (and its dense copies)."""
+    from ingest.validation import validate_test
+
+    for path, test_type in exports:
+        sheet = timer.run(f"{test_type}/raw/read_excel", read_export, path, test_type)
+        parsed = timer.run(f"{test_type}/raw/parse", parse_export, sheet, test_type)
+        timer.run(f"{test_type}/raw/validate", validate_test, parsed, test_type)
+        document = make_document(parsed, test_type)
+        run_document_stages(timer, f"{test_type}/raw", document)
+
+        for rows in dense_sizes:
+            run_document_stages(timer, f"{test_type}/dense-{rows}", densify(document, rows))
+
+
+def summarize(timer, memory):
+    stages = {}
+    for stage, seconds in sorted(timer.seconds.items()):
+        ms = np.array(seconds) * 1000
+        stages[stage] = {
+            "runs": len(ms),
+            "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "peak_kb": round(memory.peak_bytes.get(stage, 0) / 1024, 1),
+        }
+    return stages
+
+
+def metadata(args):
+    import pandas, reportlab
+    return {
+        "created": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pandas.__version__,
+        "matplotlib": matplotlib.__version__,
+        "reportlab": reportlab.Version,
+        "repeat": args.repeat,
+        "dense": args.dense,
+    }
+
+
+def compare(stages, baseline_path):
+    """Print p50 changes against a baseline file; returns the regressed stage names."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["stages"]
+
+    regressed = []
+    print(f"\n{'stage':<70} {'base p50':>9} {'now p50':>9} {'change':>8}")
+    for stage, now in stages.items():
+        before = baseline.get(stage)
+        if before is None:
+            continue
+        change = now["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        flag = ""
+        if change > REGRESSION_RATIO and now["p50_ms"] - before["p50_ms"] > REGRESSION_MIN_MS:
+            regressed.append(stage)
+            flag = "  <-- slower"
+        print(f"{stage:<70} {before['p50_ms']:>9.1f} {now['p50_ms']:>9.1f} {change:>7.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the ingest -> plot -> PDF pipeline on the sample exports.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over every export")
+    parser.add_argument("--dense", type=int, nargs="*", default=[1000], help="Also run copies interpolated to these row counts")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the results (JSON)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against (nothing is written)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    exports = [(path, "VO2 Max") for path in VO2MAX_FILES] + [(path, "RMR") for path in RMR_FILES]
+
+    # Warm-up: imports, font cache, logo, page templates
+    run_pass(StageTimer(), exports[:1] + exports[-1:], [])
+
+    timer = StageTimer()
+    for i in range(args.repeat):
+        run_pass(timer, exports, args.dense)
+        print(f"pass {i + 1}/{args.repeat} done")
+
+    tracemalloc.start()
+    memory = StageTimer(trace_memory=True)
+    run_pass(memory, exports, args.dense)
+    tracemalloc.stop()
+
+    stages = summarize(timer, memory)
+    print(f"\n{'stage':<70} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>9}")
+    for stage, stats in stages.items():
+        print(f"{stage:<70} {stats['runs']:>5} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['peak_kb']:>9.0f}")
+
+    if args.compare:
+        regressed = compare(stages, args.compare)
+        print(f"\n{len(regressed)} stage(s) slower than the baseline" if regressed else "\nNo regressions")
+        raise SystemExit(1 if regressed else 0)
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(args), "stages": stages}, f, indent=2)
+    print(f"\nWritten to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import glob
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+from bson import ObjectId
+
+###################################
+#Sample Test Documents
+#Builds in-memory test documents (same shape data_uploader.py stores in MongoDB)
+#from the exports in "data files/", for benchmarks that run without a database.
+###################################
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "app")
+DATA_DIR = os.path.join(ROOT, "data files")
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+from ingest.vo2max_ingest import VO2MaxParser  # noqa: E402
+from ingest.rmr_ingest import RMRParser  # noqa: E402
+from analysis.downsample import plot_data  # noqa: E402
+
+VO2MAX_FILES = sorted(glob.glob(os.path.join(DATA_DIR, "VO2 Max", "*.XLS")))
+RMR_FILES = [os.path.join(DATA_DIR, "RMR", "Resting Metabolic Rate.xlsx")]
+
+
+def read_export(path, test_type):
+    """Read an export's sheet the way data_uploader.py does."""
+    engine = "xlrd" if path.lower().endswith(".xls") else "openpyxl"
+    return pd.read_excel(path, header=None, engine=engine)
+
+
+def parse_export(sheet, test_type):
+    """Run the test type's parser over a sheet."""
+    parser = VO2MaxParser(sheet) if test_type == "VO2 Max" else RMRParser(sheet)
+    return parser.parse()
+
+
+def make_document(parsed, test_type):
+    """Test document for parsed export data (with a fresh _id / user_id)."""
+    return {
+        "_id": ObjectId(),
+        "user_id": ObjectId(),
+        "test_type": test_type,
+        "Upload Date": datetime.utcnow(),
+        f"{test_type} Report Info": {
+            "Report Info": parsed["Report Info"],
+            "Client Info": parsed["Client Info"],
+            "Test Protocol": parsed["Test Protocol"],
+            "Tabular Data": parsed["Tabular Data"],
+            "Plot Data": parsed["Plot Data"],
+        },
+    }
+
+
+def test_document(path, test_type):
+    """Parse one export into a test document (with a fresh _id / user_id)."""
+    return make_document(parse_export(read_export(path, test_type), test_type), test_type)
+
+
+def densify(document, rows):
+    """Copy of a test document with its tabular data interpolated to `rows` rows (breath-by-breath sized)."""
+    import numpy as np
+
+    key = f"{document['test_type']} Report Info"
+    frame = pd.DataFrame.from_records(document[key]["Tabular Data"]).apply(pd.to_numeric, errors="coerce")
+    old_x = np.linspace(0, 1, len(frame))
+    new_x = np.linspace(0, 1, rows)
+    dense = pd.DataFrame({col: np.interp(new_x, old_x, frame[col].to_numpy(dtype=float)) for col in frame.columns})
+
+    copy = dict(document, _id=ObjectId())
+    copy[key] = dict(document[key], **{"Tabular Data": dense.to_dict("records"),
+                                       "Plot Data": plot_data(dense, document["test_type"])})
+    return copy
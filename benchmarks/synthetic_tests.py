@@ -0,0 +1,396 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from sample_tests import parse_export, make_document
+from ingest.validation import validate_test
+from analysis.norms import vo2max_percentile
+
+###################################
+#Synthetic Metabolic Tests
+#Generates realistic VO2 Max (treadmill ramp to exhaustion) and RMR (hood, supine)
+#exports in the cell layout of the metabolic cart's text report, i.e. exactly what
+#VO2MaxParser / RMRParser read: header block in rows 0-23, column titles in rows 25-28,
+#data from row 29 until the first empty row, then results / events.
+#Varies clients (name, age, sex, size, fitness), test length and the cart's column
+#variant (21 columns with treadmill speed/grade, or 19 without).
+#
+#    python benchmarks/synthetic_tests.py files --out synthetic/ --count 20 [--format xlsx xls]
+#    python benchmarks/synthetic_tests.py mongo --count 100000 [--uri mongodb://localhost:27017]
+#
+#.xls files need xlwt (pip install xlwt); .xlsx uses openpyxl. The mongo command writes
+#to its own database (default "performance-lab-synthetic"), never the app's.
+###################################
+
+FIRST_NAMES = {
+    "M": ["JAMES", "ROBERT", "JOHN", "MICHAEL", "DAVID", "WILLIAM", "RICHARD", "JOSEPH", "THOMAS", "CHRIS",
+          "DANIEL", "MATTHEW", "ANTHONY"],
+    "F": ["MARY", "PATRICIA", "JENNIFER", "LINDA", "ELIZABETH", "BARBARA", "SUSAN", "JESSICA", "SARAH",
+          "KAREN", "LISA", "NANCY", "BETTY"],
+}
+LAST_NAMES = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ",
+              "MARTINEZ", "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR",
+              "MOORE", "JACKSON", "MARTIN", "LEE", "PEREZ", "THOMPSON", "WHITE", "HARRIS", "CLARK"]
+
+VO2MAX_COLUMNS_21 = ["Time", "VO2 STPD", "VO2/kg STPD", "Mets", "VCO2 STPD", "VE BTPS", "RER", "RR", "Vt BTPS",
+                     "FEO2", "FECO2", "HR", "TM SPD", "TM GRD", "AcKcal", "PetCO2", "PetO2", "VE/VCO2",
+                     "VE/VO2", "FATmin", "CHOmin"]
+VO2MAX_COLUMNS_19 = [col for col in VO2MAX_COLUMNS_21 if col not in ("TM SPD", "TM GRD")]
+RMR_COLUMNS = ["Time", "VO2 STPD", "VO2/kg STPD", "Mets", "VCO2 STPD", "VE uncor.", "RQ", "FEO2", "FECO2",
+               "REE", "RMR"]
+
+# Title rows 25-27 of the data block, per column (name, condition, unit)
+COLUMN_TITLES = {
+    "Time": ("TIME", "", "min"), "VO2 STPD": ("VO2", "STPD", "L/min"), "VO2/kg STPD": ("VO2/kg", "STPD", "ml/kg/m"),
+    "Mets": ("METS", "", ""), "VCO2 STPD": ("VCO2", "STPD", "L/min"), "VE BTPS": ("VE", "BTPS", "L/min"),
+    "RER": ("RER", "", ""), "RR": ("RR", "", "BPM"), "Vt BTPS": ("Vt", "BTPS", "L"), "FEO2": ("FEO2", "", "%"),
+    "FECO2": ("FECO2", "", "%"), "HR": ("HR", "", "bpm"), "TM SPD": ("TM", "SPD", "mph"),
+    "TM GRD": ("TM", "GRD", "%"), "AcKcal": ("AcKcal", "", "Kcal"), "PetCO2": ("PetCO2", "", "mmHg"),
+    "PetO2": ("PetO2", "", "mmHg"), "VE/VCO2": ("VE/", "VCO2", ""), "VE/VO2": ("VE/", "VO2", ""),
+    "FATmin": ("FATmin", "", "g/min"), "CHOmin": ("CHOmin", "", "g/min"), "VE uncor.": ("VE", "uncor.", "L/min"),
+    "RQ": ("RQ", "", ""), "REE": ("REE", "", "Kcal/D"), "RMR": ("RMR", "", "Kcal/kg/hr"),
+}
+
+# Median VO2max (mL/kg/min) by sex and age decade from 20 (see app/analysis/norms.py)
+MEDIAN_VO2MAX = {"M": [48.0, 42.4, 37.8, 32.6, 28.2, 24.4], "F": [37.6, 30.2, 26.7, 23.4, 20.0, 18.3]}
+
+# Sheet width per variant: the parser tells 21 from 19 column exports by it
+SHEET_WIDTH = {21: 21, 19: 19, "RMR": 13}
+TABLE_START_ROW = 29
+
+
+# ===============================
+# Clients
+# ===============================
+
+def synthetic_client(rng):
+    """Random client: name, age, sex, height (in), weight (lb) and a VO2max to aim for."""
+    sex = "M" if rng.random() < 0.5 else "F"
+    age = int(rng.integers(18, 76))
+    height_in = float(rng.normal(69.5 if sex == "M" else 64.0, 2.8))
+    bmi = float(np.clip(rng.normal(26, 4), 17, 42))
+    weight_lb = bmi * (height_in * 0.0254) ** 2 / 0.453592
+    decade = min(max(age // 10 - 2, 0), 5)
+    vo2max = float(np.clip(rng.normal(MEDIAN_VO2MAX[sex][decade], 7), 14, 75))
+    return {
+        "Name": f"{rng.choice(LAST_NAMES)}, {rng.choice(FIRST_NAMES[sex])}",
+        "Age": age,
+        "Sex": sex,
+        "Height": round(height_in, 2),
+        "Weight": round(weight_lb, 1),
+        "VO2max": vo2max,
+    }
+
+
+def _noisy(rng, values, relative):
+    return values * (1 + rng.normal(0, relative, len(values)))
+
+
+# ===============================
+# Data tables
+# ===============================
+
+def vo2max_table(rng, client, minutes=None, columns=21):
+    """Breath-averaged ramp test to exhaustion as a DataFrame of the cart's columns."""
+    minutes = minutes or float(rng.uniform(8, 16))
+    steps = rng.uniform(0.13, 0.2, int(minutes / 0.165) + 1)
+    time_min = np.cumsum(steps)
+    time_min = time_min[time_min <= minutes]
+    progress = time_min / time_min[-1]
+
+    weight_kg = client["Weight"] * 0.453592
+    vo2_kg = 6 + (client["VO2max"] - 6) * np.minimum(progress * 1.08, 1.0)   # plateau at the end
+    vo2 = _noisy(rng, vo2_kg * weight_kg / 1000, 0.07)                        # L/min
+    rer = _noisy(rng, 0.78 + 0.37 * progress ** 2, 0.02)
+    vco2 = vo2 * rer
+    hr_max = 220 - client["Age"] + rng.normal(0, 8)
+    hr = np.round(_noisy(rng, 75 + (hr_max - 75) * progress ** 0.9, 0.03))
+    ve_vco2 = _noisy(rng, 30 - 4 * progress + 8 * np.maximum(progress - 0.75, 0) * 4, 0.03)
+    ve = vco2 * ve_vco2
+    rr = _noisy(rng, 16 + 32 * progress ** 1.5, 0.08)
+    kcal_per_min = vo2 * (3.815 + 1.232 * rer)
+
+    table = pd.DataFrame({
+        "Time": time_min,
+        "VO2 STPD": vo2,
+        "VO2/kg STPD": vo2 * 1000 / weight_kg,
+        "Mets": vo2 * 1000 / weight_kg / 3.5,
+        "VCO2 STPD": vco2,
+        "VE BTPS": ve,
+        "RER": rer,
+        "RR": rr,
+        "Vt BTPS": ve / rr,
+        "FEO2": _noisy(rng, 17.2 - 1.2 * progress + 1.0 * progress ** 4, 0.01),
+        "FECO2": _noisy(rng, 3.4 + 1.0 * progress - 0.6 * progress ** 4, 0.02),
+        "HR": hr,
+        "TM SPD": np.round(1.7 + 4.3 * progress, 1),
+        "TM GRD": np.round(10 + 10 * progress),
+        "AcKcal": np.cumsum(kcal_per_min * steps[:len(time_min)]),
+        "PetCO2": _noisy(rng, 30 + 10 * progress - 6 * np.maximum(progress - 0.8, 0) * 5, 0.03),
+        "PetO2": _noisy(rng, 118 - 8 * progress + 14 * np.maximum(progress - 0.8, 0) * 5, 0.02),
+        "VE/VCO2": ve_vco2,
+        "VE/VO2": ve_vco2 * rer,
+        "FATmin": 1.695 * vo2 - 1.701 * vco2,
+        "CHOmin": 4.585 * vco2 - 3.226 * vo2,
+    })
+    return table[VO2MAX_COLUMNS_21 if columns == 21 else VO2MAX_COLUMNS_19]
+
+
+def rmr_table(rng, client, minutes=None):
+    """30 s averages of a resting test (settling over the first minutes) as a DataFrame."""
+    minutes = minutes or float(rng.choice([20, 30, 40, 45]))
+    time_min = np.arange(1, int(minutes * 2) + 1) * 0.5 + rng.normal(0, 5e-6, int(minutes * 2))
+
+    weight_kg = client["Weight"] * 0.453592
+    height_cm = client["Height"] * 2.54
+    if client["Sex"] == "M":
+        kcal_day = 66 + 13.7 * weight_kg + 5 * height_cm - 6 * client["Age"]
+    else:
+        kcal_day = 655 + 9.6 * weight_kg + 1.7 * height_cm - 4.7 * client["Age"]
+    kcal_day *= rng.normal(1.0, 0.1)
+
+    rq = _noisy(rng, np.full(len(time_min), rng.uniform(0.72, 0.88)), 0.02)
+    # Weir: kcal/day = (3.941 VO2 + 1.106 VCO2) L/min * 1440
+    vo2_rest = kcal_day / 1440 / (3.941 + 1.106 * rq.mean()) * 1000
+    settling = 1 + 0.35 * np.exp(-time_min / 3)
+    vo2 = _noisy(rng, vo2_rest * settling, 0.05)                              # mL/min
+    vco2 = vo2 * rq
+    ree = (3.941 * vo2 + 1.106 * vco2) / 1000 * 1440
+
+    return pd.DataFrame({
+        "Time": time_min,
+        "VO2 STPD": vo2,
+        "VO2/kg STPD": vo2 / weight_kg,
+        "Mets": vo2 / weight_kg / 3.5,
+        "VCO2 STPD": vco2,
+        "VE uncor.": _noisy(rng, np.full(len(time_min), 20.4), 0.02),
+        "RQ": rq,
+        "FEO2": _noisy(rng, np.full(len(time_min), 19.7), 0.003),
+        "FECO2": _noisy(rng, vco2 / 200, 0.02),
+        "REE": ree,
+        "RMR": ree / weight_kg / 24,
+    })[RMR_COLUMNS]
+
+
+# ===============================
+# Sheet layout
+# ===============================
+
+def _blank_row():
+    return [None] * 21
+
+
+def _set(rows, r, cells):
+    for c, value in cells.items():
+        rows[r][c] = value
+
+
+def sheet_rows(test_type, client, table, started):
+    """Rows (lists of cells) of a cart text report for a client and data table."""
+    vo2max = test_type == "VO2 Max"
+    rows = [_blank_row() for _ in range(TABLE_START_ROW)]
+
+    _set(rows, 0, {0: "Southern Connecticut State University", 9: "(20190325T)"})
+    _set(rows, 1, {0: "Human Performance Lab (sys#2)" if vo2max else "RMR (sys#3)"})
+    _set(rows, 2, {0: "*** Metabolic Text Report ***", 1: started.year, 2: "/", 3: started.month, 4: "/",
+                   5: started.day, 6: started.hour, 7: ":", 8: started.minute, 9: started.second})
+    _set(rows, 4, {0: "Patient Information"})
+    _set(rows, 5, {0: "Name", 1: client["Name"], 2: "File number", 3: 0, 4: "Doctor", 5: "DGM"})
+    _set(rows, 6, {0: "Age", 1: client["Age"], 2: "yrs", 3: "Sex", 4: client["Sex"]})
+    _set(rows, 7, {0: "Height", 1: client["Height"], 2: "in", 3: round(client["Height"] * 2.54), 4: "cm",
+                   5: "Weight", 6: client["Weight"], 7: "lb", 8: client["Weight"] * 0.453592, 9: "kg"})
+    _set(rows, 8, {0: "Tech", 1: "DM"})
+    _set(rows, 10, {0: "Test Protocol"})
+    _set(rows, 11, {0: "Test degree", 1: "Maximal" if vo2max else "Rest"})
+    _set(rows, 12, {0: "Exercise Device", 1: "Treadmill" if vo2max else "(N/A)"})
+    _set(rows, 14, {0: "Test Environment", 1: "Insp. temp.", 2: 22, 3: "deg C", 4: "Baro. pressure", 5: 756.1,
+                    6: "mmHg", 7: "Insp. humidity", 8: 30, 9: "%"})
+    _set(rows, 15, {0: "Exp. flow temp.", 1: "Mean of room temp. and 37.0 deg C" if vo2max else "Room air temp.",
+                    2: None if vo2max else "Exp. flow humidity", 3: None if vo2max else 0.52})
+    _set(rows, 16, {0: "Insp. O2", 1: 20.94, 2: "%", 3: "Insp. CO2", 4: 0.04, 5: "%"})
+    _set(rows, 17, {0: "Selected Flowmeter", 1: "0-800 Lpm"})
+    _set(rows, 18, {0: "STPD to BTPS", 1: 1.217, 2: "O2 Gain", 3: 0.000126, 4: "CO2-NL gain", 5: 0.000067})
+    _set(rows, 20, {0: "Base Values for Sampling"})
+    _set(rows, 21, {0: "Base O2", 1: 20.94, 2: "%", 3: "Base CO2", 4: 0.04, 5: "%", 6: "Measured O2",
+                    7: 20.93, 8: "%", 9: "Measured CO2", 10: 0.07, 11: "%"})
+    _set(rows, 23, {0: "=========="})
+    for i, col in enumerate(table.columns):
+        name, condition, unit = COLUMN_TITLES[col]
+        rows[25][i], rows[26][i], rows[27][i] = name, condition, unit
+    _set(rows, 28, {0: "----------"})
+
+    for values in table.itertuples(index=False):
+        row = _blank_row()
+        row[:len(values)] = [float(v) for v in values]
+        rows.append(row)
+    rows.append(_blank_row())
+    rows.append(_blank_row())
+
+    if vo2max:
+        peak = table["VO2 STPD"].rolling(3, min_periods=1).mean().max()
+        peak_kg = peak * 1000 / (client["Weight"] * 0.453592)
+        rows.append(_blank_row())
+        _set(rows, len(rows) - 1, {0: "Max VO2", 1: peak, 2: "L/min", 3: peak_kg, 4: "ml/kg/min",
+                                   5: peak_kg / 3.5, 6: "METS"})
+        rows.append(_blank_row())
+        rows.append(_blank_row())
+        percentile = vo2max_percentile(peak_kg, client["Age"], client["Sex"]) or 1
+        _set(rows, len(rows) - 1, {0: "VO2max Percentile(%)", 1: f"{percentile}\t(99%:0.0 95%:0.0)"})
+        rows.append(_blank_row())
+        rows.append(_blank_row())
+        _set(rows, len(rows) - 1, {0: "Events"})
+        rows.append(_blank_row())
+        _set(rows, len(rows) - 1, {0: 0.000333, 1: "Start Exercise"})
+    else:
+        rows.append(_blank_row())
+        _set(rows, len(rows) - 1, {0: "Events"})
+        for minute in range(5, int(table["Time"].iloc[-1]) + 1, 5):
+            rows.append(_blank_row())
+            _set(rows, len(rows) - 1, {0: minute + 0.000167, 1: "Baseline (O2: 20.84%, CO2: 0.05%)"})
+    width = SHEET_WIDTH[len(table.columns) if vo2max else "RMR"]
+    return [row[:width] for row in rows]
+
+
+def synthetic_sheet(rng, test_type, client=None, started=None, columns=None):
+    """(sheet DataFrame, client) for one random test, laid out like the cart's export."""
+    client = client or synthetic_client(rng)
+    started = started or datetime(2014, 1, 1) + timedelta(days=int(rng.integers(0, 10 * 365)),
+                                                          minutes=int(rng.integers(7 * 60, 18 * 60)))  # lab hours
+    if test_type == "VO2 Max":
+        columns = columns or (21 if rng.random() < 0.6 else 19)
+        table = vo2max_table(rng, client, columns=columns)
+    else:
+        table = rmr_table(rng, client)
+    return pd.DataFrame(sheet_rows(test_type, client, table, started)), client
+
+
+def synthetic_document(rng, test_type, client=None):
+    """Test document (as stored by data_uploader.py) of a random test, parsed and checked like an upload."""
+    sheet, client = synthetic_sheet(rng, test_type, client)
+    parsed = parse_export(sheet, test_type)
+    document = make_document(parsed, test_type)
+    document["Quality Report"] = validate_test(parsed, test_type)
+    return document, client
+
+
+# ===============================
+# Output
+# ===============================
+
+def write_xlsx(sheet, path):
+    sheet.to_excel(path, header=False, index=False, engine="openpyxl")
+
+
+def write_xls(sheet, path):
+    try:
+        import xlwt
+    except ImportError:
+        raise SystemExit("Writing .xls needs xlwt: pip install xlwt")
+    book = xlwt.Workbook()
+    page = book.add_sheet("Sheet1")
+    for r, row in enumerate(sheet.itertuples(index=False)):
+        for c, value in enumerate(row):
+            if value is not None and not (isinstance(value, float) and np.isnan(value)):
+                page.write(r, c, value)
+    book.save(path)
+
+
+def write_files(out_dir, count, formats, seed):
+    """Write `count` exports of each test type in each of `formats` (xlsx / xls)."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    for i in range(count):
+        for test_type in ("VO2 Max", "RMR"):
+            sheet, client = synthetic_sheet(rng, test_type)
+            stem = f"{client['Name'].replace(', ', '_')}_{'VO2' if test_type == 'VO2 Max' else 'RMR'}_{i:04d}"
+            for fmt in formats:
+                path = os.path.join(out_dir, f"{stem}.{fmt}")
+                (write_xls if fmt == "xls" else write_xlsx)(sheet, path)
+                print(path)
+
+
+def synthetic_batch(seed, count, tests_per_client=3):
+    """(users, tests) documents for `count` tests (VO2 Max / RMR mixed), `tests_per_client` per client."""
+    import warnings
+    warnings.filterwarnings("ignore")
+    rng = np.random.default_rng(seed)
+    users, tests = [], []
+    while len(tests) < count:
+        client = synthetic_client(rng)
+        user = {"_id": ObjectId(), "test_ids": []}
+        for _ in range(min(tests_per_client, count - len(tests))):
+            test_type = "VO2 Max" if rng.random() < 0.6 else "RMR"
+            document, _ = synthetic_document(rng, test_type, client)
+            if not user["test_ids"]:
+                # data_uploader.py takes the user's fields from their first export
+                info = document[f"{test_type} Report Info"]["Client Info"]
+                user.update({key: info[key] for key in ("Name", "Age", "Sex", "Height", "Weight")})
+            document["user_id"] = user["_id"]
+            document["Upload Date"] = datetime.utcnow() - timedelta(days=int(rng.integers(0, 3650)))
+            user["test_ids"].append(document["_id"])
+            tests.append(document)
+        users.append(user)
+    return users, tests
+
+
+def populate_mongo(db, count, seed, batch_size=1000, workers=1):
+    """Insert `count` synthetic tests plus their clients into `db`, batches built in `workers` processes."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+    seeds = np.random.SeedSequence(seed).generate_state(len(sizes))
+
+    started = time.perf_counter()
+    inserted = 0
+    with ProcessPoolExecutor(workers) as pool:
+        for users, tests in pool.map(synthetic_batch, seeds.tolist(), sizes):
+            db["users"].insert_many(users, ordered=False)
+            db["tests"].insert_many(tests, ordered=False)
+            inserted += len(tests)
+            elapsed = time.perf_counter() - started
+            print(f"{inserted}/{count} tests ({inserted / elapsed:.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic VO2 Max / RMR exports and test documents.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    files = commands.add_parser("files", help="Write export workbooks")
+    files.add_argument("--out", required=True, help="Output folder")
+    files.add_argument("--count", type=int, default=10, help="Exports per test type")
+    files.add_argument("--format", nargs="+", choices=["xlsx", "xls"], default=["xlsx"])
+
+    mongo = commands.add_parser("mongo", help="Populate a MongoDB database with synthetic tests")
+    mongo.add_argument("--count", type=int, default=100_000, help="Tests to insert")
+    mongo.add_argument("--uri", default="mongodb://localhost:27017")
+    mongo.add_argument("--db", default="performance-lab-synthetic", help="Database name (not the app's)")
+    mongo.add_argument("--batch-size", type=int, default=1000)
+    mongo.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes generating batches")
+    mongo.add_argument("--drop", action="store_true", help="Drop the tests/users collections first")
+
+    for command in (files, mongo):
+        command.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import warnings
+    warnings.filterwarnings("ignore")
+    if args.command == "files":
+        write_files(args.out, args.count, args.format, args.seed)
+    else:
+        if args.db == "performance-lab":
+            parser.error("refusing to write synthetic tests into the app's database")
+        from pymongo import MongoClient
+        db = MongoClient(args.uri)[args.db]
+        if args.drop:
+            db["tests"].drop()
+            db["users"].drop()
+        populate_mongo(db, args.count, args.seed, args.batch_size, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+###################################
+#Unit Tests
+#Checks of the pure numeric / storage helpers against known values and edge cases.
+#Run from the repository root:
+#    python -m pytest
+#The app's modules import as the app sees them (app/ on sys.path).
+###################################
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
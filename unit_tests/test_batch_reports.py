@@ -0,0 +1,43 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from ingest.rmr_ingest import RMRParser
+from utils.batch_reports import run_batch, result_rows, BUCKET_NAME
+
+RMR_EXPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          "data files", "RMR", "Resting Metabolic Rate.xlsx")
+
+
+@pytest.fixture
+def services():
+    mongomock = pytest.importorskip("mongomock")
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        yield mongomock.MongoClient().db, s3
+
+
+def test_second_run_skips_the_unchanged_report(services):
+    db, s3 = services
+    parsed = RMRParser(pd.read_excel(RMR_EXPORT, header=None)).parse()
+    document = {"_id": ObjectId(), "user_id": ObjectId(), "test_type": "RMR",
+                "Upload Date": datetime(2025, 3, 1), "RMR Report Info": parsed}
+
+    first, _ = run_batch(db, s3, [document], workers=1)
+    assert first[0]["error"] is None and not first[0]["skipped"] and first[0]["size_bytes"] > 0
+    # No saved report: the PDF record is upserted without last_updated
+    report = db["reports"].find_one({"test_id": document["_id"]})
+    assert report["pdf"]["s3_key"] == f"reports/{first[0]['filename']}" and "last_updated" not in report
+
+    second, _ = run_batch(db, s3, [document], workers=1)
+    assert second[0]["skipped"] and second[0]["error"] is None
+
+    rows = result_rows(first + second)
+    assert [row["Skipped"] for row in rows] == [False, True]
+    assert rows[1]["Size (KB)"] == 0 and rows[1]["Report"] == first[0]["filename"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from analysis.downsample import lttb, downsample_series, plot_data
+
+
+def test_short_series_are_kept_whole():
+    x = np.arange(5.0)
+    assert lttb(x, x, 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 2).tolist() == [0, 1, 2, 3, 4]  # fewer than 3 points can't keep both ends and a middle
+    assert lttb(np.array([]), np.array([]), 300).tolist() == []
+
+
+def test_keeps_the_spike():
+    x = np.arange(10.0)
+    y = np.zeros(10)
+    y[5] = 10.0
+    assert lttb(x, y, 3).tolist() == [0, 5, 9]
+
+
+def test_point_count_ends_and_order():
+    x = np.linspace(0, 60, 3000)
+    y = np.sin(x) + 0.1 * np.cos(7 * x)
+    keep = lttb(x, y, 300)
+    assert len(keep) == 300
+    assert keep[0] == 0 and keep[-1] == 2999
+    assert (np.diff(keep) > 0).all()
+    # Peaks and dips survive (LTTB keeps shape, not necessarily the exact extreme sample)
+    assert y[keep].max() > 0.99 * y.max() and y[keep].min() < 0.99 * y.min()
+
+
+def test_downsample_series_drops_nans_and_sorts():
+    x, y = downsample_series([3, 1, np.nan, 2, "4"], [30, 10, 99, np.nan, "40"], points=300)
+    assert x.tolist() == [1.0, 3.0, 4.0]
+    assert y.tolist() == [10.0, 30.0, 40.0]
+
+
+def test_downsample_series_of_nothing():
+    x, y = downsample_series([np.nan], [1.0])
+    assert len(x) == len(y) == 0
+
+
+def test_plot_data_skips_missing_channels():
+    table = pd.DataFrame({"Time": np.arange(1000.0), "REE": np.arange(1000.0) * 2})
+    section = plot_data(table, "RMR", points=100)
+    assert section["Points"] == 100
+    assert list(section["Series"]) == ["REE"]
+    assert len(section["Series"]["REE"]["Time"]) == 100
+    assert plot_data(table, "VO2 Max")["Series"] == {}
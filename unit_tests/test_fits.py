@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.fits import polyfit_columns, vslope_fit, ree_trend, compute_fits, REE_TREND_SKIP
+
+
+def test_recovers_known_polynomials():
+    x = np.linspace(0, 20, 200)
+    coefficients = polyfit_columns(x, {"cubic": 0.5 * x ** 3 - 2 * x + 7, "line": 3 * x + 1}, 3)
+    assert coefficients["cubic"] == pytest.approx([0.5, 0, -2, 7], abs=1e-8)
+    assert coefficients["line"] == pytest.approx([0, 0, 3, 1], abs=1e-8)
+
+
+def test_matches_np_polyfit_with_nans():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 15, 300)
+    a = 1000 + 80 * x - 2 * x ** 2 + rng.normal(0, 20, x.size)
+    b = 25 + 0.3 * x + rng.normal(0, 1, x.size)
+    b[::7] = np.nan  # another NaN pattern: solved separately
+    coefficients = polyfit_columns(x, {"a": a, "b": b}, 3)
+    assert coefficients["a"] == pytest.approx(np.polyfit(x, a, 3), rel=1e-6)
+    keep = np.isfinite(b)
+    assert coefficients["b"] == pytest.approx(np.polyfit(x[keep], b[keep], 3), rel=1e-6)
+
+
+def test_too_few_points_give_nans():
+    coefficients = polyfit_columns([1.0, 2.0, 3.0, np.nan], {"y": [1.0, 2.0, 3.0, 4.0]}, 3)
+    assert np.isnan(coefficients["y"]).all()
+
+
+def test_vslope_threshold_of_two_lines():
+    vo2 = np.linspace(0, 1990, 200)
+    vco2 = np.where(vo2 < 1000, 0.8 * vo2, 800 + 1.5 * (vo2 - 1000))
+    pre, post, threshold = vslope_fit(pd.DataFrame({"VO2 STPD": vo2[::-1], "VCO2 STPD": vco2[::-1]}))
+    assert threshold == pytest.approx(1000)
+    assert pre[1] == pytest.approx(0.8 * pre[0])
+    assert post[1] == pytest.approx(800 + 1.5 * (post[0] - 1000))
+
+
+def test_ree_trend():
+    time = np.arange(0.5, 30.01, 0.5)
+    trend = ree_trend(pd.DataFrame({"Time": time, "REE": 1500 - 2 * time}))
+    x, y = trend
+    assert x.tolist() == [time[REE_TREND_SKIP], 30.0]
+    assert y == pytest.approx(1500 - 2 * x)
+    assert ree_trend(pd.DataFrame({"Time": time[:REE_TREND_SKIP], "REE": time[:REE_TREND_SKIP]})) is None
+
+
+def test_compute_fits_only_fits_present_columns():
+    time = np.linspace(0, 12, 100)
+    df = pd.DataFrame({"Time": time, "VO2 STPD": 500 + 250 * time, "VCO2 STPD": 400 + 260 * time,
+                       "PetCO2": 35 + 0 * time})
+    fits = compute_fits(df, "VO2 Max")
+    assert set(fits["trend"]) == {"VO2 STPD", "PetCO2"}
+    x, y = fits["trend"]["VO2 STPD"]
+    assert not x.flags.writeable and y == pytest.approx(500 + 250 * x)
+    assert compute_fits(df, "RMR") == {"trend": {}}
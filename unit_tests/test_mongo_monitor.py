@@ -0,0 +1,107 @@
+import queue
+from collections import deque
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+from utils import mongo_monitor
+from utils.mongo_monitor import (command_monitor, monitored_rerun, recent_commands, recent_reruns,
+                                 repeated_queries, N_PLUS_ONE_MIN)
+
+_request_ids = count(1)
+
+
+@pytest.fixture(autouse=True)
+def fresh_monitor(monkeypatch):
+    """Empty in-memory state and no background explainer."""
+    for name, maxlen in (("_commands", 100), ("_reruns", 100), ("_repeats", 100)):
+        monkeypatch.setattr(mongo_monitor, name, deque(maxlen=maxlen))
+    monkeypatch.setattr(mongo_monitor, "_pending", {})
+    monkeypatch.setattr(mongo_monitor, "_explained", {})
+    monkeypatch.setattr(mongo_monitor, "_explain_queue", queue.Queue(maxsize=10))
+    monkeypatch.setattr(mongo_monitor, "_start_explainer", lambda: None)
+
+
+def _send(command_name, command, reply, micros=2000):
+    """Feed one command through the listener as pymongo would."""
+    event = SimpleNamespace(command_name=command_name, command=command, connection_id=("db", 27017),
+                            request_id=next(_request_ids), database_name="app", duration_micros=micros,
+                            reply=reply)
+    command_monitor.started(event)
+    command_monitor.succeeded(event)
+
+
+def _find_one(user_id):
+    _send("find", {"find": "tests", "filter": {"user_id": user_id}, "limit": 1},
+          {"cursor": {"firstBatch": [{"_id": user_id}], "id": 0}, "ok": 1})
+
+
+def test_commands_are_recorded_per_rerun():
+    with monitored_rerun("Report Builder"):
+        _find_one("u1")
+        _send("update", {"update": "reports", "updates": [{"q": {"test_id": "t1"}, "u": {"$set": {"x": 1}}}]},
+              {"n": 1, "ok": 1})
+
+    find, update = recent_commands()
+    assert find["command"] == "find" and find["collection"] == "tests" and find["docs"] == 1
+    assert find["shape"] == '{"user_id": "?"}' and find["seconds"] == pytest.approx(0.002)
+    assert update["collection"] == "reports" and update["shape"] == '{"test_id": "?"}' and update["docs"] == 1
+    assert find["rerun"] == update["rerun"] is not None
+
+    (rerun,) = recent_reruns()
+    assert rerun["page"] == "Report Builder" and rerun["commands"] == 2 and rerun["docs"] == 2
+    assert rerun["bytes"] == find["bytes"] + update["bytes"] > 0
+
+
+def test_same_query_shape_in_a_loop_is_an_n_plus_one():
+    with monitored_rerun("Client Search"):
+        for i in range(N_PLUS_ONE_MIN):
+            _find_one(f"u{i}")
+        _send("find", {"find": "tests", "filter": {"user_id": {"$in": ["u1", "u2"]}}},
+              {"cursor": {"firstBatch": [], "id": 0}, "ok": 1})
+
+    (finding,) = repeated_queries()
+    assert finding["page"] == "Client Search" and finding["calls"] == N_PLUS_ONE_MIN
+    assert finding["collection"] == "tests" and finding["shape"] == '{"user_id": "?"}'
+
+
+def test_repeats_below_the_threshold_or_across_reruns_are_fine():
+    for _ in range(2):
+        with monitored_rerun("Client Search"):
+            for i in range(N_PLUS_ONE_MIN - 1):
+                _find_one(f"u{i}")
+    assert repeated_queries() == []
+    assert [rerun["commands"] for rerun in recent_reruns()] == [N_PLUS_ONE_MIN - 1] * 2
+
+
+def test_rerun_ended_by_an_exception_is_still_counted():
+    with pytest.raises(RuntimeError):
+        with monitored_rerun("Report Builder"):
+            _find_one("u1")
+            raise RuntimeError("st.rerun")
+    assert recent_reruns()[0]["commands"] == 1
+    # Later commands outside a rerun are not attributed to it
+    _find_one("u2")
+    assert recent_commands()[-1]["rerun"] is None
+
+
+def test_housekeeping_commands_are_ignored():
+    _send("hello", {"hello": 1}, {"ok": 1})
+    assert recent_commands() == []
+
+
+def test_each_query_shape_is_explained_once_per_interval():
+    _find_one("u1")
+    _find_one("u2")
+    _send("find", {"find": "tests", "filter": {"test_id": "t1"}}, {"cursor": {"firstBatch": [], "id": 0}, "ok": 1})
+    assert mongo_monitor._explain_queue.qsize() == 2
+
+
+def test_collscan_detection():
+    explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {
+        "stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}}}}}]}
+    assert any(mongo_monitor._has_collscan(plan) for plan in mongo_monitor._winning_plans(explain))
+    indexed = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+                                "rejectedPlans": [{"stage": "COLLSCAN"}]}}
+    assert not any(mongo_monitor._has_collscan(plan) for plan in mongo_monitor._winning_plans(indexed))
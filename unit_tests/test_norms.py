@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from analysis.norms import vo2max_percentiles, vo2max_percentile, parse_percentile, backfill_percentiles
+
+INFO = "VO2 Max Report Info"
+
+
+def test_table_values_give_their_percentiles():
+    # Men 20-29: 10th 29.0, 50th 48.0, 90th 61.8
+    assert vo2max_percentiles([29.0, 48.0, 61.8], [25, 25, 25], ["M", "M", "M"]) == pytest.approx([10, 50, 90])
+
+
+def test_interpolates_between_table_percentiles():
+    # Halfway between the 50th (48.0) and 75th (55.2) of men 20-29
+    assert vo2max_percentiles([51.6], [25], ["M"])[0] == pytest.approx(62.5)
+
+
+def test_rows_are_picked_by_age_and_sex():
+    # 37.6 is the women's 20-29 median, the men's 40-49 ~45th
+    assert vo2max_percentile(37.6, 25, "F") == 50
+    assert vo2max_percentile(37.6, 45, "male") == vo2max_percentile(37.6, 45, "M") < 50
+
+
+def test_ages_outside_the_table_use_the_nearest_decade():
+    assert vo2max_percentile(48.0, 15, "M") == 50   # under 20: 20-29
+    assert vo2max_percentile(18.3, 85, "F") == 50   # 80+: 70-79
+
+
+def test_results_are_clipped_to_1_99():
+    assert vo2max_percentiles([5.0, 90.0], [25, 25], ["M", "M"]) == pytest.approx([1, 99])
+
+
+def test_missing_or_unknown_inputs():
+    result = vo2max_percentiles([45.0, np.nan, 45.0, 45.0, 45.0], [30, 30, np.nan, 30, 30], ["M", "M", "M", "X", None])
+    assert np.isfinite(result[0]) and np.isnan(result[1:]).all()
+    assert vo2max_percentile("n/a", 30, "M") is None
+    assert vo2max_percentile(45.0, None, "F") is None
+
+
+def test_parse_percentile():
+    assert parse_percentile("95") == 95
+    assert parse_percentile("95th") == 95
+    assert parse_percentile("72\t(99%:0.0 95%:0.0)") == 72
+    assert parse_percentile(64.6) == 65
+    assert parse_percentile(float("nan")) is None
+    assert parse_percentile(None) is None
+    assert parse_percentile("N/A") is None
+
+
+def _test(results, age=25, sex="M"):
+    return {"test_type": "VO2 Max", INFO: {"Client Info": {"Age": age, "Sex": sex},
+                                          "Test Protocol": {"Results": results}}}
+
+
+class _TestsCollection:
+    """mongomock collection whose bulk_write applies UpdateOnes one by one (mongomock's lags behind pymongo's)."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.collection.update_one(request._filter, request._doc)
+
+
+def test_backfill_keeps_the_sheet_percentile():
+    mongomock = pytest.importorskip("mongomock")
+    tests_col = _TestsCollection(mongomock.MongoClient().db.tests)
+    old = tests_col.insert_one(_test({"Max VO2": 48.0, "VO2max Percentile": "95"})).inserted_id
+    new = tests_col.insert_one(_test({"Max VO2": 48.0, "VO2max Percentile": 50, "Sheet Percentile": 95})).inserted_id
+    kept = tests_col.insert_one(_test({"Max VO2": 61.8, "VO2max Percentile": "70", "Sheet Percentile": 80})).inserted_id
+
+    assert backfill_percentiles(tests_col, dry_run=True) == (3, 2)
+    assert tests_col.find_one({"_id": old})[INFO]["Test Protocol"]["Results"]["VO2max Percentile"] == "95"
+
+    assert backfill_percentiles(tests_col) == (3, 2)
+    results = {_id: tests_col.find_one({"_id": _id})[INFO]["Test Protocol"]["Results"] for _id in (old, new, kept)}
+    assert results[old]["VO2max Percentile"] == 50 and results[old]["Sheet Percentile"] == 95
+    assert "version" not in tests_col.find_one({"_id": new})
+    assert results[kept]["VO2max Percentile"] == 90 and results[kept]["Sheet Percentile"] == 80
+
+    assert backfill_percentiles(tests_col) == (3, 0)
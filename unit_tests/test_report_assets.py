@@ -0,0 +1,61 @@
+import io
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import pytest
+from PIL import Image
+
+from utils import report_assets
+from utils.report_assets import static_image, logo_flowable, shared_image, raster_plot, LOGO_PATH
+
+
+@pytest.fixture
+def figure():
+    fig, ax = plt.subplots(figsize=(4, 3))
+    ax.plot([0, 1, 2], [1, 3, 2])
+    yield fig
+    plt.close(fig)
+
+
+def test_identical_images_share_one_reader(figure, monkeypatch):
+    monkeypatch.setattr(report_assets, "_images", report_assets.OrderedDict())
+    first = raster_plot(figure)
+    assert raster_plot(figure) is first
+    assert raster_plot(figure, "jpeg") is not first
+    assert len(report_assets._images) == 2
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (2, 2), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_image_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(report_assets, "_images", report_assets.OrderedDict())
+    monkeypatch.setattr(report_assets, "MAX_CACHED_IMAGES", 2)
+    red, green, blue = _png("red"), _png("green"), _png("blue")
+    first, evicted = shared_image(red), shared_image(green)
+    assert shared_image(red) is first  # most recently used again
+    shared_image(blue)                 # evicts green
+    assert shared_image(red) is first
+    assert shared_image(green) is not evicted
+    assert len(report_assets._images) == 2
+
+
+def test_raster_plots_drop_alpha_and_quantize(figure):
+    assert raster_plot(figure)._image.mode == "P"
+    assert raster_plot(figure, "jpeg")._image.mode == "RGB"
+
+
+def test_logo_is_downscaled_once_and_shared():
+    static_image.cache_clear()
+    reader = static_image(LOGO_PATH, 100, 100)
+    assert reader.getSize() == (417, 417)  # 100 pt at 300 DPI
+    assert logo_flowable().reader is reader
+    assert static_image.cache_info().hits == 1
+
+
+def test_missing_graphic_has_no_flowable(tmp_path):
+    assert static_image(str(tmp_path / "missing.png"), 100, 100) is None
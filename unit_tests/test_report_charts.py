@@ -0,0 +1,87 @@
+import json
+import math
+import os
+
+import pandas as pd
+import pytest
+from bson import ObjectId
+
+from ingest.rmr_ingest import RMRParser
+from ingest.vo2max_ingest import VO2MaxParser
+from tests.rmr_test import RMRTest
+from tests.vo2max_test import VO2MaxTest
+from utils import report_charts as charts
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data files")
+SAMPLES = {
+    "VO2 Max": (VO2MaxTest, VO2MaxParser, os.path.join("VO2 Max", "PREVITI_ZANA_0_20140823_0746.XLS")),
+    "RMR": (RMRTest, RMRParser, os.path.join("RMR", "Resting Metabolic Rate.xlsx")),
+}
+
+
+def test_layers_send_only_finite_rounded_points():
+    layer = charts.scatter([1, 2, math.nan, 4, 5], [0.123456789, math.inf, 3, 4, None], "VO2", "tab:orange")
+    assert layer["values"] == [{"x": 1.0, "y": 0.1235}, {"x": 4.0, "y": 4.0}]
+    assert layer["color"] == "#ff7f0e" and layer["axis"] == "left"
+
+    dashed = charts.line([0, 1], [0, 1], "Trend", "blue", dashed=True, axis="right")
+    assert dashed["mark"]["strokeDash"] and dashed["color"] == "blue" and dashed["axis"] == "right"
+    assert charts.rule(1.23456, "Threshold")["values"] == [{"x": 1.2346}]
+    assert charts.band(2, 5, "Steady state")["values"] == [{"x": 2.0, "x2": 5.0}]
+
+
+def test_single_axis_chart():
+    spec = charts.chart([
+        charts.scatter([1, 2], [3, 4], "VO2"),
+        charts.rule(1.5, "Threshold"),
+        charts.band(1, 2, "Window"),
+    ], "Time (minutes)", "VO2 (mL/min)")
+
+    scatter, rule, band = spec["layer"]
+    assert spec["height"] == charts.CHART_HEIGHT and "resolve" not in spec
+    assert scatter["encoding"]["y"]["title"] == "VO2 (mL/min)" and scatter["params"][0]["bind"] == "scales"
+    assert "y" not in rule["encoding"] and "params" not in rule
+    assert band["encoding"]["x2"] == {"field": "x2"} and "y" not in band["encoding"]
+    # One legend entry per label, in layer order, with the layers' colors
+    assert scatter["encoding"]["color"]["scale"] == {"domain": ["VO2", "Threshold", "Window"],
+                                                     "range": ["#1f77b4", "blue", "green"]}
+    assert scatter["transform"] == [{"calculate": '"VO2"', "as": "series"}]
+
+
+def test_right_axis_layers_get_an_independent_scale():
+    spec = charts.chart([
+        charts.scatter([1, 2], [3, 4], "Fat Ox"),
+        charts.scatter([1, 2], [5, 6], "CHO Ox", "tab:orange", axis="right"),
+    ], "Time (minutes)", "Fat (g/min)", "CHO (g/min)")
+
+    left, right = spec["layer"]
+    assert spec["resolve"] == {"scale": {"y": "independent"}}
+    assert left["layer"][0]["encoding"]["y"]["title"] == "Fat (g/min)"
+    assert right["layer"][0]["encoding"]["y"]["title"] == "CHO (g/min)"
+
+
+def test_pie():
+    spec = charts.pie(["Fat", "CHO"], [61.24, 38.76], ["tab:green", "tab:red"], ["61%", "39%"])
+    assert spec["data"]["values"] == [{"label": "Fat", "value": 61.2, "text": "61%"},
+                                      {"label": "CHO", "value": 38.8, "text": "39%"}]
+    assert spec["encoding"]["color"]["scale"]["range"] == ["#2ca02c", "#d62728"]
+
+
+@pytest.mark.parametrize("test_type", SAMPLES)
+def test_charts_match_the_pdf_plots(test_type):
+    test_class, parser, path = SAMPLES[test_type]
+    engine = "xlrd" if path.lower().endswith(".xls") else "openpyxl"
+    parsed = parser(pd.read_excel(os.path.join(DATA_DIR, path), header=None, engine=engine)).parse()
+    document = {"_id": ObjectId(), "user_id": ObjectId(), "test_type": test_type,
+                "Upload Date": pd.Timestamp("2025-03-01").to_pydatetime(), f"{test_type} Report Info": parsed}
+
+    test = test_class(connect=False)
+    test.activity_level = "moderate"  # RMR TDEE charts; set by the builder
+    assert test.parse_test(document) is not None
+    plots = test.get_plot_functions()
+    chart_functions = test.get_chart_functions()
+    assert [title for title, _ in chart_functions] == [title for title, _ in plots]
+    for title, chart_function in chart_functions:
+        spec = chart_function(test.df)
+        json.dumps(spec, allow_nan=False)  # what the browser receives
+        assert spec["height"] == charts.CHART_HEIGHT, title
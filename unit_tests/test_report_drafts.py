@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+from itertools import count
+
+import pytest
+import streamlit as st
+
+from utils import report_drafts
+from utils.report_drafts import ReportDraft, ensure_report_indexes
+
+TITLES = ["V-Slope", "VO2 Over Time"]
+
+
+@pytest.fixture
+def reports_col(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    # One millisecond per save, so two saves never share a last_updated value
+    ticks = count(1)
+    monkeypatch.setattr(report_drafts, "_mongo_now", lambda: datetime(2025, 3, 1) + timedelta(milliseconds=next(ticks)))
+    st.session_state.clear()
+    ensure_report_indexes.clear()  # the unique index is created once per process, not per collection
+    yield mongomock.MongoClient().db.reports
+    st.session_state.clear()
+
+
+def _draft(reports_col, debounce_seconds=0):
+    return ReportDraft(reports_col, "u1", "t1", "VO2Max", {"Year": 2025}, TITLES, debounce_seconds=debounce_seconds)
+
+
+def _in_other_session(edit):
+    """Run `edit` with a fresh session state (another tech), then restore this session's."""
+    mine = dict(st.session_state)
+    st.session_state.clear()
+    edit()
+    st.session_state.clear()
+    st.session_state.update(mine)
+
+
+def test_first_save_creates_the_report_then_only_dirty_fields_are_sent(reports_col):
+    draft = _draft(reports_col)
+    draft.mark_summary("Good test")
+    assert draft.flush(immediate=True)
+    saved = reports_col.find_one()
+    assert [plot["title"] for plot in saved["plots"]] == TITLES and saved["summary"] == "Good test"
+
+    draft.mark_plot(1, "VO2 Over Time", "Plateau at 12 min", False)
+    assert draft.flush(immediate=True)
+    plots = reports_col.find_one()["plots"]
+    assert plots[0]["comment"] == "" and plots[1] == {"index": 1, "title": "VO2 Over Time",
+                                                      "comment": "Plateau at 12 min", "include": False}
+    assert draft.state["status"] == "saved" and not draft.is_dirty
+
+
+def test_edits_wait_for_the_debounce(reports_col):
+    draft = _draft(reports_col, debounce_seconds=60)
+    draft.mark_summary("typing")
+    assert not draft.flush()
+    assert reports_col.count_documents({}) == 0 and draft.state["status"] == "dirty"
+    assert draft.flush(immediate=True)
+
+
+def test_concurrent_save_is_a_conflict_not_an_overwrite(reports_col):
+    draft = _draft(reports_col)
+    draft.mark_summary("Mine, first version")
+    assert draft.flush(immediate=True)
+
+    def other_tech_saves():
+        other = _draft(reports_col)
+        other.mark_summary("Theirs")
+        assert other.flush(immediate=True)
+    _in_other_session(other_tech_saves)
+
+    draft.mark_summary("Mine, second version")
+    assert not draft.flush(immediate=True)
+    assert draft.state["status"] == "conflict" and draft.is_dirty
+    assert reports_col.find_one()["summary"] == "Theirs"
+
+    # Stays in conflict until the tech decides
+    draft.mark_summary("Mine, third version")
+    assert not draft.flush(immediate=True)
+    assert draft.flush(immediate=True, overwrite=True)
+    assert reports_col.find_one()["summary"] == "Mine, third version"
+    assert draft.state["status"] == "saved"
+
+
+def test_concurrent_create_is_a_conflict(reports_col):
+    draft = _draft(reports_col)
+
+    def other_tech_creates():
+        other = _draft(reports_col)
+        other.mark_summary("Theirs")
+        assert other.flush(immediate=True)
+    _in_other_session(other_tech_creates)
+
+    draft.mark_summary("Mine")
+    assert not draft.flush(immediate=True)
+    assert draft.state["status"] == "conflict"
+    assert reports_col.count_documents({}) == 1 and reports_col.find_one()["summary"] == "Theirs"
+
+
+def test_discard_adopts_the_saved_version(reports_col):
+    draft = _draft(reports_col)
+    draft.mark_summary("Mine")
+    assert draft.flush(immediate=True)
+    _in_other_session(lambda: reports_col.update_one({}, {"$set": {"last_updated": reports_col.find_one()["last_updated"]
+                                                                    .replace(year=2030)}}))
+    draft.mark_summary("Mine again")
+    assert not draft.flush(immediate=True)
+
+    draft.discard()
+    assert draft.state["status"] == "saved" and not draft.is_dirty
+    draft.mark_summary("After reload")
+    assert draft.flush(immediate=True)
+    assert reports_col.find_one()["summary"] == "After reload"
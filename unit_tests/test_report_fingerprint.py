@@ -0,0 +1,114 @@
+from datetime import datetime
+
+import pytest
+
+from utils.report_fingerprint import report_fingerprint, current_pdf, uploaded_etag, record_pdf, TEMPLATE_VERSIONS
+
+TITLES = ["V-Slope", "VO2 Over Time"]
+
+
+def _document(test_type="VO2 Max", **fields):
+    return {"_id": "t1", "test_type": test_type, "version": datetime(2025, 3, 1), **fields}
+
+
+def _fingerprint(document=None, comments=None, flags=None, summary="Summary", activity_level="moderate"):
+    return report_fingerprint(document or _document(), TITLES, comments or {"V-Slope": "ok"}, flags or {},
+                              summary, activity_level)
+
+
+def test_unchanged_when_only_unrelated_fields_change():
+    base = _fingerprint()
+    # Other document fields (cached by version), comments of other tests' plots, builder defaults
+    assert _fingerprint(_document(**{"Upload Date": datetime(2024, 1, 1), "Quality Report": {}})) == base
+    assert _fingerprint(comments={"V-Slope": "ok", "REE": "other test"}) == base
+    assert _fingerprint(comments={"V-Slope": "ok", "VO2 Over Time": ""}) == base
+    assert _fingerprint(flags={"V-Slope": True, "VO2 Over Time": 1}) == base
+    # Activity level only matters for RMR
+    assert _fingerprint(activity_level="very active") == base
+
+
+@pytest.mark.parametrize("change", [
+    {"comments": {"V-Slope": "changed"}},
+    {"flags": {"VO2 Over Time": False}},
+    {"summary": "Other summary"},
+    {"document": _document(version=datetime(2025, 3, 2))},
+    {"document": {**_document(), "_id": "t2"}},
+])
+def test_changes_with_the_report_content(change):
+    assert _fingerprint(**change) != _fingerprint()
+
+
+def test_rmr_activity_level_and_template_version(monkeypatch):
+    rmr = _document("RMR")
+    assert _fingerprint(rmr, activity_level="light") != _fingerprint(rmr, activity_level="active")
+    base = _fingerprint()
+    monkeypatch.setitem(TEMPLATE_VERSIONS, "VO2 Max", TEMPLATE_VERSIONS["VO2 Max"] + 1)
+    assert _fingerprint() != base
+
+
+@pytest.fixture
+def s3():
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="bucket")
+        yield client
+
+
+def test_current_pdf(s3):
+    s3.put_object(Bucket="bucket", Key="reports/a.pdf", Body=b"%PDF-1")
+    pdf = {"fingerprint": "f1", "s3_key": "reports/a.pdf", "etag": uploaded_etag(s3, "reports/a.pdf", "bucket")}
+
+    assert current_pdf(s3, {"pdf": pdf}, "f1", "bucket") == "reports/a.pdf"
+    assert current_pdf(s3, {"pdf": pdf}, "f2", "bucket") is None
+    assert current_pdf(s3, {}, "f1", "bucket") is None
+    assert current_pdf(s3, None, "f1", "bucket") is None
+
+    # Replaced by another report with the same file name
+    s3.put_object(Bucket="bucket", Key="reports/a.pdf", Body=b"%PDF-2")
+    assert current_pdf(s3, {"pdf": pdf}, "f1", "bucket") is None
+
+    s3.delete_object(Bucket="bucket", Key="reports/a.pdf")
+    assert current_pdf(s3, {"pdf": {**pdf, "etag": None}}, "f1", "bucket") is None
+
+
+def test_record_pdf_upserts_without_touching_last_updated():
+    mongomock = pytest.importorskip("mongomock")
+    reports_col = mongomock.MongoClient().db.reports
+    saved_at = datetime(2025, 3, 1)
+    reports_col.insert_one({"user_id": "u1", "test_id": "t1", "test_type": "VO2Max", "last_updated": saved_at})
+
+    record_pdf(reports_col, "u1", "t1", "f1", "reports/a.pdf", '"e1"', test_type="RMR", test_date={"Year": 2025})
+    record_pdf(reports_col, "u2", "t2", "f2", "reports/b.pdf", '"e2"', "previews/b.png",
+               test_type="RMR", test_date={"Year": 2025})
+
+    saved = reports_col.find_one({"test_id": "t1"})
+    assert saved["last_updated"] == saved_at and saved["test_type"] == "VO2Max"
+    assert saved["pdf"]["fingerprint"] == "f1"
+
+    created = reports_col.find_one({"test_id": "t2"})
+    assert "last_updated" not in created
+    assert created["test_type"] == "RMR" and created["pdf"]["thumbnail_key"] == "previews/b.png"
+    assert reports_col.count_documents({}) == 2
+
+
+def test_draft_on_a_pdf_only_report_writes_the_full_report():
+    mongomock = pytest.importorskip("mongomock")
+    import streamlit as st
+    from utils.report_drafts import ReportDraft, ensure_report_indexes
+
+    reports_col = mongomock.MongoClient().db.reports
+    record_pdf(reports_col, "u1", "t1", "f1", "reports/a.pdf", '"e1"', test_type="VO2Max", test_date={"Year": 2025})
+    st.session_state.clear()
+    ensure_report_indexes.clear()
+    try:
+        draft = ReportDraft(reports_col, "u1", "t1", "VO2Max", {"Year": 2025}, TITLES, debounce_seconds=0)
+        draft.mark_summary("First save")
+        assert draft.flush(immediate=True)
+    finally:
+        st.session_state.clear()
+
+    saved = reports_col.find_one()
+    assert [plot["title"] for plot in saved["plots"]] == TITLES
+    assert saved["summary"] == "First save" and saved["pdf"]["fingerprint"] == "f1"
@@ -0,0 +1,64 @@
+import io
+
+import pytest
+from PIL import Image
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from utils import report_thumbnails
+from utils.report_thumbnails import thumbnail_key, render_thumbnail, store_thumbnail
+
+BUCKET = "bucket"
+
+
+@pytest.fixture
+def pdf_bytes():
+    buf = io.BytesIO()
+    pdf = canvas.Canvas(buf, pagesize=letter)
+    pdf.drawString(72, 720, "VO2 Max Report")
+    pdf.showPage()
+    pdf.save()
+    return buf.getvalue()
+
+
+@pytest.fixture
+def s3():
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_thumbnail_key_sits_next_to_the_pdf():
+    assert thumbnail_key("reports/Jane_VO2.pdf") == "reports/Jane_VO2.thumb.png"
+    assert thumbnail_key("reports/Jane_VO2.PDF") == "reports/Jane_VO2.thumb.png"
+    assert thumbnail_key("reports/untitled") == "reports/untitled.thumb.png"
+
+
+def test_render_first_page(pdf_bytes):
+    pytest.importorskip("pypdfium2")
+    image = Image.open(io.BytesIO(render_thumbnail(pdf_bytes, width=160)))
+    assert image.format == "PNG" and image.width == 160 and abs(image.height - 160 * 11 / 8.5) < 1
+    assert render_thumbnail(b"not a pdf") is None
+
+
+def test_render_without_pypdfium2(pdf_bytes, monkeypatch):
+    monkeypatch.setattr(report_thumbnails, "pdfium", None)
+    assert render_thumbnail(pdf_bytes) is None
+
+
+def test_store_uploads_given_or_rendered_preview(s3, pdf_bytes, monkeypatch):
+    key = store_thumbnail(s3, pdf_bytes, "reports/a.pdf", thumbnail=b"png", bucket_name=BUCKET)
+    assert key == "reports/a.thumb.png"
+    stored = s3.get_object(Bucket=BUCKET, Key=key)
+    assert stored["Body"].read() == b"png" and stored["ContentType"] == "image/png"
+
+    # Nothing to upload without a renderer
+    monkeypatch.setattr(report_thumbnails, "pdfium", None)
+    assert store_thumbnail(s3, pdf_bytes, "reports/b.pdf", bucket_name=BUCKET) is None
+
+
+def test_failed_upload_is_not_recorded(s3, pdf_bytes):
+    assert store_thumbnail(s3, pdf_bytes, "reports/a.pdf", thumbnail=b"png", bucket_name="missing-bucket") is None
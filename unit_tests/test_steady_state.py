@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from analysis.steady_state import find_steady_state, rmr_results, weir_kcal_per_day, STEADY_STATE_MINUTES
+
+TIME = np.arange(0.5, 30.01, 0.5)  # 30 min, one row per 30 s
+
+
+def test_weir_known_value():
+    # (3.941 * 250 + 1.106 * 200) / 1000 * 1440
+    assert weir_kcal_per_day(250, 200) == pytest.approx(1737.288)
+
+
+def test_constant_test_is_steady_from_the_first_allowed_window():
+    window = find_steady_state(TIME, np.full_like(TIME, 250.0), np.full_like(TIME, 200.0))
+    assert window["start"] == 5.0
+    assert window["end"] - window["start"] == pytest.approx(STEADY_STATE_MINUTES - 0.5)
+    assert window["rows"] == 10
+    assert window["vo2"] == pytest.approx(250.0)
+    assert window["cv_vo2"] == pytest.approx(0.0)
+
+
+def test_picks_the_steadiest_window():
+    vo2 = np.where(TIME < 15, 250 + 40 * (-1) ** np.arange(len(TIME)), 230.0)
+    window = find_steady_state(TIME, vo2, vo2 * 0.8)
+    assert window["start"] >= 15
+    assert window["vo2"] == pytest.approx(230.0)
+
+
+def test_nans_are_skipped():
+    vo2 = np.full_like(TIME, 250.0)
+    vco2 = np.full_like(TIME, 200.0)
+    vo2[[12, 20]] = np.nan
+    vco2[30] = np.nan
+    results = rmr_results(TIME, vo2, vco2)
+    assert results["Avg RMR"] == 1737
+    assert results["RQ"] == 0.8
+
+
+def test_short_test_has_no_window_and_no_fallback_rows():
+    time = np.arange(0.5, 4.01, 0.5)
+    assert find_steady_state(time, np.full_like(time, 250.0), np.full_like(time, 200.0)) is None
+    assert rmr_results(time, np.full_like(time, 250.0), np.full_like(time, 200.0)) == \
+        {"Avg RMR": 0.0, "RQ": 0.0, "Steady State": None}
+
+
+def test_unsteady_test_falls_back_to_rows_after_ten_minutes():
+    vo2 = 250 + 100 * (-1) ** np.arange(len(TIME))  # CV ~40%
+    results = rmr_results(TIME, vo2, np.full_like(TIME, 200.0))
+    after = TIME >= 10
+    assert results["Steady State"]["Start"] == 10.0
+    assert results["Steady State"]["CV VO2"] is None
+    assert results["Avg RMR"] == round(weir_kcal_per_day(vo2[after].mean(), 200.0))
@@ -0,0 +1,94 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from utils import storage
+from utils.storage import upload_bytes, upload_path, download_bytes, upload_many, download_many, transfer_summary
+
+BUCKET = "bucket"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setattr(storage, "RETRY_BASE_DELAY", 0.001)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1", config=storage.CLIENT_CONFIG)
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_round_trip(s3):
+    upload = upload_bytes(s3, b"%PDF-report", "reports/a.pdf", bucket_name=BUCKET)
+    assert upload["error"] is None and upload["attempts"] == 1 and upload["bytes"] == 11
+    head = s3.head_object(Bucket=BUCKET, Key="reports/a.pdf")
+    assert head["ContentType"] == "application/pdf" and head["ContentDisposition"] == "inline"
+
+    download = download_bytes(s3, "reports/a.pdf", bucket_name=BUCKET)
+    assert download["error"] is None and download["value"] == b"%PDF-report" and download["bytes"] == 11
+
+
+def test_upload_path_and_multipart(s3, tmp_path):
+    data = bytes(range(256)) * (9 * 1024 * 1024 // 256)  # above the 8 MB multipart threshold
+    path = tmp_path / "big.pdf"
+    path.write_bytes(data)
+    assert upload_path(s3, str(path), "reports/big.pdf", bucket_name=BUCKET)["error"] is None
+    assert download_bytes(s3, "reports/big.pdf", bucket_name=BUCKET)["value"] == data
+
+
+def test_missing_key_is_not_retried(s3):
+    download = download_bytes(s3, "reports/missing.pdf", bucket_name=BUCKET)
+    assert download["value"] is None and download["attempts"] == 1
+    assert "404" in download["error"] or "Not Found" in download["error"]
+
+
+class _FlakyClient:
+    """Fails the first `failures` uploads with `error`, then succeeds."""
+
+    def __init__(self, failures, error):
+        self.failures, self.error, self.calls = failures, error, 0
+
+    def upload_fileobj(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+
+
+def _client_error(status, code):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+
+
+@pytest.mark.parametrize("error", [ConnectionError("reset"), _client_error(503, "SlowDown")])
+def test_transient_errors_are_retried(monkeypatch, error):
+    monkeypatch.setattr(storage, "RETRY_BASE_DELAY", 0.001)
+    client = _FlakyClient(2, error)
+    upload = upload_bytes(client, b"x", "reports/a.pdf")
+    assert upload["error"] is None and upload["attempts"] == client.calls == 3
+
+
+def test_retries_stop_after_retry_attempts(monkeypatch):
+    monkeypatch.setattr(storage, "RETRY_BASE_DELAY", 0.001)
+    client = _FlakyClient(10, ConnectionError("reset"))
+    upload = upload_bytes(client, b"x", "reports/a.pdf")
+    assert upload["error"] == "ConnectionError: reset"
+    assert upload["attempts"] == client.calls == storage.RETRY_ATTEMPTS
+
+
+def test_access_denied_is_not_retried():
+    client = _FlakyClient(10, _client_error(403, "AccessDenied"))
+    assert upload_bytes(client, b"x", "reports/a.pdf")["attempts"] == client.calls == 1
+
+
+def test_batches_keep_input_order(s3):
+    items = [(f"reports/{i}.pdf", f"pdf {i}".encode()) for i in range(12)]
+    assert all(record["error"] is None for record in upload_many(s3, items, bucket_name=BUCKET))
+
+    keys = [key for key, _ in reversed(items)] + ["reports/missing.pdf"]
+    downloads = download_many(s3, keys, bucket_name=BUCKET)
+    assert [record["key"] for record in downloads] == keys
+    assert [record["value"] for record in downloads[:-1]] == [data for _, data in reversed(items)]
+    assert downloads[-1]["error"] is not None
+
+    summary = transfer_summary(upload_many(s3, items[:2], bucket_name=BUCKET) + downloads)
+    assert summary["upload"]["count"] == 2
+    assert summary["download"]["count"] == 13 and summary["download"]["failed"] == 1
@@ -0,0 +1,94 @@
+import pytest
+
+from ingest.validation import validate_test
+
+CLIENT = {"Sex": "F", "Age": 34}
+
+
+def _rows(n=20, **overrides):
+    """n plausible VO2 Max rows; overrides map a column to a function of the row index."""
+    rows = []
+    for i in range(n):
+        row = {"Time": i * 15, "VO2 STPD": 1.0 + i * 0.1, "VCO2 STPD": 0.9 + i * 0.1, "RER": 0.9, "HR": 90 + i}
+        row.update({col: value(i) for col, value in overrides.items()})
+        rows.append(row)
+    return rows
+
+
+def _validate(rows=None, client=CLIENT, test_type="VO2 Max"):
+    return validate_test({"Client Info": client, "Tabular Data": _rows() if rows is None else rows}, test_type)
+
+
+def test_clean_export_is_ok():
+    report = _validate()
+    assert report["status"] == "ok" and not report["errors"] and not report["warnings"]
+    assert report["rows"] == 20 and report["columns"]["VO2 STPD"]["out_of_range"] == 0
+
+
+@pytest.mark.parametrize("client", [
+    {"Sex": "X", "Age": 34},
+    {"Sex": "", "Age": 34},
+    {"Sex": "Female", "Age": 3},
+    {"Sex": "M", "Age": 140},
+    {"Sex": "M", "Age": "unknown"},
+    {"Sex": "M"},
+])
+def test_rejects_implausible_client_info(client):
+    report = _validate(client=client)
+    assert report["status"] == "rejected" and len(report["errors"]) == 1
+
+
+def test_rejects_missing_tabular_data():
+    report = _validate(rows=[])
+    assert report["status"] == "rejected" and report["errors"] == ["No tabular data found"]
+
+
+def test_rejects_missing_required_columns():
+    rows = [{k: v for k, v in row.items() if k != "RER"} for row in _rows()]
+    report = _validate(rows=rows)
+    assert report["status"] == "rejected" and report["errors"] == ["Missing columns: RER"]
+    # RMR needs RQ instead of RER
+    assert "Missing columns: RQ" in _validate(test_type="RMR")["errors"]
+
+
+def test_rejects_time_going_backwards():
+    report = _validate(rows=_rows(Time=lambda i: 0 if i == 10 else i * 15))
+    assert report["status"] == "rejected" and report["time_reversals"] == 1
+
+
+def test_rejects_any_missing_time():
+    report = _validate(rows=_rows(Time=lambda i: "" if i == 3 else i * 15))
+    assert report["status"] == "rejected"
+    assert report["errors"] == ["Time: 1 of 20 values missing (1 non-numeric)"]
+
+
+def test_missing_required_values_reject_only_above_half():
+    few = _validate(rows=_rows(RER=lambda i: None if i < 10 else 0.9))
+    assert few["status"] == "warning" and few["warnings"] == ["RER: 10 of 20 values missing"]
+
+    most = _validate(rows=_rows(RER=lambda i: None if i < 11 else 0.9))
+    assert most["status"] == "rejected" and most["errors"] == ["RER: 11 of 20 values missing"]
+
+
+def test_out_of_range_values_reject_only_above_a_quarter():
+    # mL/min values in an export read as L/min
+    few = _validate(rows=_rows(**{"VO2 STPD": lambda i: 1200 if i < 5 else 1.5}))
+    assert few["status"] == "warning" and few["warnings"] == ["VO2 STPD: 5 of 20 values outside 0.05-7.0"]
+
+    most = _validate(rows=_rows(**{"VO2 STPD": lambda i: 1200 if i < 6 else 1.5}))
+    assert most["status"] == "rejected" and most["errors"] == ["VO2 STPD: 6 of 20 values outside 0.05-7.0"]
+
+
+def test_optional_columns_only_warn():
+    no_strap = _validate(rows=_rows(HR=lambda i: 0))
+    assert no_strap["status"] == "warning" and no_strap["warnings"] == ["HR: no readings"]
+
+    gaps = _validate(rows=_rows(HR=lambda i: None if i % 2 else 120))
+    assert gaps["status"] == "warning" and gaps["warnings"] == ["HR: 10 of 20 values missing"]
+
+
+def test_duplicated_row_is_counted_and_its_repeated_time_rejected():
+    rows = _rows()
+    report = _validate(rows=rows + rows[-1:])
+    assert report["duplicate_rows"] == 1 and "1 duplicated row(s)" in report["warnings"]
+    assert report["status"] == "rejected" and report["time_reversals"] == 1